@@ -0,0 +1,11 @@
+"""
+softTweakStack deformer plugin
+
+Entry point found by Maya on the plug-ins folder of the module, so the
+softTweakStack deformer plugin is loaded by name.
+The node is implemented in mgear.animbits.softTweakStackNode
+"""
+
+from mgear.animbits.softTweakStackNode import maya_useNewAPI  # noqa: F401
+from mgear.animbits.softTweakStackNode import initializePlugin  # noqa: F401
+from mgear.animbits.softTweakStackNode import uninitializePlugin  # noqa: F401
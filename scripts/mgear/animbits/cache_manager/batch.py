@@ -0,0 +1,380 @@
+
+""" Cache manager headless entry point
+
+Generates the GPU caches of the rigs in Maya scenes without any user
+interface, so shots can be cached from mayapy or on the render farm::
+
+    mayapy -m mgear.animbits.cache_manager.batch shot_010.ma shot_020.ma
+        --filter "*:crowd*" --start 1001 --end 1100 --profile crowd
+        --jobs 2 --report report.json
+
+Every scene gets opened on its own, in parallel processes when the jobs
+option is bigger than one. A json report with the per rig timings and output
+sizes is written for all the scenes.
+"""
+
+# imports
+from __future__ import absolute_import
+import argparse
+import fnmatch
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def __initialize_maya():
+    """ Initializes a standalone Maya session if not running inside Maya
+    """
+
+    try:
+        from maya import cmds
+        cmds.about(version=True)
+    except AttributeError:
+        import maya.standalone
+        maya.standalone.initialize(name="python")
+
+
+def __get_file_sizes(gpu_node):
+    """ Returns the cache files and sizes of a cache and its LOD caches
+
+    Args:
+        gpu_node (str): the main gpu cache node of a rig
+
+    Returns:
+        list: dictionaries with the path and size of each file
+    """
+
+    from maya import cmds
+    from mgear.animbits.cache_manager.mayautils import get_cache_publish_path
+
+    transform = cmds.listRelatives(gpu_node, parent=True, fullPath=True)
+    nodes = cmds.listRelatives(transform, shapes=True, fullPath=True,
+                               type="gpuCache") or []
+
+    files = []
+    for node in nodes:
+        path = get_cache_publish_path(node)
+        if cmds.objExists("{}.cache_file_size".format(node)):
+            size = int(cmds.getAttr("{}.cache_file_size".format(node)))
+        else:
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+        files.append({"path": path, "size": size})
+
+    return files
+
+
+def cache_rig(rig_node, start, end, profile=None, simulation_rate=None,
+              sample_multiplier=None, evaluation=None):
+    """ Generates the GPU cache of a rig and reports the time spent
+
+    Args:
+        rig_node (str): Rig root node to cache
+        start (float): start frame to use
+        end (float): end frame to use
+        profile (str or None): write profile name. None uses the profile
+                               matching the rig
+        simulation_rate (float or None): frames between evaluated samples
+        sample_multiplier (int or None): write a sample every given number
+                                         of evaluated samples
+        evaluation (str or None): rig evaluation mode, scene, parallel or
+                                  cached_playback
+
+    Returns:
+        dict: rig report
+    """
+
+    from maya import cmds
+    from mgear.animbits.cache_manager.query import (
+        find_model_group_inside_rig,
+        get_model_group)
+    from mgear.animbits.cache_manager.mayautils import generate_gpu_cache
+    from mgear.animbits.cache_manager.metrics import get_session_metrics
+
+    report = {"rig": rig_node,
+              "status": "failed",
+              "error": None,
+              "model_group": None,
+              "timings": {},
+              "files": []}
+
+    try:
+        start_time = time.time()
+        model_group = find_model_group_inside_rig(get_model_group(True),
+                                                  rig_node)
+        report["timings"]["find_model_group"] = time.time() - start_time
+        report["model_group"] = model_group
+
+        if not model_group:
+            report["error"] = "Model group not found"
+            return report
+
+        start_time = time.time()
+        gpu_node = generate_gpu_cache(model_group, rig_node, start, end,
+                                      rig_node, True, profile,
+                                      simulation_rate, sample_multiplier,
+                                      evaluation=evaluation)
+        seconds = time.time() - start_time
+        report["timings"]["generate_gpu_cache"] = seconds
+        report["frames_per_second"] = (end - start + 1) / max(seconds, 1e-6)
+        report["evaluation"] = cmds.getAttr("{}.cache_evaluation"
+                                            .format(gpu_node))
+        report["frame_seconds"] = float(cmds.getAttr(
+            "{}.cache_frame_seconds".format(gpu_node)))
+        report["files"] = __get_file_sizes(gpu_node)
+        report["status"] = "done"
+
+    except Exception as e:
+        report["error"] = "{} - {}".format(type(e).__name__, e)
+
+    report["metrics"] = get_session_metrics(rig_node)
+    return report
+
+
+def cache_scene(scene_path, rigs=None, rig_filter=None, start=None,
+                end=None, profile=None, simulation_rate=None,
+                sample_multiplier=None, evaluation=None, save_path=None,
+                unload_method=None):
+    """ Opens a scene and generates the GPU caches of its rigs
+
+    When the scene is saved, the rigs cached without errors are hidden or
+    unloaded first so the saved scene uses their caches. Failed rigs are
+    left untouched.
+
+    Args:
+        scene_path (str): Maya scene to open
+        rigs (list or None): rig names to cache. None caches all the rigs
+        rig_filter (str or None): wildcard pattern the rig names must match
+        start (float or None): start frame. None uses the playback range
+        end (float or None): end frame. None uses the playback range
+        profile (str or None): write profile name. None uses the profile
+                               matching each rig
+        simulation_rate (float or None): frames between evaluated samples
+        sample_multiplier (int or None): write a sample every given number
+                                         of evaluated samples
+        evaluation (str or None): rig evaluation mode, scene, parallel or
+                                  cached_playback
+        save_path (str or None): saves the scene using the caches to this
+                                 path. Nothing is saved if None
+        unload_method (int or None): 0=hide, 1=unload the cached rigs
+                                     before saving. None uses the cache
+                                     manager preference
+
+    Returns:
+        dict: scene report
+    """
+
+    __initialize_maya()
+
+    from maya import cmds
+    from mgear.animbits.cache_manager.query import (
+        get_scene_rigs,
+        get_timeline_values,
+        is_rig)
+    from mgear.animbits.cache_manager.local_cache import wait_for_publishes
+    from mgear.animbits.cache_manager.mayautils import (
+        check_gpu_plugin,
+        unload_rigs)
+    from mgear.animbits.cache_manager.metrics import clear_session_metrics
+    from mgear.animbits.cache_manager.query import read_preference_key
+
+    # rigs with the same name on previous scenes don't share their records
+    clear_session_metrics()
+
+    scene_start = time.time()
+    check_gpu_plugin()
+    cmds.file(scene_path, open=True, force=True)
+
+    timeline_start, timeline_end = get_timeline_values()
+    start = timeline_start if start is None else start
+    end = timeline_end if end is None else end
+
+    # filters the scene rigs
+    scene_rigs = [x for x in get_scene_rigs() or [] if is_rig(x)]
+    if rigs:
+        scene_rigs = [x for x in scene_rigs if x in rigs]
+    if rig_filter:
+        scene_rigs = [x for x in scene_rigs
+                      if fnmatch.fnmatchcase(x, rig_filter)]
+
+    report = {"scene": scene_path,
+              "start": start,
+              "end": end,
+              "profile": profile,
+              "simulation_rate": simulation_rate,
+              "sample_multiplier": sample_multiplier,
+              "evaluation": evaluation,
+              "rigs": []}
+
+    for rig_node in scene_rigs:
+        rig_report = cache_rig(rig_node, start, end, profile,
+                               simulation_rate, sample_multiplier, evaluation)
+        report["rigs"].append(rig_report)
+        print("{} {} in {:.2f}s".format(
+            rig_report["status"], rig_node,
+            sum(rig_report["timings"].values())))
+
+    # the published files have to be complete before leaving
+    wait_for_publishes()
+
+    if save_path:
+        # the saved scene uses the caches instead of the rigs
+        if unload_method is None:
+            unload_method = read_preference_key("cache_manager_unload_rigs")
+        if unload_method not in (0, 1):
+            unload_method = 1
+        cached = [x["rig"] for x in report["rigs"] if x["status"] == "done"]
+        report["unload"] = {"method": unload_method,
+                            "rigs": cached,
+                            "error": None}
+        if cached:
+            try:
+                unload_rigs(cached, unload_method)
+            except Exception as e:
+                report["unload"]["error"] = "{} - {}".format(
+                    type(e).__name__, e)
+
+        cmds.file(rename=save_path)
+        cmds.file(save=True, force=True)
+        report["saved_scene"] = save_path
+
+    report["total_time"] = time.time() - scene_start
+    return report
+
+
+def __run_scene_process(scene_path, argv):
+    """ Starts a process caching a single scene
+
+    Args:
+        scene_path (str): Maya scene to cache
+        argv (list): command line options shared by all the scenes
+
+    Returns:
+        tuple: the process and its report file
+    """
+
+    handle, report_path = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+
+    # __name__ is __main__ when running with -m
+    command = [sys.executable, "-m", "mgear.animbits.cache_manager.batch",
+               scene_path, "--report", report_path] + argv
+    return subprocess.Popen(command), report_path
+
+
+def __parse_arguments(argv):
+    """ Parses the command line arguments
+
+    Args:
+        argv (list or None): command line arguments
+
+    Returns:
+        tuple: parsed arguments and the options shared by all the scenes
+    """
+
+    parser = argparse.ArgumentParser(
+        description="mGear cache manager headless GPU cache generation")
+    parser.add_argument("scenes", nargs="+", help="Maya scenes to cache")
+    parser.add_argument("--rigs", nargs="+", help="rig names to cache")
+    parser.add_argument("--filter", help="wildcard pattern for rig names")
+    parser.add_argument("--start", type=float, help="start frame")
+    parser.add_argument("--end", type=float, help="end frame")
+    parser.add_argument("--profile", help="write profile name")
+    parser.add_argument("--rate", type=float, help="simulation rate")
+    parser.add_argument("--multiplier", type=int, help="sample multiplier")
+    parser.add_argument("--evaluation",
+                        choices=["scene", "parallel", "cached_playback"],
+                        help="rig evaluation mode while writing the caches")
+    parser.add_argument("--save-suffix",
+                        help="saves each scene next to the original one with "
+                             "this suffix added to its name")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of scenes cached in parallel")
+    parser.add_argument("--report", help="json report file. Printed if not "
+                                         "given")
+    args = parser.parse_args(argv)
+
+    # options forwarded to the scene processes
+    shared = []
+    for flag, value in (("--filter", args.filter),
+                        ("--start", args.start),
+                        ("--end", args.end),
+                        ("--profile", args.profile),
+                        ("--rate", args.rate),
+                        ("--multiplier", args.multiplier),
+                        ("--evaluation", args.evaluation),
+                        ("--save-suffix", args.save_suffix)):
+        if value is not None:
+            shared.extend([flag, str(value)])
+    if args.rigs:
+        shared.extend(["--rigs"] + args.rigs)
+
+    return args, shared
+
+
+def main(argv=None):
+    """ Command line entry point for the headless cache generation
+
+    Args:
+        argv (list or None): command line arguments
+
+    Returns:
+        int: exit code, 1 if any rig failed to cache or unload
+    """
+
+    args, shared = __parse_arguments(argv)
+    reports = []
+
+    # scenes cached in parallel processes
+    if args.jobs > 1 and len(args.scenes) > 1:
+        pending = list(args.scenes)
+        running = []
+        while pending or running:
+            while pending and len(running) < args.jobs:
+                running.append(__run_scene_process(pending.pop(0), shared))
+
+            process, report_path = running.pop(0)
+            process.wait()
+            try:
+                with open(report_path, "r") as file_r:
+                    reports.extend(json.load(file_r)["scenes"])
+            except (IOError, ValueError):
+                reports.append({"scene": None, "error": "Process failed with "
+                                "exit code {}".format(process.returncode)})
+            os.remove(report_path)
+
+    # scenes cached in this process
+    else:
+        for scene_path in args.scenes:
+            save_path = None
+            if args.save_suffix:
+                name, ext = os.path.splitext(scene_path)
+                save_path = "{}{}{}".format(name, args.save_suffix, ext)
+
+            try:
+                reports.append(cache_scene(
+                    scene_path, args.rigs, args.filter, args.start, args.end,
+                    args.profile, args.rate, args.multiplier,
+                    args.evaluation, save_path))
+            except Exception as e:
+                reports.append({"scene": scene_path,
+                                "error": "{} - {}".format(type(e).__name__,
+                                                          e)})
+
+    data = json.dumps({"scenes": reports}, indent=4, sort_keys=True)
+    if args.report:
+        with open(args.report, "w") as file_w:
+            file_w.write(data)
+    else:
+        print(data)
+
+    failed = [x for x in reports if x.get("error") or
+              (x.get("unload") or {}).get("error") or
+              [r for r in x.get("rigs", []) if r["status"] != "done"]]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
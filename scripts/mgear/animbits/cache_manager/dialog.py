@@ -11,26 +11,30 @@ from mgear.animbits.cache_manager.collapse_widget import QCollapse
 from mgear.animbits.cache_manager.query import (
     get_scene_rigs,
     get_model_group,
-    find_model_group_inside_rig,
     get_timeline_values,
     read_preference_key,
     get_cache_destination_path,
-    is_rig)
+    get_write_profiles)
 
 from mgear.animbits.cache_manager.mayautils import (
     kill_ui,
     install_script_job,
     kill_script_job,
-    generate_gpu_cache,
-    unload_rig,
     create_cache_manager_preference_file,
     set_preference_file_model_group,
     set_preference_file_unload_method,
     set_preference_file_cache_destination,
-    load_rig,
-    set_gpu_color_override,
-    check_gpu_plugin)
-from mgear.animbits.cache_manager.model import CacheManagerStringListModel
+    load_rigs,
+    check_gpu_plugin,
+    update_lod_cameras)
+from mgear.animbits.cache_manager.jobs import CacheJob, CacheJobQueue
+from mgear.animbits.cache_manager.metrics import export_session_metrics
+from mgear.animbits.cache_manager.model import (
+    CacheManagerSortFilterProxyModel,
+    CacheManagerStringListModel)
+from mgear.animbits.cache_manager.validation import (
+    install_validation_script_job,
+    validate_scene_caches)
 
 # UI WIDGET NAME
 UI_NAME = "mgear_cache_manager_qdialog"
@@ -67,6 +71,9 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         self.blue = QtGui.QColor(35, 140, 160)
         self.orange = QtGui.QColor(250, 180, 40)
 
+        # cache generation queue
+        self.job_queue = CacheJobQueue(self)
+
         # creates ui widgets
         self._create_widgets()
 
@@ -79,17 +86,63 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         # adds refresh callback
         install_script_job(self.refresh_model)
 
+        # adds scene opened cache validation
+        install_validation_script_job(self.validate_caches)
+
     def _apply_filter(self):
         """ Uses the line edit text to filter the view
         """
 
         self.proxy_model.setFilterRegExp(self.filter_line.text())
 
+    def _apply_key_filters(self):
+        """ Uses the namespace, asset type and state combos to filter the view
+        """
+
+        self.proxy_model.set_namespace_filter(
+            self.namespace_combo.currentData())
+        self.proxy_model.set_asset_type_filter(
+            self.asset_type_combo.currentData())
+        self.proxy_model.set_rig_state_filter(
+            self.state_combo.currentData())
+
+    def _fill_key_filters(self):
+        """ Fills the namespace and asset type combos with the model rigs
+
+        The current choices are kept when still available.
+        """
+
+        model = self.proxy_model.sourceModel()
+        indexes = [model.index(i, 0) for i in
+                   range(model.rowCount(QtCore.QModelIndex()))]
+
+        for combo, role, label in (
+                (self.namespace_combo, model.NamespaceRole,
+                 "All namespaces"),
+                (self.asset_type_combo, model.AssetTypeRole, "All assets")):
+            current = combo.currentData()
+            values = sorted(set(x.data(role) for x in indexes))
+
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItem(label, None)
+            for value in values:
+                combo.addItem(value or "(none)", value)
+            combo.setCurrentIndex(max(combo.findData(current), 0))
+            combo.blockSignals(False)
+
+        self._apply_key_filters()
+
     def _connect_signals(self):
         """ Connects widget signals to functionalities
         """
 
         self.filter_line.textChanged.connect(self._apply_filter)
+        self.namespace_combo.currentIndexChanged.connect(
+            self._apply_key_filters)
+        self.asset_type_combo.currentIndexChanged.connect(
+            self._apply_key_filters)
+        self.state_combo.currentIndexChanged.connect(self._apply_key_filters)
         self.model_group_button.clicked.connect(self.set_model_group)
         self.path_group_button.clicked.connect(self.set_cache_path)
         self.rig_unload_radial.clicked.connect(self.set_unload_method)
@@ -99,6 +152,13 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         self.color_button.clicked.connect(self._set_display_color)
         self.color_display_radial.clicked.connect(self._lock_unlock_color)
         self.keep_display_radial.clicked.connect(self._lock_unlock_color)
+        self.cancel_button.clicked.connect(self.job_queue.cancel)
+        self.job_queue.job_progress.connect(self._update_progress)
+        self.job_queue.job_finished.connect(self._job_finished)
+        self.job_queue.queue_finished.connect(self._queue_finished)
+        self.job_queue.eta_changed.connect(self._update_eta)
+        self.job_queue.logged.connect(self.log_text.appendPlainText)
+        self.metrics_button.clicked.connect(self.export_metrics)
 
     def _create_widgets(self):
         """ Creates the widget elements the user will interact with
@@ -164,6 +224,35 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         display_layout.addWidget(self.color_display_radial, 4, 2, 1, 1)
         display_layout.addWidget(self.color_button, 4, 3, 1, 1)
 
+        profile_label = QtWidgets.QLabel("Write profile:")
+        filter_help = ("GPU cache write profile. Auto uses the profile "
+                       "matching each rig on the preference file rules")
+        self.profile_combo = QtWidgets.QComboBox()
+        self.profile_combo.setObjectName("cache_manager_profile_qcombobox")
+        self.profile_combo.setToolTip(filter_help)
+        self.profile_combo.setWhatsThis(filter_help)
+
+        sampling_label = QtWidgets.QLabel("Sampling:")
+        filter_help = ("Frames between samples. Bigger than 1 for stepped "
+                       "caches, smaller than 1 for sub-frame samples")
+        self.rate_spin = QtWidgets.QDoubleSpinBox()
+        self.rate_spin.setObjectName("cache_manager_rate_qdoublespinbox")
+        self.rate_spin.setToolTip(filter_help)
+        self.rate_spin.setWhatsThis(filter_help)
+        self.rate_spin.setRange(0.0, 100.0)
+        self.rate_spin.setSingleStep(0.25)
+        self.rate_spin.setSpecialValueText("Profile rate")
+        self.rate_spin.setPrefix("Rate: ")
+        filter_help = "Writes a sample every given number of samples"
+        self.multiplier_spin = QtWidgets.QSpinBox()
+        self.multiplier_spin.setObjectName(
+            "cache_manager_multiplier_qspinbox")
+        self.multiplier_spin.setToolTip(filter_help)
+        self.multiplier_spin.setWhatsThis(filter_help)
+        self.multiplier_spin.setRange(0, 100)
+        self.multiplier_spin.setSpecialValueText("Profile multiplier")
+        self.multiplier_spin.setPrefix("Multiplier: ")
+
         # adds widgets to frame layout
         frame_layout.addWidget(label, 0, 0, 1, 1)
         frame_layout.addWidget(display_label, 1, 0, 1, 1)
@@ -176,6 +265,11 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         frame_layout.addWidget(self.path_group_line, 3, 1, 1, 2)
         frame_layout.addWidget(self.path_group_button, 3, 3, 1, 1)
         frame_layout.addWidget(display_frame, 4, 0, 1, 4)
+        frame_layout.addWidget(profile_label, 5, 0, 1, 1)
+        frame_layout.addWidget(self.profile_combo, 5, 1, 1, 3)
+        frame_layout.addWidget(sampling_label, 6, 0, 1, 1)
+        frame_layout.addWidget(self.rate_spin, 6, 1, 1, 1)
+        frame_layout.addWidget(self.multiplier_spin, 6, 2, 1, 1)
         options_widget.set_layout(frame_layout)
 
         # search & filter widgets ---------------------------------------------
@@ -197,6 +291,29 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         self.filter_line.setWhatsThis(filter_help)
         self.filter_line.setPlaceholderText("Type to filter assets")
 
+        # creates namespace, asset type and state filters
+        self.namespace_combo = QtWidgets.QComboBox()
+        self.namespace_combo.setObjectName(
+            "cache_manager_namespace_qcombobox")
+        self.namespace_combo.setToolTip("Shows the rigs of a namespace")
+        self.asset_type_combo = QtWidgets.QComboBox()
+        self.asset_type_combo.setObjectName(
+            "cache_manager_asset_type_qcombobox")
+        self.asset_type_combo.setToolTip("Shows the rigs referenced from an "
+                                         "asset file")
+        self.state_combo = QtWidgets.QComboBox()
+        self.state_combo.setObjectName("cache_manager_state_qcombobox")
+        self.state_combo.setToolTip("Shows the rigs, the caches or both")
+        self.state_combo.addItem("Rigs and caches", None)
+        self.state_combo.addItem("Rigs", True)
+        self.state_combo.addItem("Caches", False)
+
+        combo_layout = QtWidgets.QHBoxLayout()
+        combo_layout.setSpacing(4)
+        combo_layout.addWidget(self.namespace_combo)
+        combo_layout.addWidget(self.asset_type_combo)
+        combo_layout.addWidget(self.state_combo)
+
         # creates search list view
         self.rigs_list_view = QtWidgets.QListView()
         self.rigs_list_view.setObjectName("cache_manager_rigs_qlistview")
@@ -208,7 +325,8 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         # adds widgets to frame layout
         frame_layout.addWidget(label, 0, 0, 1, 1)
         frame_layout.addWidget(self.filter_line, 1, 0, 1, 1)
-        frame_layout.addWidget(self.rigs_list_view, 2, 0, 1, 1)
+        frame_layout.addLayout(combo_layout, 2, 0, 1, 1)
+        frame_layout.addWidget(self.rigs_list_view, 3, 0, 1, 1)
 
         # buttons widgets -----------------------------------------------------
         frame = QtWidgets.QFrame()
@@ -230,18 +348,56 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         self.rig_button.setObjectName("cache_manager_rig_qpushbutton")
         self.rig_button.setPalette(self.orange)
 
+        # creates progress widgets
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setObjectName("cache_manager_qprogressbar")
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        self.cancel_button.setObjectName("cache_manager_cancel_qpushbutton")
+        self.cancel_button.setToolTip("Cancels the queued caches")
+        self.cancel_button.setEnabled(False)
+
         # adds widgets to frame layout
-        frame_layout.addWidget(self.cache_button, 1, 0, 1, 1)
-        frame_layout.addWidget(self.rig_button, 2, 0, 1, 1)
+        frame_layout.addWidget(self.cache_button, 1, 0, 1, 2)
+        frame_layout.addWidget(self.rig_button, 2, 0, 1, 2)
+        frame_layout.addWidget(self.progress_bar, 3, 0, 1, 1)
+        frame_layout.addWidget(self.cancel_button, 3, 1, 1, 1)
+
+        # job log widgets -----------------------------------------------------
+        log_widget = QCollapse(title="Log:")
+        self.main_layout.addWidget(log_widget)
+
+        frame_layout = QtWidgets.QGridLayout()
+        frame_layout.setMargin(4)
+        frame_layout.setSpacing(4)
+
+        self.log_text = QtWidgets.QPlainTextEdit()
+        self.log_text.setObjectName("cache_manager_log_qplaintextedit")
+        self.log_text.setReadOnly(True)
+        self.log_text.setMinimumHeight(100)
+
+        # creates metrics export button
+        self.metrics_button = QtWidgets.QPushButton("Export Metrics")
+        self.metrics_button.setObjectName(
+            "cache_manager_metrics_qpushbutton")
+        self.metrics_button.setToolTip("Saves the timing, size and frame "
+                                       "rate of the session caches as json "
+                                       "or csv")
+
+        frame_layout.addWidget(self.log_text, 0, 0, 1, 1)
+        frame_layout.addWidget(self.metrics_button, 1, 0, 1, 1)
+        log_widget.set_layout(frame_layout)
 
     def _fill_widgets(self):
         """ Fills the content on the widgets
         """
 
         # sets unload method
-        if read_preference_key("cache_manager_unload_rigs") == 1:
+        unload_method = read_preference_key("cache_manager_unload_rigs")
+        if unload_method == 1:
             self.rig_unload_radial.setChecked(True)
-        elif read_preference_key("cache_manager_unload_rigs") == 0:
+        elif unload_method == 0:
             self.rig_hide_radial.setChecked(True)
 
         # fills model group name preference
@@ -252,18 +408,71 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         # fills gpu cache destination path
         self.path_group_line.setText(get_cache_destination_path())
 
+        # fills write profiles
+        self.profile_combo.addItem("Auto")
+        self.profile_combo.addItems(sorted(get_write_profiles()))
+
+        # drives the LOD switches with the viewport camera
+        update_lod_cameras()
+
         # fills with scene rigs
         data = get_scene_rigs()
         model = CacheManagerStringListModel(data)
 
-        self.proxy_model = QtCore.QSortFilterProxyModel()
+        self.proxy_model = CacheManagerSortFilterProxyModel(self)
         self.proxy_model.setSourceModel(model)
+        self.proxy_model.sort(0)
 
         self.rigs_list_view.setModel(self.proxy_model)
+        self._fill_key_filters()
 
         timer = QtCore.QTimer(self)
         timer.singleShot(0, self.filter_line.setFocus)
 
+    def _job_finished(self, job):
+        """ Updates the model state of the rig processed by the job
+
+        Args:
+            job (CacheJob): the finished job
+        """
+
+        if job.gpu_node:
+            self.update_model_states([job.rig_node])
+
+    def _queue_finished(self):
+        """ Resets the progress widgets once the queue is empty
+
+        The cached rigs are hidden or unloaded when the queue stops, so
+        their states are refreshed here too.
+        """
+
+        self.update_model_states([x.rig_node for x in self.job_queue.jobs
+                                  if x.gpu_node])
+        self.cancel_button.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%p%")
+
+    def _update_eta(self, seconds):
+        """ Shows the estimated time remaining on the progress bar
+
+        Args:
+            seconds (float): estimated seconds to finish the queue
+        """
+
+        if not self.job_queue.is_running():
+            return
+
+        self.progress_bar.setFormat("%p% - {}s left".format(int(seconds)))
+
+    def _update_progress(self, job):
+        """ Shows the progress of the running job
+
+        Args:
+            job (CacheJob): the running job
+        """
+
+        self.progress_bar.setValue(int(job.progress * 100))
+
     def _get_color(self):
         """ Returns the color value for the color button
         """
@@ -313,61 +522,68 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         """ Overwrites MayaQWidgetDockableMixin method
         """
 
+        # cancels queued caches
+        self.job_queue.cancel()
+
         # kills installed script jobs
         kill_script_job(self.refresh_model.__name__)
+        kill_script_job(self.validate_caches.__name__)
 
-    def generate_cache(self):
-        """ Launches the GPU cache generation for the selected items
+    def export_metrics(self):
+        """ Saves the session metrics to a json or csv file
         """
 
-        print("Generating caches...")
+        path = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export Metrics", "cache_manager_metrics.json",
+            "JSON (*.json);;CSV (*.csv)")[0]
+        if not path:
+            return
 
-        # gets time line values
-        start, end = get_timeline_values()
+        export_session_metrics(path)
+        self.log_text.appendPlainText("Metrics saved to {}".format(path))
 
-        # gets selected items on list
-        items = self.rigs_list_view.selectedIndexes()
+    def generate_cache(self):
+        """ Queues the GPU cache generation for the selected items
+        """
 
-        # loops on items to generate caches
-        for idx in items:
-            rig_node = idx.data()
+        # gets time line values
+        start, end = get_timeline_values()
 
-            # checks for cache on scene
-            if not is_rig(rig_node):
-                print("Cache for {} already exists on your scene"
-                      .format(rig_node))
-                continue
+        # display color
+        color = None
+        if self.color_display_radial.isChecked():
+            color = self._get_color()
 
-            # get models group inside the rig node
-            geo_node = get_model_group()
-            model_group = find_model_group_inside_rig(geo_node, rig_node)
+        # write profile
+        profile = None
+        if self.profile_combo.currentIndex():
+            profile = self.profile_combo.currentText()
 
-            # cache with custom color
-            if self.color_display_radial.isChecked():
-                color = self._get_color()
-                with set_gpu_color_override(model_group, color):
-                    gpu_node = generate_gpu_cache(model_group, rig_node,
-                                                  start, end, rig_node, True)
+        # sampling. Zero values use the write profile sampling
+        simulation_rate = self.rate_spin.value() or None
+        sample_multiplier = self.multiplier_spin.value() or None
 
-            # cache as it is
-            else:
-                gpu_node = generate_gpu_cache(model_group, rig_node,
-                                              start, end, rig_node, True)
+        # gets selected items on list
+        items = self.rigs_list_view.selectedIndexes()
 
-            # loads cache
-            if gpu_node:
-                unload_rig(rig_node, self.rig_unload_radial.isChecked())
+        # queues a job per selected item
+        for idx in items:
+            job = CacheJob(idx.data(), start, end,
+                           int(self.rig_unload_radial.isChecked()), color,
+                           profile, simulation_rate, sample_multiplier)
+            self.job_queue.add_job(job)
 
-        # refreshes the model
-        self.refresh_model()
+        self.cancel_button.setEnabled(self.job_queue.is_running())
 
     def refresh_model(self):
         """ Updates the rigs model list
+
+        Only the added and removed rigs change on the model so the view keeps
+        its selection.
         """
 
-        data = get_scene_rigs()
-        model = CacheManagerStringListModel(data)
-        self.proxy_model.setSourceModel(model)
+        self.proxy_model.sourceModel().set_rigs(get_scene_rigs())
+        self._fill_key_filters()
 
     def reload_rig(self):
         """ Reloads rigs for the selected items
@@ -377,12 +593,29 @@ class AnimbitsCacheManagerDialog(MayaQWidgetDockableMixin, QtWidgets.QDialog):
 
         items = self.rigs_list_view.selectedIndexes()
 
-        for idx in items:
-            rig_node = idx.data()
-            load_rig(rig_node)
+        rigs = [idx.data() for idx in items]
+        load_rigs(rigs)
+
+        # updates the state of the reloaded rigs
+        self.update_model_states(rigs)
+
+    def validate_caches(self):
+        """ Checks the scene cache files and shows the broken ones
+        """
+
+        validate_scene_caches()
+        update_lod_cameras()
+        self.update_model_states(None)
+
+    def update_model_states(self, rigs):
+        """ Updates the rig/cache state of the given rigs on the model
+
+        Args:
+            rigs (list or None): rig names which state may have changed.
+                                 None updates all the rigs
+        """
 
-        # refreshes the model
-        self.refresh_model()
+        self.proxy_model.sourceModel().update_states(rigs)
 
     def set_cache_path(self):
         """ Sets the cache path inside the preference file
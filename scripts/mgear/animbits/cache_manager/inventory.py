@@ -0,0 +1,447 @@
+
+""" Cache manager disk usage accounting and garbage collection
+
+This module does not need a Maya session so it can run from a cron like
+batch script on the cache destination folders::
+
+    python -m mgear.animbits.cache_manager.inventory /caches --max-size 50G
+        --max-age 30d --dry-run
+
+Every cache written by the cache manager is registered on a manifest file
+stored inside its destination folder, recording the scene and rig it was
+generated from. The quotas only delete caches no saved scene references,
+orphans and unregistered files, unless the --referenced flag is given.
+"""
+
+# imports
+from __future__ import absolute_import
+import argparse
+import glob
+import json
+import os
+import time
+from contextlib import contextmanager
+from mgear.animbits.cache_manager.preferences import get_preference_store
+
+try:
+    from maya import cmds
+except ImportError:
+    cmds = None
+
+# ==============================================================================
+# CONSTANTS
+# ==============================================================================
+
+_MANIFEST_FILE = "cache_manager_manifest.json"
+_CACHE_EXTENSION = ".abc"
+# caches newer than this amount of seconds are never collected as they may be
+# used by a scene not saved yet
+_GRACE_PERIOD = 24 * 60 * 60
+# seconds waited for the manifest lock of another process, and age in
+# seconds of a lock considered left behind by a dead process
+_LOCK_TIMEOUT = 30.0
+_LOCK_STALE_AGE = 120.0
+_SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+_AGE_UNITS = {"m": 60, "h": 60 * 60, "d": 24 * 60 * 60, "w": 7 * 24 * 60 * 60}
+# ==============================================================================
+
+
+def __get_destination(destination):
+    """ Returns the given destination or the cache manager one
+
+    Args:
+        destination (str or None): cache destination path
+
+    Returns:
+        str: cache destination path
+    """
+
+    if destination:
+        return destination
+
+    from mgear.animbits.cache_manager.query import get_cache_destination_path
+    return get_cache_destination_path()
+
+
+@contextmanager
+def __manifest_lock(destination):
+    """ Locks the manifest of the destination between processes
+
+    Batch jobs and artist sessions register caches on the same manifest, so
+    every edit reads the manifest again and writes it while holding a lock
+    file created next to it.
+
+    Args:
+        destination (str): cache destination path
+
+    Yields:
+        PreferenceStore: the manifest store, freshly read
+    """
+
+    lock_path = os.path.join(destination, "{}.lock".format(_MANIFEST_FILE))
+    start = time.time()
+
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except OSError:
+            # removes the lock of a dead process
+            try:
+                if (time.time() - os.path.getmtime(lock_path) >
+                        _LOCK_STALE_AGE):
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.time() - start > _LOCK_TIMEOUT:
+                raise RuntimeError("Manifest locked: {}".format(lock_path))
+            time.sleep(0.05)
+
+    try:
+        manifest = get_manifest(destination)
+        manifest.invalidate()
+        yield manifest
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+def __scene_references(scene, file_name):
+    """ Returns whether the scene file contains the given cache file name
+
+    Args:
+        scene (str): Maya scene path
+        file_name (str): cache file base name
+
+    Returns:
+        bool: if the scene file mentions the cache file
+    """
+
+    token = file_name.encode("utf-8")
+    tail = b""
+
+    try:
+        with open(scene, "rb") as file_r:
+            while True:
+                chunk = file_r.read(1024 * 1024)
+                if not chunk:
+                    return False
+                if token in tail + chunk:
+                    return True
+                tail = chunk[-len(token):]
+
+    except (IOError, OSError):
+        return False
+
+
+def get_manifest(destination):
+    """ Returns the manifest store for the given cache destination
+
+    The manifest file gets created if missing
+
+    Args:
+        destination (str): cache destination path
+
+    Returns:
+        PreferenceStore: store with the manifest entries by cache file name
+    """
+
+    manifest = os.path.join(destination, _MANIFEST_FILE)
+
+    if not os.path.exists(manifest):
+        with open(manifest, "w") as file_w:
+            json.dump({}, file_w)
+
+    return get_preference_store(manifest)
+
+
+def get_scene_cache_files():
+    """ Returns the cache files used by the gpuCache nodes in the Maya session
+
+    Returns:
+        dict: rig name by normalized cache file path. Empty outside Maya
+    """
+
+    if cmds is None:
+        return {}
+
+    files = {}
+    for node in cmds.ls(type="gpuCache") or []:
+        path = cmds.getAttr("{}.cacheFileName".format(node))
+        if cmds.objExists("{}.cache_file_path".format(node)):
+            path = cmds.getAttr("{}.cache_file_path".format(node))
+        if not path:
+            continue
+
+        rig = None
+        if cmds.objExists("{}.rig_link".format(node)):
+            rig = cmds.getAttr("{}.rig_link".format(node))
+        files[os.path.normcase(os.path.abspath(path))] = rig
+
+    return files
+
+
+def register_cache_files(files, rig_node, scene=None, destination=None):
+    """ Records the scene and rig the given cache files were generated from
+
+    Args:
+        files (list): cache files paths
+        rig_node (str): rig node name
+        scene (str or None): scene path. None uses the current Maya scene
+        destination (str or None): cache destination path. None uses the
+                                   folder of each file
+    """
+
+    if scene is None and cmds is not None:
+        scene = cmds.file(query=True, sceneName=True)
+
+    entries = {}
+    for path in files:
+        folder = destination or os.path.dirname(path)
+        entries.setdefault(folder, {})[os.path.basename(path)] = {
+            "scene": scene or "",
+            "rig": rig_node,
+            "created": time.time()}
+
+    for folder, settings in entries.items():
+        try:
+            with __manifest_lock(folder) as manifest:
+                manifest.update(settings)
+        except Exception as e:
+            message = "Cache files will not be tracked by the inventory"
+            print("{} - {} / {}".format(type(e).__name__, e, message))
+
+
+def get_cache_inventory(destination=None, verify_scenes=False):
+    """ Lists every cache file inside the cache destination
+
+    Each entry is a dictionary with the following keys:
+
+    - **path**: cache file path
+    - **size**: file size in bytes
+    - **age**: seconds since the file was last modified
+    - **scenes**: scenes referencing the file that still exist on disk
+    - **rigs**: rigs the file was generated from
+    - **in_use**: if a gpuCache node of the Maya session uses the file
+    - **registered**: if the file was registered from a saved scene
+    - **orphan**: if the scene the file was registered from doesn't
+      reference it anymore. Files not registered or registered from an
+      unsaved scene are never orphans, as their users are unknown
+
+    Args:
+        destination (str or None): cache destination path. None uses the
+                                   cache manager destination
+        verify_scenes (bool): read the registered scene files to check they
+                              still mention the cache file
+
+    Returns:
+        list: inventory entries sorted from oldest to newest
+    """
+
+    destination = __get_destination(destination)
+    manifest = get_manifest(destination)
+    scene_files = get_scene_cache_files()
+    now = time.time()
+
+    inventory = []
+    for path in glob.glob(os.path.join(destination,
+                                       "*{}".format(_CACHE_EXTENSION))):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        file_name = os.path.basename(path)
+        try:
+            record = manifest.get(file_name)
+        except KeyError:
+            record = {}
+
+        scenes = []
+        scene = record.get("scene")
+        if scene and os.path.exists(scene) and (
+                not verify_scenes or __scene_references(scene, file_name)):
+            scenes.append(scene)
+
+        rigs = [record["rig"]] if record.get("rig") else []
+        normalized = os.path.normcase(os.path.abspath(path))
+        in_use = normalized in scene_files
+        if in_use and scene_files[normalized] not in rigs + [None]:
+            rigs.append(scene_files[normalized])
+
+        inventory.append({"path": path,
+                          "size": stat.st_size,
+                          "age": now - stat.st_mtime,
+                          "scenes": scenes,
+                          "rigs": rigs,
+                          "in_use": in_use,
+                          "registered": bool(scene),
+                          "orphan": bool(scene) and not scenes and
+                          not in_use})
+
+    inventory.sort(key=lambda x: -x["age"])
+    return inventory
+
+
+def collect_garbage(destination=None, max_size=None, max_age=None,
+                    dry_run=False, collect_orphans=False,
+                    collect_referenced=False):
+    """ Deletes cache files following the given quotas
+
+    The registered scene files are always read to decide which files are
+    orphans. Files used by the Maya session or newer than the grace period
+    are always kept, and so are the files still referenced by their saved
+    scene unless collect_referenced is set. Then:
+
+    - orphan files are deleted if collect_orphans is set
+    - files older than max_age are deleted
+    - the oldest files, orphans first, are deleted until the destination is
+      under max_size
+
+    Args:
+        destination (str or None): cache destination path. None uses the
+                                   cache manager destination
+        max_size (int or None): maximum size in bytes for the destination
+        max_age (float or None): maximum age in seconds for a cache file
+        dry_run (bool): only report the files that would be deleted
+        collect_orphans (bool): delete the orphan files even if no quota
+                                is exceeded
+        collect_referenced (bool): let the quotas delete the files still
+                                   referenced by their registered scene
+
+    Returns:
+        list: inventory entries of the deleted files
+    """
+
+    destination = __get_destination(destination)
+    inventory = get_cache_inventory(destination, verify_scenes=True)
+    total = sum(x["size"] for x in inventory)
+
+    keep = [x for x in inventory if x["in_use"] or x["age"] < _GRACE_PERIOD or
+            (x["registered"] and not x["orphan"] and not collect_referenced)]
+    candidates = [x for x in inventory if x not in keep]
+
+    collected = [x for x in candidates if
+                 (collect_orphans and x["orphan"]) or
+                 (max_age is not None and x["age"] > max_age)]
+    total -= sum(x["size"] for x in collected)
+
+    # size quota, oldest orphans first then oldest files
+    if max_size is not None:
+        remaining = sorted([x for x in candidates if x not in collected],
+                           key=lambda x: (not x["orphan"], -x["age"]))
+        for entry in remaining:
+            if total <= max_size:
+                break
+            collected.append(entry)
+            total -= entry["size"]
+        if total > max_size:
+            print("Size quota exceeded by {} bytes of kept files".format(
+                total - max_size))
+
+    deleted = []
+    for entry in collected:
+        print("{} {} ({} bytes)".format(
+            "Would delete" if dry_run else "Deleting", entry["path"],
+            entry["size"]))
+        if dry_run:
+            deleted.append(entry)
+            continue
+
+        try:
+            os.remove(entry["path"])
+            deleted.append(entry)
+        except OSError as e:
+            print("{} - {}".format(type(e).__name__, e))
+
+    # removes the manifest entries of the missing files
+    if not dry_run and deleted:
+        with __manifest_lock(destination) as manifest:
+            with manifest.batch():
+                for file_name in manifest.keys():
+                    if not os.path.exists(os.path.join(destination,
+                                                       file_name)):
+                        manifest.pop(file_name)
+
+    return deleted
+
+
+def parse_age(value):
+    """ Converts an age string like 30d, 12h or 90m into seconds
+
+    Args:
+        value (str): age with an optional m, h, d or w unit suffix
+
+    Returns:
+        float: seconds
+    """
+
+    if value[-1] in _AGE_UNITS:
+        return float(value[:-1]) * _AGE_UNITS[value[-1]]
+    return float(value)
+
+
+def parse_size(value):
+    """ Converts a size string like 500M or 50G into bytes
+
+    Args:
+        value (str): size with an optional K, M, G or T unit suffix
+
+    Returns:
+        int: bytes
+    """
+
+    value = value.upper().rstrip("B")
+    if value[-1] in _SIZE_UNITS:
+        return int(float(value[:-1]) * _SIZE_UNITS[value[-1]])
+    return int(value)
+
+
+def main(argv=None):
+    """ Command line entry point for the inventory and garbage collection
+
+    Args:
+        argv (list or None): command line arguments
+
+    Returns:
+        int: exit code
+    """
+
+    parser = argparse.ArgumentParser(
+        description="mGear cache manager cache inventory and garbage "
+                    "collection")
+    parser.add_argument("destination", help="cache destination folder")
+    parser.add_argument("--max-size", type=parse_size,
+                        help="size quota, like 500M or 50G")
+    parser.add_argument("--max-age", type=parse_age,
+                        help="age quota, like 12h or 30d")
+    parser.add_argument("--collect", action="store_true",
+                        help="deletes the files following the quotas")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="reports the files that would be deleted")
+    parser.add_argument("--verify-scenes", action="store_true",
+                        help="checks the scene files still use the caches "
+                             "when listing, always done when collecting")
+    parser.add_argument("--orphans", action="store_true",
+                        help="deletes the orphan files even under quota")
+    parser.add_argument("--referenced", action="store_true",
+                        help="lets the quotas delete the files still used "
+                             "by their registered scene")
+    args = parser.parse_args(argv)
+
+    if args.collect or args.dry_run:
+        collect_garbage(args.destination, args.max_size, args.max_age,
+                        args.dry_run, args.orphans, args.referenced)
+        return 0
+
+    for entry in get_cache_inventory(args.destination, args.verify_scenes):
+        print(json.dumps(entry, sort_keys=True))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,454 @@
+
+# imports
+from __future__ import absolute_import
+import time
+from datetime import datetime
+from PySide2 import QtCore
+
+# tool imports
+from mgear.animbits.cache_manager.query import (
+    get_model_group,
+    find_model_group_inside_rig,
+    get_preference_file,
+    is_rig)
+from mgear.animbits.cache_manager.mayautils import (
+    generate_gpu_cache,
+    unload_rigs,
+    GpuColorOverride)
+from mgear.animbits.cache_manager.preferences import get_preference_store
+from mgear.animbits.cache_manager import metrics
+
+# ==============================================================================
+# CONSTANTS
+# ==============================================================================
+
+# preference key storing the measured caching speed
+_FPS_PREFERENCE_KEY = "cache_manager_frames_per_second"
+# frames per second used for estimations before anything has been measured
+_DEFAULT_FPS = 10.0
+# weight given to the last measured speed on the running average
+_FPS_SMOOTHING = 0.3
+# ==============================================================================
+
+
+class CacheJob(object):
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    SKIPPED = "skipped"
+    CANCELLED = "cancelled"
+    FAILED = "failed"
+
+    def __init__(self, rig_node, start, end, unload_method=1, color=None,
+                 profile=None, simulation_rate=None, sample_multiplier=None):
+        """ A GPU cache generation request for a single rig
+
+        Args:
+            rig_node (str): Rig root node to cache
+            start (float): start frame to use
+            end (float): end frame to use
+            unload_method (int): 0=hide, 1=unload the rig once cached
+            color (tuple or None): display color override for the cache
+            profile (str or None): write profile name. None uses the
+                                   profile matching the rig
+            simulation_rate (float or None): frames between evaluated
+                                             samples. None uses the profile
+            sample_multiplier (int or None): write a sample every given
+                                             number of evaluated samples.
+                                             None uses the profile
+        """
+
+        self.rig_node = rig_node
+        self.start = start
+        self.end = end
+        self.unload_method = unload_method
+        self.color = color
+        self.profile = profile
+        self.simulation_rate = simulation_rate
+        self.sample_multiplier = sample_multiplier
+
+        self.state = self.QUEUED
+        self.progress = 0.0
+        self.model_group = None
+        self.gpu_node = None
+        self.error = None
+        self.elapsed = 0.0
+
+    @property
+    def frames(self):
+        """ Number of samples this job evaluates
+        """
+
+        return (self.end - self.start) / (self.simulation_rate or 1.0) + 1
+
+    @property
+    def is_finished(self):
+        """ Whether or not the job won't run anymore
+        """
+
+        return self.state not in (self.QUEUED, self.RUNNING)
+
+
+class CacheJobQueue(QtCore.QObject):
+
+    job_started = QtCore.Signal(object)
+    job_progress = QtCore.Signal(object)
+    job_finished = QtCore.Signal(object)
+    queue_finished = QtCore.Signal()
+    eta_changed = QtCore.Signal(float)
+    logged = QtCore.Signal(str)
+
+    def __init__(self, parent=None):
+        """ Queue running cache jobs one phase at a time
+
+        Maya commands have to run on the main thread, so instead of a worker
+        thread every phase of a job (finding the model group, writing the
+        cache) is scheduled as a separate event. Maya processes the UI and
+        other panels between phases and between rigs, and cancelling takes
+        effect on the next phase. The cached rigs are hidden or unloaded
+        together once the queue stops.
+
+        Args:
+            parent (QObject): parent object
+        """
+
+        super(CacheJobQueue, self).__init__(parent=parent)
+
+        self.jobs = []
+        self.log = []
+
+        self.__cancelled = False
+        self.__running = False
+        self.__current = None
+        self.__phases = []
+        self.__job_start = 0.0
+        self.__color_override = None
+        self.__pending_unloads = {}
+        self.__fps = None
+
+    # --------------------------------------------------------------------------
+    # queue public API
+    # --------------------------------------------------------------------------
+
+    def add_job(self, job):
+        """ Adds a job to the queue and starts processing if idle
+
+        Args:
+            job (CacheJob): the job to queue
+        """
+
+        self.jobs.append(job)
+        self._log("Queued {} [{} - {}]".format(job.rig_node, job.start,
+                                               job.end))
+
+        if not self.__running:
+            self.__cancelled = False
+            self.__running = True
+            self.__schedule()
+
+        self.eta_changed.emit(self.estimated_time_remaining())
+
+    def cancel(self):
+        """ Cancels the running job on its next phase and all queued jobs
+        """
+
+        if self.__running:
+            self.__cancelled = True
+            self._log("Cancel requested")
+
+    def estimated_time_remaining(self):
+        """ Estimates the seconds left to process the queue
+
+        The estimation is based on the frames per second measured on previous
+        caches, stored into the preference file.
+
+        Returns:
+            float: seconds
+        """
+
+        frames = 0.0
+        for job in self.jobs:
+            if job.state == job.QUEUED:
+                frames += job.frames
+            elif job.state == job.RUNNING:
+                frames += job.frames * (1.0 - job.progress)
+
+        return frames / self.frames_per_second()
+
+    def frames_per_second(self):
+        """ Returns the caching speed measured on previous caches
+
+        The running average of the queue is used once a cache has been
+        measured, the preference file value otherwise.
+
+        Returns:
+            float: frames per second
+        """
+
+        if self.__fps is not None:
+            return self.__fps
+
+        try:
+            return float(get_preference_store(get_preference_file())
+                         .get(_FPS_PREFERENCE_KEY)) or _DEFAULT_FPS
+        except (KeyError, TypeError, ValueError, IOError, OSError):
+            return _DEFAULT_FPS
+
+    def is_running(self):
+        """ Whether or not the queue is processing jobs
+        """
+
+        return self.__running
+
+    # --------------------------------------------------------------------------
+    # queue processing
+    # --------------------------------------------------------------------------
+
+    def __schedule(self):
+        """ Schedules the next phase to run when Maya is idle
+        """
+
+        QtCore.QTimer.singleShot(0, self.__step)
+
+    def __step(self):
+        """ Runs the next phase of the current job or starts the next job
+        """
+
+        # cancel remaining work. Once a cache is written we still let its
+        # job swap the rig so the scene is left in a consistent state
+        if self.__cancelled and not (self.__current and
+                                     self.__current.gpu_node):
+            for job in self.jobs:
+                if not job.is_finished:
+                    job.state = job.CANCELLED
+                    self._log("Cancelled {}".format(job.rig_node))
+                    self.job_finished.emit(job)
+            self.__finish_queue()
+            return
+
+        # starts next job
+        if not self.__current:
+            queued = [x for x in self.jobs if x.state == x.QUEUED]
+            if not queued:
+                self.__finish_queue()
+                return
+
+            self.__start_job(queued[0])
+            self.__schedule()
+            return
+
+        # runs next phase
+        job = self.__current
+        weight, phase = self.__phases.pop(0)
+
+        try:
+            phase(job)
+            job.progress = min(job.progress + weight, 1.0)
+        except Exception as e:
+            job.state = job.FAILED
+            job.error = "{} - {}".format(type(e).__name__, e)
+            self._log("Failed {}: {}".format(job.rig_node, job.error))
+
+        self.job_progress.emit(job)
+        self.eta_changed.emit(self.estimated_time_remaining())
+
+        if job.state != job.RUNNING or not self.__phases:
+            self.__finish_job(job)
+
+        self.__schedule()
+
+    def __start_job(self, job):
+        """ Marks the job as running and prepares its phases
+
+        Args:
+            job (CacheJob): the job to start
+        """
+
+        job.state = job.RUNNING
+        job.progress = 0.0
+        self.__current = job
+        self.__job_start = time.time()
+        self.__phases = [(0.05, self.__find_model_group),
+                         (0.85, self.__generate),
+                         (0.1, self.__unload)]
+
+        self._log("Started {}".format(job.rig_node))
+        self.job_started.emit(job)
+
+    def __finish_job(self, job):
+        """ Closes the given job
+
+        Args:
+            job (CacheJob): the job to close
+        """
+
+        job.elapsed = time.time() - self.__job_start
+
+        if job.state == job.RUNNING:
+            job.state = job.DONE
+            job.progress = 1.0
+            self._log("Finished {} in {:.2f}s".format(job.rig_node,
+                                                      job.elapsed))
+            self._log(metrics.format_rig_summary(job.rig_node))
+
+        self.__current = None
+        self.__phases = []
+        self.job_finished.emit(job)
+
+    def __finish_queue(self):
+        """ Stops processing the queue
+        """
+
+        self.__running = False
+        self.__cancelled = False
+        self.__current = None
+        self.__phases = []
+        self.__close_color_override()
+        self.__unload_pending_rigs()
+        self.__save_speed()
+        self.eta_changed.emit(0.0)
+        self.queue_finished.emit()
+
+    def __close_color_override(self):
+        """ Deletes the display color override shared between jobs
+        """
+
+        if self.__color_override:
+            self.__color_override.close()
+            self.__color_override = None
+
+    def __get_color_override(self, color):
+        """ Returns the display color override for the given color
+
+        The same override is reused by consecutive jobs with the same color,
+        so the render layer and shader are only built once per batch.
+
+        Args:
+            color (tuple): red, green and blue values between 0 and 1
+
+        Returns:
+            GpuColorOverride: the display color override
+        """
+
+        if self.__color_override and self.__color_override.color != color:
+            self.__close_color_override()
+
+        if not self.__color_override:
+            self.__color_override = GpuColorOverride(color)
+
+        return self.__color_override
+
+    def __unload_pending_rigs(self):
+        """ Hides or unloads the cached rigs with a single batch per method
+        """
+
+        pending = self.__pending_unloads
+        self.__pending_unloads = {}
+
+        for method, rig_nodes in sorted(pending.items()):
+            try:
+                unload_rigs(rig_nodes, method)
+            except Exception as e:
+                self._log("Failed unloading rigs: {} - {}"
+                          .format(type(e).__name__, e))
+
+    def __record_speed(self, frames, seconds):
+        """ Updates the running average of the caching speed on the queue
+
+        Args:
+            frames (float): number of frames cached
+            seconds (float): time spent caching them
+        """
+
+        if seconds <= 0:
+            return
+
+        fps = frames / seconds
+        self.__fps = (_FPS_SMOOTHING * fps +
+                      (1.0 - _FPS_SMOOTHING) * self.frames_per_second())
+
+    def __save_speed(self):
+        """ Stores the running average of the caching speed on the preference
+        file, once per queue run
+        """
+
+        if self.__fps is None:
+            return
+
+        try:
+            get_preference_store(get_preference_file()).set(
+                _FPS_PREFERENCE_KEY, self.__fps)
+            self.__fps = None
+        except (IOError, OSError, TypeError, ValueError) as e:
+            self._log("Failed saving the caching speed: {} - {}"
+                      .format(type(e).__name__, e))
+
+    # --------------------------------------------------------------------------
+    # job phases
+    # --------------------------------------------------------------------------
+
+    def __find_model_group(self, job):
+        """ Finds the model group to cache inside the job rig
+        """
+
+        # checks for cache on scene
+        if not is_rig(job.rig_node):
+            job.state = job.SKIPPED
+            self._log("Cache for {} already exists on your scene"
+                      .format(job.rig_node))
+            return
+
+        with metrics.measure(job.rig_node, metrics.FIND_MODEL_GROUP):
+            job.model_group = find_model_group_inside_rig(get_model_group(),
+                                                          job.rig_node)
+        if not job.model_group:
+            job.state = job.FAILED
+            job.error = "Model group not found"
+            self._log("Failed {}: {}".format(job.rig_node, job.error))
+
+    def __generate(self, job):
+        """ Writes and loads the GPU cache for the job rig
+        """
+
+        # cache with custom color
+        if job.color:
+            with metrics.measure(job.rig_node, metrics.COLOR_OVERRIDE):
+                self.__get_color_override(job.color).apply(job.model_group)
+
+        # cache as it is
+        else:
+            self.__close_color_override()
+
+        start = time.time()
+        job.gpu_node = generate_gpu_cache(job.model_group, job.rig_node,
+                                          job.start, job.end,
+                                          job.rig_node, True, job.profile,
+                                          job.simulation_rate,
+                                          job.sample_multiplier)
+
+        self.__record_speed(job.frames, time.time() - start)
+
+    def __unload(self, job):
+        """ Queues the job rig to be hidden or unloaded once cached
+        """
+
+        if job.gpu_node:
+            self.__pending_unloads.setdefault(job.unload_method,
+                                              []).append(job.rig_node)
+
+    # --------------------------------------------------------------------------
+    # log
+    # --------------------------------------------------------------------------
+
+    def _log(self, message):
+        """ Adds a line to the job log
+
+        Args:
+            message (str): the message to log
+        """
+
+        line = "[{}] {}".format(datetime.now().strftime("%H:%M:%S"), message)
+        self.log.append(line)
+        print(line)
+        self.logged.emit(line)
@@ -0,0 +1,200 @@
+
+""" Local scratch tier in front of the shared cache destination
+
+Caches are written to a local folder, usually on a SSD, then published to the
+shared cache destination in the background (write-back). Gpu cache nodes read
+the local copy and caches only found on the shared destination get copied
+locally when needed (read-through). The local folder is kept under a size
+quota by evicting the least recently used files.
+"""
+
+# imports
+from __future__ import absolute_import
+import atexit
+import os
+import shutil
+import threading
+from mgear.animbits.cache_manager.inventory import get_scene_cache_files
+
+# background publish threads still running
+_PUBLISHES = []
+
+
+def __copy_file(source, destination):
+    """ Copies a file through a temporary file renamed once complete
+
+    This way readers of the destination never see a partial cache file.
+
+    Args:
+        source (str): file to copy
+        destination (str): path of the copy
+    """
+
+    temp_path = "{}.{}.tmp".format(destination, threading.current_thread()
+                                   .ident)
+    try:
+        shutil.copy2(source, temp_path)
+
+        # os.rename can't overwrite files on Windows
+        if hasattr(os, "replace"):
+            os.replace(temp_path, destination)
+        else:
+            if os.name == "nt" and os.path.exists(destination):
+                os.remove(destination)
+            os.rename(temp_path, destination)
+
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def __publish(local_file, publish_file):
+    """ Copies the local file to its publish path and reports failures
+
+    Args:
+        local_file (str): local cache file
+        publish_file (str): cache file path on the shared destination
+    """
+
+    try:
+        __copy_file(local_file, publish_file)
+    except Exception as e:
+        message = "The cache only exists on the local cache folder"
+        print("{} - {} / {}".format(type(e).__name__, e, message))
+
+
+def evict_local_cache(local_path, max_size):
+    """ Deletes the least recently used local files above the size quota
+
+    Files used by the gpu cache nodes of the Maya session and files not
+    published yet are never evicted.
+
+    Args:
+        local_path (str): local cache folder
+        max_size (int): size quota in bytes
+
+    Returns:
+        list: the evicted files
+    """
+
+    in_use = get_scene_cache_files()
+    publishing = [os.path.normcase(os.path.abspath(x.name))
+                  for x in _PUBLISHES if x.is_alive()]
+
+    entries = []
+    total = 0
+    for file_name in os.listdir(local_path):
+        path = os.path.join(local_path, file_name)
+        if file_name.endswith(".tmp"):
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        total += stat.st_size
+
+        normalized = os.path.normcase(os.path.abspath(path))
+        if normalized not in in_use and normalized not in publishing:
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size,
+                            path))
+
+    evicted = []
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+            evicted.append(path)
+            total -= size
+        except OSError as e:
+            print("{} - {}".format(type(e).__name__, e))
+
+    return evicted
+
+
+def fetch_publish_file(publish_file, local_path):
+    """ Returns the local copy of a published cache file
+
+    The file gets copied from the shared destination if the local copy is
+    missing or differs in size.
+
+    Args:
+        publish_file (str): cache file path on the shared destination
+        local_path (str): local cache folder
+
+    Returns:
+        str or None: the local cache file or None if the published file is
+                     missing too
+    """
+
+    local_file = get_local_cache_file(publish_file, local_path)
+
+    try:
+        publish_size = os.path.getsize(publish_file)
+    except OSError:
+        return local_file if os.path.exists(local_file) else None
+
+    if (not os.path.exists(local_file) or
+            os.path.getsize(local_file) != publish_size):
+        if not os.path.exists(local_path):
+            os.makedirs(local_path)
+        __copy_file(publish_file, local_file)
+
+    return local_file
+
+
+def get_local_cache_file(publish_file, local_path):
+    """ Returns the local path for the given published cache file
+
+    Args:
+        publish_file (str): cache file path on the shared destination
+        local_path (str): local cache folder
+
+    Returns:
+        str: local cache file path
+    """
+
+    return os.path.join(local_path, os.path.basename(publish_file))
+
+
+def publish_local_file(local_file, destination, background=True):
+    """ Publishes a local cache file to the shared destination
+
+    Args:
+        local_file (str): local cache file
+        destination (str): shared cache destination folder
+        background (bool): whether or not the copy runs on a thread
+
+    Returns:
+        str: the cache file path on the shared destination
+    """
+
+    publish_file = os.path.join(destination, os.path.basename(local_file))
+
+    if not background:
+        __publish(local_file, publish_file)
+        return publish_file
+
+    # the thread name is used to know which local files are being published
+    thread = threading.Thread(target=__publish, name=local_file,
+                              args=(local_file, publish_file))
+    thread.daemon = True
+    thread.start()
+
+    _PUBLISHES[:] = [x for x in _PUBLISHES if x.is_alive()] + [thread]
+
+    return publish_file
+
+
+def wait_for_publishes():
+    """ Blocks until the background publishes are done
+    """
+
+    for thread in list(_PUBLISHES):
+        thread.join()
+    del _PUBLISHES[:]
+
+
+# makes sure the caches are published before the session ends
+atexit.register(wait_for_publishes)
@@ -4,16 +4,31 @@ from __future__ import absolute_import
 import os
 import re
 import json
+import time
 from contextlib import contextmanager
-from maya import cmds, mel, OpenMayaUI
+from maya import cmds, OpenMayaUI
 from maya.app.renderSetup.model import renderSetup, renderLayer, typeIDs
-from PySide2 import QtWidgets
-from shiboken2 import wrapInstance
 from mgear.animbits.cache_manager.query import (
     _MANAGER_PREFERENCE_PATH,
     get_preference_file,
     get_cache_destination_path,
-    get_time_stamp)
+    get_cache_sampling,
+    get_local_cache_path,
+    get_local_cache_size,
+    get_rig_write_profile_name,
+    get_time_stamp,
+    get_timeline_values,
+    get_write_profile)
+from mgear.animbits.cache_manager.preferences import get_preference_store
+from mgear.animbits.cache_manager import metrics
+from mgear.animbits.cache_manager.inventory import register_cache_files
+from mgear.animbits.cache_manager.local_cache import (
+    evict_local_cache,
+    publish_local_file)
+
+# sampling of the caches deleted when their rig is loaded back, by rig name,
+# so the rig is cached again with the same sampling
+_DELETED_CACHE_SAMPLING = {}
 
 
 def __create_preference_file():
@@ -36,6 +51,8 @@ def __create_preference_file():
         data["cache_manager_cache_path"] = ""
         data["cache_manager_model_group"] = ""
         data["cache_manager_unload_rigs"] = 1
+        data["cache_manager_write_profiles"] = {}
+        data["cache_manager_profile_rules"] = []
         json.dump(data, pref_file, indent=4)
         pref_file.close()
         return pref_file.name
@@ -86,6 +103,194 @@ def __set_reference_edits(ref_edit_default, value):
         cmds.optionVar(iv=("refLockEditable", value))
 
 
+def __add_cache_file_attributes(gpu_node, gpu_file, publish_file=None):
+    """ Records the cache file path, size and modification time on the node
+
+    This is used to find missing or stale cache files when opening scenes.
+
+    Args:
+        gpu_node (str): gpu cache node
+        gpu_file (str): file name used for the gpu cache file
+        publish_file (str or None): cache file path on the shared destination
+                                    when gpu_file is a local copy
+    """
+
+    try:
+        stat = os.stat(gpu_file)
+        mtime, size = stat.st_mtime, stat.st_size
+    except OSError:
+        mtime, size = 0.0, 0.0
+
+    cmds.addAttr(gpu_node, longName="cache_file_path", dataType="string")
+    cmds.setAttr("{}.cache_file_path".format(gpu_node),
+                 "{}".format(gpu_file), type="string", lock=True)
+    cmds.addAttr(gpu_node, longName="cache_publish_path", dataType="string")
+    cmds.setAttr("{}.cache_publish_path".format(gpu_node),
+                 "{}".format(publish_file or gpu_file), type="string",
+                 lock=True)
+    cmds.addAttr(gpu_node, longName="cache_file_mtime", attributeType="double")
+    cmds.setAttr("{}.cache_file_mtime".format(gpu_node), mtime, lock=True)
+    cmds.addAttr(gpu_node, longName="cache_file_size", attributeType="double")
+    cmds.setAttr("{}.cache_file_size".format(gpu_node), size, lock=True)
+
+
+def __create_lod_proxy_group(geo_node, reduction):
+    """ Creates a live decimated copy of the meshes under the given group
+
+    Every mesh gets a polyReduce node fed by the deformed world mesh, so the
+    proxy follows the animation without modifying the rig.
+
+    Args:
+        geo_node (str): geometry group transform node containing the shapes
+        reduction (float): percentage of the polygons to remove
+
+    Returns:
+        str: the proxy group. Deleting it deletes the proxy meshes
+    """
+
+    proxy_group = cmds.createNode("transform", name="cache_manager_lod_grp")
+    shapes = cmds.listRelatives(geo_node, allDescendents=True,
+                                fullPath=True, type="mesh") or []
+
+    for shape in shapes:
+        if cmds.getAttr("{}.intermediateObject".format(shape)):
+            continue
+
+        name = shape.split("|")[-1].split(":")[-1]
+        transform = cmds.createNode("transform", name=name,
+                                    parent=proxy_group)
+        proxy = cmds.createNode("mesh", name="{}Shape".format(name),
+                                parent=transform)
+        reduce_node = cmds.createNode("polyReduce")
+        cmds.setAttr("{}.percentage".format(reduce_node), reduction)
+        cmds.connectAttr("{}.worldMesh[0]".format(shape),
+                         "{}.inputPolymesh".format(reduce_node))
+        cmds.connectAttr("{}.output".format(reduce_node),
+                         "{}.inMesh".format(proxy))
+
+    return proxy_group
+
+
+def __get_lod_camera():
+    """ Returns the camera used to drive the LOD switch
+
+    Returns:
+        str: the camera of the focused model panel or the persp camera
+    """
+
+    if not __is_maya_batch():
+        panel = cmds.getPanel(withFocus=True)
+        if panel and cmds.getPanel(typeOf=panel) == "modelPanel":
+            return cmds.modelPanel(panel, query=True, camera=True)
+
+    return "persp"
+
+
+def __connect_lod_camera(distance, camera):
+    """ Connects the camera driving the LOD switch of a cache
+
+    Args:
+        distance (str): distanceBetween node measuring the cache distance
+        camera (str): camera to connect
+    """
+
+    cmds.connectAttr("{}.worldMatrix[0]".format(camera),
+                     "{}.inMatrix2".format(distance), force=True)
+
+
+def __get_lod_utility_nodes(cache_transform):
+    """ Returns the utility nodes of the LOD switch of a cache
+
+    Args:
+        cache_transform (str): the gpu cache transform
+
+    Returns:
+        list: LOD switch utility nodes
+    """
+
+    if not cmds.objExists("{}.lod_utility_nodes".format(cache_transform)):
+        return []
+
+    return cmds.listConnections("{}.lod_utility_nodes"
+                                .format(cache_transform),
+                                source=True, destination=False) or []
+
+
+def __write_gpu_cache(geo_node, file_name, start, end, settings, directory):
+    """ Runs the GPU cache generation with the given write profile settings
+
+    Args:
+        geo_node (str): group node containing the shapes to cache
+        file_name (str): file name to use for the gpu cache file
+        start (float): start frame to use
+        end (float): end frame to use
+        settings (dict): write profile settings
+        directory (str): cache destination path
+
+    Returns:
+        list: written gpu cache files
+    """
+
+    return cmds.gpuCache("{}".format(geo_node),
+                         startTime=start,
+                         endTime=end,
+                         simulationRate=settings["simulation_rate"],
+                         sampleMultiplier=settings["sample_multiplier"],
+                         optimize=settings["optimize"],
+                         optimizationThreshold=settings[
+                             "optimization_threshold"],
+                         writeMaterials=settings["write_materials"],
+                         directory=directory,
+                         fileName=file_name,
+                         showStats=True,
+                         useBaseTessellation=False,
+                         saveMultipleFiles=settings["save_multiple_files"])
+
+
+def __print_timing(action, phase, rig_nodes, batch, seconds):
+    """ Prints the time spent swapping rigs and records it per rig
+
+    Args:
+        action (str): name of the action done on the rigs
+        phase (str): metrics phase name
+        rig_nodes (list): The rig root node names
+        batch (bool): Whether or not the rigs were processed as a batch
+        seconds (float): time spent
+    """
+
+    for rig_node in rig_nodes:
+        metrics.record(rig_node, phase, seconds / len(rig_nodes),
+                       batch=batch)
+
+    print("{} {} rigs in {:.3f}s ({:.3f}s per rig, {} path)".format(
+        action, len(rig_nodes), seconds, seconds / max(len(rig_nodes), 1),
+        "batch" if batch else "per rig"))
+
+
+def __print_evaluation_timing(rig_node, mode, samples, fill_seconds,
+                              write_seconds):
+    """ Prints the rig evaluation cost per frame of a cache generation
+
+    Args:
+        rig_node (str): Rig root node cached
+        mode (str): evaluation mode used
+        samples (int): number of evaluated samples
+        fill_seconds (float): time spent filling the evaluation cache
+        write_seconds (float): time spent writing the cache files
+
+    Returns:
+        float: seconds per evaluated sample
+    """
+
+    per_frame = (fill_seconds + write_seconds) / max(samples, 1)
+    print("Cache manager: {} evaluated {} samples in {:.3f}s, {:.1f}ms per "
+          "frame ({} evaluation, {:.3f}s cache fill, {:.3f}s write)".format(
+              rig_node, samples, fill_seconds + write_seconds,
+              per_frame * 1000.0, mode, fill_seconds, write_seconds))
+
+    return per_frame
+
+
 def check_gpu_plugin():
     """ Check for the gpuCache plugin load
     """
@@ -126,9 +331,16 @@ def delete_cache_file(file_path):
                                     message))
 
 
-def generate_gpu_cache(geo_node, cache_name, start, end, rig_node, lock=False):
+def generate_gpu_cache(geo_node, cache_name, start, end, rig_node, lock=False,
+                       profile=None, simulation_rate=None,
+                       sample_multiplier=None, lod_levels=None,
+                       evaluation=None):
     """ Generates a GPU representation for shapes found under the geo_node
 
+    When the rig already had a cache in the session and neither a profile
+    nor sampling values are given, the sampling recorded on that cache is
+    used, so the re-cached rig keeps the same samples as its previous cache.
+
     Args:
         geo_node (str): geometry group transform node containing the shapes to
                         cache
@@ -137,6 +349,21 @@ def generate_gpu_cache(geo_node, cache_name, start, end, rig_node, lock=False):
         end (float): end frame to use
         rig_node (str): Rig root node containing the geo_node
         lock (bool): Whether or not the gpu cache node should be locked
+        profile (str or None): write profile name. None uses the profile
+                               matching the rig on the preference file rules
+        simulation_rate (float or None): frames between evaluated samples.
+                                         Bigger than 1 for stepped caches,
+                                         smaller for sub-frame samples. None
+                                         uses the write profile value
+        sample_multiplier (int or None): write a sample every given number
+                                         of evaluated samples. None uses the
+                                         write profile value
+        lod_levels (list or None): [reduction percentage, camera distance]
+                                   pairs to write decimated LOD caches. None
+                                   uses the write profile value
+        evaluation (str or None): rig evaluation mode used while writing,
+                                  scene, parallel or cached_playback. None
+                                  uses the write profile value
     """
 
     # checks for plugin load
@@ -145,29 +372,152 @@ def generate_gpu_cache(geo_node, cache_name, start, end, rig_node, lock=False):
     # gets cache destination path
     cache_destination = get_cache_destination_path()
 
+    # gets the local cache path written before publishing to the destination
+    local_destination = get_local_cache_path()
+    write_destination = local_destination or cache_destination
+    if local_destination and not os.path.exists(local_destination):
+        os.makedirs(local_destination)
+
+    # gets write profile settings. The sampling of a previous cache is kept
+    # unless the profile is explicitly given
+    recorded = None
+    if not profile:
+        recorded = (get_cache_sampling(rig_node) or
+                    _DELETED_CACHE_SAMPLING.get(rig_node))
+        profile = get_rig_write_profile_name(rig_node)
+    settings = get_write_profile(profile)
+    if recorded:
+        settings["simulation_rate"] = recorded["simulation_rate"]
+        settings["sample_multiplier"] = recorded["sample_multiplier"]
+
+    # sampling overrides
+    if simulation_rate:
+        settings["simulation_rate"] = simulation_rate
+    if sample_multiplier:
+        settings["sample_multiplier"] = sample_multiplier
+    if lod_levels is not None:
+        settings["lod_levels"] = lod_levels
+    if evaluation:
+        settings["evaluation"] = evaluation
+
     try:
         file_name = re.sub('[^\w_.)( -]', '_', cache_name)
         file_name += "_{}".format(get_time_stamp())
-        # Runs the GPU cache generation
-        gpu_file = cmds.gpuCache("{}".format(geo_node),
-                                 startTime=start,
-                                 endTime=end,
-                                 optimize=True,
-                                 optimizationThreshold=4000,
-                                 writeMaterials=True,
-                                 directory=cache_destination,
-                                 fileName=file_name,
-                                 showStats=True,
-                                 useBaseTessellation=False,
-                                 saveMultipleFiles=True)
-
-        # loads gpu cache
-        return load_gpu_cache(cache_name, gpu_file[0], rig_node, lock)
+
+        generate_start = time.time()
+        with rig_evaluation(settings["evaluation"], start,
+                            end) as fill_seconds:
+            # Runs the GPU cache generation
+            write_start = time.time()
+            gpu_file = __write_gpu_cache(geo_node, file_name, start, end,
+                                         settings, write_destination)
+            write_seconds = time.time() - write_start
+
+            # Runs the LOD GPU caches generation
+            lod_files = []
+            for i, (reduction, distance) in enumerate(
+                    settings["lod_levels"]):
+                proxy_group = __create_lod_proxy_group(geo_node, reduction)
+                try:
+                    lod_file = __write_gpu_cache(
+                        proxy_group, "{}_lod{}".format(file_name, i + 1),
+                        start, end, settings, write_destination)
+                    lod_files.append((lod_file[0], distance))
+                finally:
+                    cmds.delete(proxy_group)
+
+        # reports the rig evaluation cost
+        samples = int((end - start) / settings["simulation_rate"]) + 1
+        frame_seconds = __print_evaluation_timing(
+            rig_node, settings["evaluation"], samples, fill_seconds,
+            write_seconds)
+
+        # records the cache generation metrics
+        files = [gpu_file[0]] + [x[0] for x in lod_files]
+        metrics.record(rig_node, metrics.GENERATE_GPU_CACHE,
+                       time.time() - generate_start, frames=samples,
+                       size=sum(os.path.getsize(x) for x in files),
+                       frame_seconds=frame_seconds,
+                       evaluation=settings["evaluation"],
+                       profile=profile)
+
+        # publishes the local cache files to the destination
+        publish_files = files
+        if local_destination:
+            publish_files = [publish_local_file(x, cache_destination)
+                             for x in files]
+
+        # registers the cache files on the destination inventory
+        register_cache_files(publish_files, rig_node,
+                             destination=cache_destination)
+
+        # records the profile and sampling used to write the cache on the
+        # cache node
+        metadata = {"cache_profile": profile,
+                    "cache_profile_settings": json.dumps(settings,
+                                                         sort_keys=True),
+                    "cache_start_frame": start,
+                    "cache_end_frame": end,
+                    "cache_simulation_rate": settings["simulation_rate"],
+                    "cache_sample_multiplier": settings["sample_multiplier"],
+                    "cache_evaluation": settings["evaluation"],
+                    "cache_frame_seconds": frame_seconds}
+
+        with metrics.measure(rig_node, metrics.LOAD_GPU_CACHE):
+            # loads gpu cache
+            gpu_node = load_gpu_cache(cache_name, gpu_file[0], rig_node,
+                                      lock, metadata, publish_files[0])
+
+            # loads lod gpu caches
+            if lod_files:
+                load_lod_gpu_caches(cache_name, lod_files, lock,
+                                    publish_files=publish_files[1:])
+
+        # keeps the local cache folder under its quota
+        if local_destination:
+            evict_local_cache(local_destination, get_local_cache_size())
+
+        return gpu_node
 
     except Exception as e:
         raise e
 
 
+def get_cache_publish_path(gpu_node):
+    """ Returns the cache file path of the given node on the shared destination
+
+    Args:
+        gpu_node (str): gpu cache node
+
+    Returns:
+        str: published cache file path
+    """
+
+    if cmds.objExists("{}.cache_publish_path".format(gpu_node)):
+        return cmds.getAttr("{}.cache_publish_path".format(gpu_node))
+
+    return get_cache_file_path(gpu_node)
+
+
+def get_cache_file_path(gpu_node):
+    """ Returns the cache file of the given gpu cache node
+
+    The path recorded by the cache manager when loading the cache is used
+    first, falling back to the cacheFileName attribute.
+
+    Args:
+        gpu_node (str): gpu cache node
+
+    Returns:
+        str: cache file path
+    """
+
+    if cmds.objExists("{}.cache_file_path".format(gpu_node)):
+        return cmds.getAttr("{}.cache_file_path".format(gpu_node))
+
+    return cmds.getAttr("{}.cacheFileName".format(gpu_node))
+
+
 def install_script_job(function):
     """ Adds a script job for file read and scene opened
     """
@@ -208,6 +558,10 @@ def kill_ui(name):
     if not widget:
         return
 
+    # Qt is imported here so the cache generation works on headless sessions
+    from PySide2 import QtWidgets
+    from shiboken2 import wrapInstance
+
     # wraps the widget into a qt object
     qt_object = wrapInstance(long(widget), QtWidgets.QDialog)
 
@@ -219,7 +573,8 @@ def kill_ui(name):
     del(qt_object)
 
 
-def load_gpu_cache(node_name, gpu_file, rig_node, lock):
+def load_gpu_cache(node_name, gpu_file, rig_node, lock, metadata=None,
+                   publish_file=None):
     """ Generic method to load gpu cache files into a Maya scene
 
     Args:
@@ -227,6 +582,10 @@ def load_gpu_cache(node_name, gpu_file, rig_node, lock):
         gpu_file (str): file name to use for the gpu cache file
         rig_node (str): Rig root node containing the geo_node
         lock (bool): Whether or not the gpu cache node should be locked
+        metadata (dict or None): string attributes to record on the gpu cache
+                                 node, like the write profile used
+        publish_file (str or None): cache file path on the shared destination
+                                    when gpu_file is a local copy
 
     Returns:
         str: the gpu cache node created
@@ -259,12 +618,140 @@ def load_gpu_cache(node_name, gpu_file, rig_node, lock):
                  cmds.getAttr("{}.visibility".format(rig_node), lock=True),
                  lock=True)
 
+    # adds the cache file state
+    __add_cache_file_attributes(gpu_node, gpu_file, publish_file)
+
+    # adds the cache metadata
+    for key, value in sorted((metadata or {}).items()):
+        cmds.addAttr(gpu_node, longName=key, dataType="string")
+        cmds.setAttr("{}.{}".format(gpu_node, key), "{}".format(value),
+                     type="string", lock=True)
+
     cmds.lockNode(gpu_node, lock=lock)
     cmds.lockNode("{}_cache".format(node_name), lock=lock)
 
     return gpu_node
 
 
+def load_lod_gpu_caches(node_name, lod_files, lock, camera=None,
+                        publish_files=None):
+    """ Loads LOD gpu cache files next to a loaded gpu cache
+
+    The LOD caches are added as extra gpuCache shapes under the cache
+    transform. A distanceBetween node measures the distance from the camera
+    to the full resolution cache bounding box center and only the shape for
+    that distance is kept visible.
+
+    Args:
+        node_name (str): gpu cache node name used to load the full cache
+        lod_files (list): (gpu cache file, minimum camera distance) pairs
+                          sorted by distance
+        lock (bool): Whether or not the gpu cache nodes should be locked
+        camera (str or None): camera driving the switch. None uses the
+                              focused viewport camera
+        publish_files (list or None): cache file paths on the shared
+                                      destination when the LOD files are
+                                      local copies
+
+    Returns:
+        list: the LOD gpu cache nodes created
+    """
+
+    cache_transform = "{}_cache".format(node_name)
+    cache_node = "{}_cacheShape".format(node_name)
+    camera = camera or __get_lod_camera()
+    publish_files = publish_files or [x[0] for x in lod_files]
+
+    cmds.lockNode(cache_transform, lock=False)
+
+    # measures the camera distance to the cache
+    distance = cmds.createNode("distanceBetween",
+                               name="{}_lod_distance".format(node_name))
+    cmds.connectAttr("{}.boundingBoxCenter".format(cache_node),
+                     "{}.point1".format(distance))
+    __connect_lod_camera(distance, camera)
+
+    # the active level is the number of level distances reached
+    level = cmds.createNode("plusMinusAverage",
+                            name="{}_lod_level".format(node_name))
+
+    lod_nodes = []
+    utility_nodes = []
+    for i, (lod_file, lod_distance) in enumerate(lod_files):
+        lod_node = cmds.createNode("gpuCache", parent=cache_transform,
+                                   name="{}_lod{}_cacheShape"
+                                   .format(node_name, i + 1))
+        cmds.setAttr("{}.cacheFileName".format(lod_node),
+                     "{}".format(lod_file), type="string")
+        cmds.addAttr(lod_node, longName="lod_distance", attributeType="float",
+                     defaultValue=lod_distance)
+        __add_cache_file_attributes(lod_node, lod_file, publish_files[i])
+
+        reached = cmds.createNode("condition",
+                                  name="{}_lod{}_reached"
+                                  .format(node_name, i + 1))
+        cmds.setAttr("{}.operation".format(reached), 3)  # greater or equal
+        cmds.connectAttr("{}.distance".format(distance),
+                         "{}.firstTerm".format(reached))
+        cmds.connectAttr("{}.lod_distance".format(lod_node),
+                         "{}.secondTerm".format(reached))
+        cmds.setAttr("{}.colorIfTrueR".format(reached), 1)
+        cmds.setAttr("{}.colorIfFalseR".format(reached), 0)
+        cmds.connectAttr("{}.outColorR".format(reached),
+                         "{}.input1D[{}]".format(level, i))
+        utility_nodes.append(reached)
+
+        lod_nodes.append(lod_node)
+
+    # shows each shape only on its level
+    for i, shape in enumerate([cache_node] + lod_nodes):
+        visible = cmds.createNode("condition",
+                                  name="{}_lod{}_visible"
+                                  .format(node_name, i))
+        cmds.connectAttr("{}.output1D".format(level),
+                         "{}.firstTerm".format(visible))
+        cmds.setAttr("{}.secondTerm".format(visible), i)
+        cmds.setAttr("{}.colorIfTrueR".format(visible), 1)
+        cmds.setAttr("{}.colorIfFalseR".format(visible), 0)
+        cmds.connectAttr("{}.outColorR".format(visible),
+                         "{}.visibility".format(shape))
+        utility_nodes.append(visible)
+
+    # links the utility nodes to the cache so they are deleted with it
+    cmds.addAttr(cache_transform, longName="lod_utility_nodes",
+                 attributeType="message", multi=True)
+    for i, utility_node in enumerate([distance, level] + utility_nodes):
+        cmds.connectAttr("{}.message".format(utility_node),
+                         "{}.lod_utility_nodes[{}]".format(cache_transform,
+                                                           i))
+
+    for lod_node in lod_nodes:
+        cmds.lockNode(lod_node, lock=lock)
+    cmds.lockNode(cache_transform, lock=lock)
+
+    return lod_nodes
+
+
+def update_lod_cameras(camera=None):
+    """ Connects the LOD switch of all the caches to the given camera
+
+    The LOD switch camera is resolved again when the caches are loaded on
+    an interactive session, as caches created on batch use the persp
+    camera.
+
+    Args:
+        camera (str or None): camera driving the switch. None uses the
+                              focused viewport camera
+    """
+
+    camera = camera or __get_lod_camera()
+    plugs = cmds.ls("*.lod_utility_nodes", recursive=True) or []
+    for distance in cmds.ls(cmds.listConnections(plugs, source=True,
+                                                 destination=False) or [],
+                            type="distanceBetween"):
+        __connect_lod_camera(distance, camera)
+
+
 def mute_and_hide_node(node):
     """ Mutes the visibility attribute on the given node and hides it
 
@@ -283,6 +770,94 @@ def mute_and_hide_node(node):
         cmds.setAttr("{}.visibility".format(node), False)
 
 
+@contextmanager
+def rig_evaluation(mode, start, end, timeout=600.0):
+    """ Sets up the rig evaluation used while writing GPU caches
+
+    - **scene**: the scene evaluation settings are kept
+    - **parallel**: the evaluation manager runs in parallel mode with the
+      invisibility evaluator enabled, so the hidden parts of the rig like the
+      controls are not evaluated
+    - **cached_playback**: parallel evaluation plus the cache evaluator
+      filled over the frame range before writing. The fill evaluates several
+      frames at once on all the cores and the cache write then reads the
+      deformed meshes back from memory
+
+    The previous evaluation settings and playback range are restored
+    afterwards.
+
+    Args:
+        mode (str): scene, parallel or cached_playback
+        start (float): first frame to write
+        end (float): last frame to write
+        timeout (float): maximum seconds to wait for the cache fill
+
+    Yields:
+        float: seconds spent filling the evaluation cache
+    """
+
+    evaluation_mode = cmds.evaluationManager(query=True, mode=True)[0]
+    playback_range = get_timeline_values()
+    evaluators = {}
+    fill_seconds = 0.0
+
+    try:
+        if mode in ("parallel", "cached_playback"):
+            cmds.evaluationManager(mode="parallel")
+            names = ["invisibility"]
+            if mode == "cached_playback":
+                names.append("cache")
+            for name in names:
+                evaluators[name] = cmds.evaluator(name=name, query=True,
+                                                  enable=True)
+                cmds.evaluator(name=name, enable=True)
+
+        # fills the evaluation cache over the frames to write
+        if mode == "cached_playback":
+            fill_start = time.time()
+            cmds.playbackOptions(minTime=start, maxTime=end)
+            cmds.cacheEvaluator(flushCache="destroy")
+            cmds.currentTime(start)
+            cmds.cacheEvaluator(waitForCache=timeout)
+            fill_seconds = time.time() - fill_start
+
+        yield fill_seconds
+
+    finally:
+        if mode == "cached_playback":
+            cmds.cacheEvaluator(flushCache="destroy")
+            cmds.playbackOptions(minTime=playback_range[0],
+                                 maxTime=playback_range[1])
+        for name, enabled in evaluators.items():
+            cmds.evaluator(name=name, enable=enabled)
+        if evaluators:
+            cmds.evaluationManager(mode=evaluation_mode)
+
+
+@contextmanager
+def suspend_scene_updates():
+    """ Suspends the viewport refresh and the evaluation manager
+
+    The evaluation manager is switched to DG mode so reference loads and
+    unloads don't rebuild the evaluation graph each time. Both settings are
+    restored afterwards, rebuilding the graph only once.
+    """
+
+    refresh_suspended = cmds.refresh(query=True, suspend=True)
+    evaluation_mode = cmds.evaluationManager(query=True, mode=True)[0]
+
+    try:
+        cmds.refresh(suspend=True)
+        if evaluation_mode != "off":
+            cmds.evaluationManager(mode="off")
+        yield
+
+    finally:
+        if evaluation_mode != "off":
+            cmds.evaluationManager(mode=evaluation_mode)
+        cmds.refresh(suspend=refresh_suspended)
+
+
 def unmute_and_show_node(node):
     """ Un-mutes the visibility attribute on the given node and show it
 
@@ -299,54 +874,123 @@ def unmute_and_show_node(node):
         cmds.setAttr("{}.visibility".format(node), 1)
 
 
-@contextmanager
-def set_gpu_color_override(model_group, color):
-    """ Creates a Maya render layer to override GPU caches display color
-    """
+class GpuColorOverride(object):
 
-    try:
-        cmds.undoInfo(openChunk=True)
+    def __init__(self, color):
+        """ Maya render layer overriding the GPU caches display color
+
+        The render layer, collection and shader are created once on open and
+        reused for every model group applied, so caching a batch of rigs with
+        the same color only pays the render setup cost once. The user render
+        setup is left untouched: only the nodes created here are deleted on
+        close.
+
+        Args:
+            color (tuple): red, green and blue values between 0 and 1
+        """
+
+        self.color = color
+        self.is_open = False
+
+        self.__render_setup = None
+        self.__previous_layer = None
+        self.__layer = None
+        self.__collection = None
+        self.__shader = None
+
+    def apply(self, model_group):
+        """ Sets the given model group as the one getting the color override
+
+        Args:
+            model_group (str): group node containing the shapes to cache
+        """
 
-        # creates a new instance of the render setup and force clear
-        render_setup = renderSetup.instance()
-        render_setup.clearAll()
+        if not self.is_open:
+            self.open()
 
-        # force deleting unused shading nodes
-        mel.eval('MLdeleteUnused;')
+        self.__collection.getSelector().setPattern(model_group)
+
+    def close(self):
+        """ Restores the visible render layer and deletes the override nodes
+        """
+
+        if not self.is_open:
+            return
+
+        start = time.time()
+        try:
+            # switch back to the layer visible before the override
+            self.__render_setup.switchToLayer(self.__previous_layer)
+
+            # deletes cache manager render layer
+            self.__render_setup.detachRenderLayer(self.__layer)
+            renderLayer.delete(self.__layer)
+
+            # deletes the shader and the shading groups using it
+            shading_groups = cmds.listConnections(
+                self.__shader, type="shadingEngine") or []
+            cmds.delete([self.__shader] + list(set(shading_groups)))
+
+        finally:
+            self.is_open = False
+
+        print("Cache manager color override closed in {:.3f}s"
+              .format(time.time() - start))
+
+    def open(self):
+        """ Creates the render layer, collection, shader and override
+        """
+
+        if self.is_open:
+            return
+
+        start = time.time()
+        self.is_open = True
+
+        self.__render_setup = renderSetup.instance()
+        self.__previous_layer = self.__render_setup.getVisibleRenderLayer()
 
         # creates render layer
-        color_layer = render_setup.createRenderLayer("cache_manager_rl")
+        self.__layer = self.__render_setup.createRenderLayer(
+            "cache_manager_rl")
 
         # creates collection
-        collection = color_layer.createCollection("cache_manager_override")
-
-        # adds model group into the collection of the render layer
-        collection.getSelector().setPattern(model_group)
+        self.__collection = self.__layer.createCollection(
+            "cache_manager_override")
 
         # creates shader
-        mat = cmds.shadingNode("phong", asShader=True,
-                               name="cache_manager_display_phong")
-        cmds.setAttr("{}.color".format(mat), color[0], color[1], color[2])
-        cmds.setAttr("{}.specularColor".format(mat), 0.1, 0.1, 0.1)
+        self.__shader = cmds.shadingNode("phong", asShader=True,
+                                         name="cache_manager_display_phong")
+        cmds.setAttr("{}.color".format(self.__shader), self.color[0],
+                     self.color[1], self.color[2])
+        cmds.setAttr("{}.specularColor".format(self.__shader), 0.1, 0.1, 0.1)
 
         # create override and sets shader
-        override = collection.createOverride('shading_override',
-                                             typeIDs.shaderOverride)
-        override.setShader(mat)
+        override = self.__collection.createOverride('shading_override',
+                                                    typeIDs.shaderOverride)
+        override.setShader(self.__shader)
 
-        render_setup.switchToLayer(color_layer)
-        yield
+        self.__render_setup.switchToLayer(self.__layer)
 
-    finally:
-        # switch back to default render layer
-        render_setup.switchToLayer(render_setup.getDefaultRenderLayer())
+        print("Cache manager color override opened in {:.3f}s"
+              .format(time.time() - start))
 
-        # deletes cache manager render layer
-        render_setup.detachRenderLayer(color_layer)
-        renderLayer.delete(color_layer)
 
-        # force deleting unused shading nodes
-        mel.eval('MLdeleteUnused;')
+@contextmanager
+def set_gpu_color_override(model_group, color):
+    """ Creates a Maya render layer to override GPU caches display color
+
+    Use a GpuColorOverride directly to reuse the override for several rigs
+    """
+
+    override = GpuColorOverride(color)
+    try:
+        cmds.undoInfo(openChunk=True)
+        override.apply(model_group)
+        yield override
+
+    finally:
+        override.close()
         cmds.undoInfo(closeChunk=True)
 
 
@@ -388,22 +1032,18 @@ def set_preference_file_setting(setting, value):
         value (str / bool): value for the setting
     """
 
-    # preference file
-    pref_file = get_preference_file()
+    set_preference_file_settings({setting: value})
 
-    try:
-        # reads file
-        pref_file = open(get_preference_file(), "r")
 
-        # edits path
-        data = json.load(pref_file)
-        data[setting] = value
-        pref_file.close()
+def set_preference_file_settings(settings):
+    """ Saves several settings into the preference file with a single write
 
-        # writes file
-        pref_file = open(get_preference_file(), "w")
-        json.dump(data, pref_file, indent=4)
-        pref_file.close()
+    Args:
+        settings (dict): names and values of the settings to store
+    """
+
+    try:
+        get_preference_store(get_preference_file()).update(settings)
 
     except Exception as e:
         message = "Contact mGear's developers reporting this issue to get help"
@@ -412,11 +1052,18 @@ def set_preference_file_setting(setting, value):
         return None
 
 
-def load_rig(rig_node):
+def load_rig(rig_node, load_reference=True):
     """ Brings back the rig
 
     Args:
         rig_node (str): The rig root node name
+        load_reference (bool): Whether or not the unloaded rig reference is
+                               loaded. Used by load_rigs to group the
+                               reference loads
+
+    Returns:
+        str or None: the reference node left to load if load_reference is
+                     False
     """
 
     # this is a simple check if the cache actually exists to operate on it
@@ -424,7 +1071,12 @@ def load_rig(rig_node):
         return
 
     # gets file path
-    file_path = cmds.getAttr("{}_cacheShape.cacheFileName".format(rig_node))
+    file_path = get_cache_file_path("{}_cacheShape".format(rig_node))
+
+    # keeps the sampling for the next cache of the rig
+    sampling = get_cache_sampling(rig_node)
+    if sampling:
+        _DELETED_CACHE_SAMPLING[rig_node] = sampling
 
     # gets visibility state recorder
     visibility = cmds.getAttr("{}_cacheShape.visibility_is_locked"
@@ -432,6 +1084,18 @@ def load_rig(rig_node):
 
     # deletes cache file
     delete_cache_file(file_path)
+    publish_path = get_cache_publish_path("{}_cacheShape".format(rig_node))
+    if publish_path != file_path:
+        delete_cache_file(publish_path)
+
+    # deletes lod cache files
+    lod_nodes = [x for x in cmds.listRelatives(
+        "{}_cache".format(rig_node), shapes=True, fullPath=True,
+        type="gpuCache") or [] if cmds.objExists("{}.lod_distance".format(x))]
+    for lod_node in lod_nodes:
+        delete_cache_file(get_cache_file_path(lod_node))
+        if get_cache_publish_path(lod_node) != get_cache_file_path(lod_node):
+            delete_cache_file(get_cache_publish_path(lod_node))
 
     # reloads rig
     if cmds.objExists(rig_node):
@@ -454,15 +1118,55 @@ def load_rig(rig_node):
     else:
         ref_node = cmds.getAttr("{}_cacheShape.rig_reference_node"
                                 .format(rig_node))
-        cmds.file(lr=ref_node)
+        if load_reference:
+            cmds.file(lr=ref_node)
+            ref_node = None
 
-    # delete gpu node
+    # delete gpu node and its LOD switch utility nodes
+    utility_nodes = __get_lod_utility_nodes("{}_cache".format(rig_node))
     cmds.lockNode("{}_cache".format(rig_node), lock=False)
-    cmds.lockNode("{}_cacheShape".format(rig_node), lock=False)
-    cmds.delete("{}_cache".format(rig_node))
+    cmds.lockNode(["{}_cacheShape".format(rig_node)] + lod_nodes, lock=False)
+    cmds.delete(["{}_cache".format(rig_node)] + utility_nodes)
+
+    return ref_node
 
 
-def unload_rig(rig_node, method):
+def load_rigs(rig_nodes, batch=True):
+    """ Brings back the given rigs
+
+    On batch mode the viewport refresh and the evaluation graph rebuilds are
+    suspended while the rigs are processed and each reference is loaded only
+    once, after all the caches are removed. Maya loads references one at a
+    time, so there is still a file command per reference node. The time
+    spent is printed so it can be compared with the per rig path.
+
+    Args:
+        rig_nodes (list): The rig root node names
+        batch (bool): Whether or not the rigs are processed as a batch
+    """
+
+    start = time.time()
+
+    if not batch:
+        for rig_node in rig_nodes:
+            load_rig(rig_node)
+
+    else:
+        with suspend_scene_updates():
+            ref_nodes = []
+            for rig_node in rig_nodes:
+                ref_node = load_rig(rig_node, load_reference=False)
+                if ref_node and ref_node not in ref_nodes:
+                    ref_nodes.append(ref_node)
+
+            for ref_node in ref_nodes:
+                cmds.file(lr=ref_node)
+
+    __print_timing("Loaded", metrics.LOAD_RIG, rig_nodes, batch,
+                   time.time() - start)
+
+
+def unload_rig(rig_node, method, unload_reference=True):
     """ Hides or unloads the given rig
 
     Hiding method is using the visibility attribute. We would like to
@@ -473,11 +1177,21 @@ def unload_rig(rig_node, method):
     Args:
         rig_node (str): The rig root node name
         method (int): 0=hide, 1=unload
+        unload_reference (bool): Whether or not the rig reference is
+                                 unloaded. Used by unload_rigs to group the
+                                 reference unloads
+
+    Returns:
+        str or None: the reference node left to unload if unload_reference is
+                     False
     """
 
     # unload method when we unload reference file
     if method and cmds.referenceQuery(rig_node, rfn=True):
-        cmds.file(fr=cmds.referenceQuery(rig_node, rfn=True))
+        ref_node = cmds.referenceQuery(rig_node, rfn=True)
+        if not unload_reference:
+            return ref_node
+        cmds.file(fr=ref_node)
         return
 
     # check for the hide method
@@ -502,3 +1216,40 @@ def unload_rig(rig_node, method):
 
     # hide method when we just hide the rig node
     mute_and_hide_node(rig_node)
+
+
+def unload_rigs(rig_nodes, method, batch=True):
+    """ Hides or unloads the given rigs
+
+    On batch mode the viewport refresh and the evaluation graph rebuilds are
+    suspended while the rigs are processed and each reference is unloaded
+    only once, after all the rigs are processed. Maya unloads references one
+    at a time, so there is still a file command per reference node. The
+    time spent is printed so it can be compared with the per rig path.
+
+    Args:
+        rig_nodes (list): The rig root node names
+        method (int): 0=hide, 1=unload
+        batch (bool): Whether or not the rigs are processed as a batch
+    """
+
+    start = time.time()
+
+    if not batch:
+        for rig_node in rig_nodes:
+            unload_rig(rig_node, method)
+
+    else:
+        with suspend_scene_updates():
+            ref_nodes = []
+            for rig_node in rig_nodes:
+                ref_node = unload_rig(rig_node, method,
+                                      unload_reference=False)
+                if ref_node and ref_node not in ref_nodes:
+                    ref_nodes.append(ref_node)
+
+            for ref_node in ref_nodes:
+                cmds.file(fr=ref_node)
+
+    __print_timing("Unloaded", metrics.UNLOAD_RIG, rig_nodes, batch,
+                   time.time() - start)
@@ -0,0 +1,197 @@
+
+""" Cache manager session metrics
+
+Every phase of the cache generation (finding the model group, the display
+color override, writing, loading and unloading) records its timing here, per
+rig, together with the cache file sizes and frame rates. The session log can
+be exported as json or csv to track the cache throughput over time.
+"""
+
+# imports
+from __future__ import absolute_import
+import csv
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+# ==============================================================================
+# CONSTANTS
+# ==============================================================================
+
+FIND_MODEL_GROUP = "find_model_group"
+COLOR_OVERRIDE = "color_override"
+GENERATE_GPU_CACHE = "generate_gpu_cache"
+LOAD_GPU_CACHE = "load_gpu_cache"
+UNLOAD_RIG = "unload_rig"
+LOAD_RIG = "load_rig"
+_PHASES = (FIND_MODEL_GROUP, COLOR_OVERRIDE, GENERATE_GPU_CACHE,
+           LOAD_GPU_CACHE, UNLOAD_RIG, LOAD_RIG)
+_CSV_FIELDS = ["time", "rig", "phase", "seconds", "frames",
+               "frames_per_second", "size", "batch"]
+# ==============================================================================
+
+# metric records of the Maya session
+_SESSION = []
+
+
+def clear_session_metrics():
+    """ Deletes all the records of the session log
+    """
+
+    del _SESSION[:]
+
+
+def export_session_metrics(path):
+    """ Writes the session log to a json or csv file
+
+    The format is picked from the file extension, json being the default.
+
+    Args:
+        path (str): file path to write
+
+    Returns:
+        str: the written file path
+    """
+
+    records = get_session_metrics()
+
+    if path.lower().endswith(".csv"):
+        # the csv module writes bytes on python 2
+        if sys.version_info[0] < 3:
+            file_w = open(path, "wb")
+        else:
+            file_w = open(path, "w", newline="")
+
+        with file_w:
+            writer = csv.DictWriter(file_w, fieldnames=_CSV_FIELDS,
+                                    extrasaction="ignore")
+            writer.writeheader()
+            for record_data in records:
+                writer.writerow(record_data)
+    else:
+        with open(path, "w") as file_w:
+            json.dump({"records": records,
+                       "summary": summarize_session_metrics()},
+                      file_w, indent=4, sort_keys=True)
+
+    return path
+
+
+def format_rig_summary(rig_node):
+    """ Returns a single line text with the phase timings of the given rig
+
+    Args:
+        rig_node (str): rig node name
+
+    Returns:
+        str: rig summary text. Empty if nothing was recorded for the rig
+    """
+
+    rig = summarize_session_metrics().get(rig_node)
+    if not rig:
+        return ""
+
+    phases = ", ".join("{} {:.3f}s".format(x, rig["phases"][x])
+                       for x in _PHASES if rig["phases"].get(x))
+
+    return "{}: {:.3f}s ({}) {:.1f}MB at {:.1f} fps".format(
+        rig_node, rig["seconds"], phases, rig["size"] / (1024.0 ** 2),
+        rig["frames_per_second"])
+
+
+def get_session_metrics(rig_node=None):
+    """ Returns the records of the session log
+
+    Args:
+        rig_node (str or None): only returns the records of this rig
+
+    Returns:
+        list: metric records, oldest first
+    """
+
+    return [dict(x) for x in _SESSION
+            if rig_node is None or x["rig"] == rig_node]
+
+
+@contextmanager
+def measure(rig_node, phase, **values):
+    """ Records the time spent running the wrapped block
+
+    The record is not written if the block raises an exception.
+
+    Args:
+        rig_node (str): rig node name
+        phase (str): phase name
+        values (dict): extra values to record, like sizes or frames. The
+                       yielded dictionary can be updated inside the block
+
+    Yields:
+        dict: the extra values to record
+    """
+
+    start = time.time()
+    yield values
+    record(rig_node, phase, time.time() - start, **values)
+
+
+def record(rig_node, phase, seconds, **values):
+    """ Adds a record to the session log
+
+    Args:
+        rig_node (str): rig node name
+        phase (str): phase name
+        seconds (float): time spent
+        values (dict): extra values to record, like sizes or frames
+
+    Returns:
+        dict: the record added
+    """
+
+    record_data = {"time": time.time(),
+                   "rig": rig_node,
+                   "phase": phase,
+                   "seconds": seconds}
+    record_data.update(values)
+
+    if values.get("frames") and seconds > 0:
+        record_data.setdefault("frames_per_second",
+                               values["frames"] / seconds)
+
+    _SESSION.append(record_data)
+    return record_data
+
+
+def summarize_session_metrics():
+    """ Returns the session log totals per rig
+
+    Each rig entry has the seconds spent per phase, the total seconds, the
+    cache files size and the frame rate of the cache writes.
+
+    Returns:
+        dict: rig summary by rig node name
+    """
+
+    summary = {}
+    for record_data in _SESSION:
+        rig = summary.setdefault(record_data["rig"], {
+            "phases": dict((x, 0.0) for x in _PHASES),
+            "seconds": 0.0,
+            "size": 0,
+            "frames": 0.0})
+
+        rig["phases"][record_data["phase"]] = (
+            rig["phases"].get(record_data["phase"], 0.0) +
+            record_data["seconds"])
+        rig["seconds"] += record_data["seconds"]
+
+        if record_data["phase"] == GENERATE_GPU_CACHE:
+            rig["size"] += record_data.get("size", 0)
+            rig["frames"] += record_data.get("frames", 0.0)
+
+    for rig in summary.values():
+        write_seconds = rig["phases"][GENERATE_GPU_CACHE]
+        rig["frames_per_second"] = (rig["frames"] / write_seconds
+                                    if write_seconds else 0.0)
+
+    return summary
@@ -1,13 +1,28 @@
 
 # imports
 import os
+import re
 from PySide2 import QtCore
 from PySide2 import QtGui
-from mgear.animbits.cache_manager.query import is_rig
+from mgear.animbits.cache_manager.query import get_rig_asset_type, is_rig
+from mgear.animbits.cache_manager.validation import (
+    get_cache_status,
+    MISSING,
+    STALE)
 
 
 class CacheManagerStringListModel(QtCore.QAbstractListModel):
 
+    # custom roles used by the proxy model to filter and sort
+    NamespaceRole = QtCore.Qt.UserRole + 1
+    AssetTypeRole = QtCore.Qt.UserRole + 2
+    RigStateRole = QtCore.Qt.UserRole + 3
+    SortRole = QtCore.Qt.UserRole + 4
+
+    # shared icons between all model instances. Created on first use as
+    # QPixmaps can't be created before the QApplication exists
+    __icons = {}
+
     def __init__(self, items=[], parent=None):
         """ Custom list model for the cache manager
 
@@ -17,8 +32,59 @@ class CacheManagerStringListModel(QtCore.QAbstractListModel):
         """
         super(CacheManagerStringListModel, self).__init__(parent=parent)
 
-        self.__items = items
-        self.__icons_path = self.__get_resource_path()
+        self.__items = list(items or [])
+        self.__states = [self.__get_state(x) for x in self.__items]
+        self.__keys = [self.__get_keys(x) for x in self.__items]
+        self.__load_icons()
+
+    @classmethod
+    def __load_icons(cls):
+        """ Preloads the rig and cache icons shared by all the models
+        """
+
+        if cls.__icons:
+            return
+
+        icons_path = cls.__get_resource_path()
+        cls.__icons[True] = QtGui.QIcon(QtGui.QPixmap(
+            "{}/rig.png".format(icons_path)))
+        cls.__icons[False] = QtGui.QIcon(QtGui.QPixmap(
+            "{}/cache.png".format(icons_path)))
+
+    @staticmethod
+    def __get_state(rig_node):
+        """ Returns the rig/cache state and cache file status of the rig
+
+        Args:
+            rig_node (str): rig node name
+
+        Returns:
+            tuple: whether it is a rig and the cache file status
+        """
+
+        return is_rig(rig_node), get_cache_status(rig_node)
+
+    @staticmethod
+    def __get_keys(rig_node):
+        """ Returns the namespace, asset type and sort key of the rig
+
+        They are computed once when the rig is added to the model, so
+        filtering and sorting don't query the scene.
+
+        Args:
+            rig_node (str): rig node name
+
+        Returns:
+            tuple: namespace, asset type and sort key
+        """
+
+        # numbers are padded so crowd_2 sorts before crowd_10
+        sort_key = re.sub(r"\d+", lambda x: x.group().zfill(8),
+                          rig_node.lower())
+
+        namespace = rig_node.rpartition(":")[0]
+
+        return namespace, get_rig_asset_type(rig_node), sort_key
 
     @staticmethod
     def __get_resource_path():
@@ -41,18 +107,31 @@ class CacheManagerStringListModel(QtCore.QAbstractListModel):
         row = index.row()
         value = self.__items[row]
 
+        rig_state, status = self.__states[row]
+
+        if role == self.NamespaceRole:
+            return self.__keys[row][0]
+
+        if role == self.AssetTypeRole:
+            return self.__keys[row][1]
+
+        if role == self.RigStateRole:
+            return rig_state
+
+        if role == self.SortRole:
+            return self.__keys[row][2]
+
         if role == QtCore.Qt.ToolTipRole:
+            if status in (MISSING, STALE):
+                return "{} - {} cache file".format(value, status)
             return value
 
         if role == QtCore.Qt.DecorationRole:
-            if is_rig(value):
-                pixmap = QtGui.QPixmap("{}/rig.png"
-                                       .format(self.__icons_path))
-            else:
-                pixmap = QtGui.QPixmap("{}/cache.png"
-                                       .format(self.__icons_path))
-            icon = QtGui.QIcon(pixmap)
-            return icon
+            return self.__icons[rig_state]
+
+        if role == QtCore.Qt.ForegroundRole:
+            if status in (MISSING, STALE):
+                return QtGui.QBrush(QtGui.QColor(240, 80, 60))
 
         if role == QtCore.Qt.DisplayRole:
             return value
@@ -67,3 +146,153 @@ class CacheManagerStringListModel(QtCore.QAbstractListModel):
             return len(self.__items)
         else:
             return 0
+
+    def rigs(self):
+        """ Returns the rig names on the model
+
+        Returns:
+            list: rig names
+        """
+
+        return list(self.__items)
+
+    def set_rigs(self, rigs):
+        """ Updates the model to contain the given rigs
+
+        Rows are removed and inserted with their own signals instead of
+        resetting the model, so the view keeps its selection and only lays
+        out the changed rows.
+
+        Args:
+            rigs (list or None): rig names
+        """
+
+        rigs = list(rigs or [])
+        new_rigs = set(rigs)
+
+        # removes the missing rigs, contiguous rows at once from the end
+        rows = [i for i, x in enumerate(self.__items) if x not in new_rigs]
+        while rows:
+            last = rows.pop()
+            first = last
+            while rows and rows[-1] == first - 1:
+                first = rows.pop()
+
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            del self.__items[first:last + 1]
+            del self.__states[first:last + 1]
+            del self.__keys[first:last + 1]
+            self.endRemoveRows()
+
+        # appends the new rigs
+        current = set(self.__items)
+        added = [x for x in rigs if x not in current]
+        if added:
+            first = len(self.__items)
+            self.beginInsertRows(QtCore.QModelIndex(), first,
+                                 first + len(added) - 1)
+            self.__items.extend(added)
+            self.__states.extend(self.__get_state(x) for x in added)
+            self.__keys.extend(self.__get_keys(x) for x in added)
+            self.endInsertRows()
+
+    def update_states(self, rigs=None):
+        """ Re-evaluates the rig/cache state and cache status of given rigs
+
+        Only the rows which state changed emit the dataChanged signal so the
+        view does not repaint the whole list.
+
+        Args:
+            rigs (list or None): rig names to update. None updates all rows
+        """
+
+        if rigs is None:
+            rows = range(len(self.__items))
+        else:
+            rows = [self.__items.index(x) for x in rigs if x in self.__items]
+
+        for row in rows:
+            state = self.__get_state(self.__items[row])
+            if state == self.__states[row]:
+                continue
+
+            self.__states[row] = state
+            index = self.index(row, 0)
+            self.dataChanged.emit(index, index)
+
+
+class CacheManagerSortFilterProxyModel(QtCore.QSortFilterProxyModel):
+
+    def __init__(self, parent=None):
+        """ Sorts and filters the cache manager rigs
+
+        The rigs can be filtered by name, namespace, asset type and state
+        using the keys precomputed by the source model.
+
+        Args:
+            parent (QtWidget): Parent widget
+        """
+        super(CacheManagerSortFilterProxyModel, self).__init__(parent=parent)
+
+        self.__namespace = None
+        self.__asset_type = None
+        self.__rig_state = None
+
+        self.setSortRole(CacheManagerStringListModel.SortRole)
+        self.setDynamicSortFilter(True)
+        self.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        """ Override QSortFilterProxyModel method
+
+        **filterAcceptsRow** checks the row against all the filters
+        """
+
+        index = self.sourceModel().index(source_row, 0, source_parent)
+        model = CacheManagerStringListModel
+
+        if (self.__namespace is not None and
+                index.data(model.NamespaceRole) != self.__namespace):
+            return False
+
+        if (self.__asset_type is not None and
+                index.data(model.AssetTypeRole) != self.__asset_type):
+            return False
+
+        if (self.__rig_state is not None and
+                index.data(model.RigStateRole) != self.__rig_state):
+            return False
+
+        return super(CacheManagerSortFilterProxyModel,
+                     self).filterAcceptsRow(source_row, source_parent)
+
+    def set_asset_type_filter(self, asset_type):
+        """ Only shows the rigs of the given asset type
+
+        Args:
+            asset_type (str or None): asset type. None shows all the types
+        """
+
+        self.__asset_type = asset_type
+        self.invalidateFilter()
+
+    def set_namespace_filter(self, namespace):
+        """ Only shows the rigs inside the given namespace
+
+        Args:
+            namespace (str or None): namespace. None shows all namespaces
+        """
+
+        self.__namespace = namespace
+        self.invalidateFilter()
+
+    def set_rig_state_filter(self, rig_state):
+        """ Only shows the rigs or the caches
+
+        Args:
+            rig_state (bool or None): True for rigs, False for caches. None
+                                      shows both
+        """
+
+        self.__rig_state = rig_state
+        self.invalidateFilter()
@@ -0,0 +1,208 @@
+
+# imports
+from __future__ import absolute_import
+import os
+import json
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# ==============================================================================
+# CONSTANTS
+# ==============================================================================
+
+# minimum amount of seconds between two checks of the preference file mtime
+_STAT_INTERVAL = 1.0
+# ==============================================================================
+
+# process wide stores, one per preference file
+_STORES = {}
+
+
+class PreferenceStore(object):
+
+    def __init__(self, path):
+        """ In memory representation of a json preference file
+
+        The file is read once and then only re-read when its modification time
+        changes. Changes are written back atomically through a temporary file
+        that gets renamed over the preference file.
+
+        Args:
+            path (str): path and name to the preference file
+        """
+
+        self.path = path
+
+        self.__data = None
+        self.__mtime = None
+        self.__checked = 0.0
+        self.__batch_depth = 0
+        self.__dirty = False
+        self.__lock = threading.RLock()
+
+    def __refresh(self, force=False):
+        """ Reloads the file content if it changed on disk
+
+        Args:
+            force (bool): whether or not the stat throttling is ignored
+        """
+
+        now = time.time()
+        if (not force and self.__data is not None and
+                now - self.__checked < _STAT_INTERVAL):
+            return
+
+        self.__checked = now
+        mtime = os.stat(self.path).st_mtime
+
+        if self.__data is not None and mtime == self.__mtime:
+            return
+
+        with open(self.path, "r") as file_r:
+            self.__data = json.load(file_r)
+        self.__mtime = mtime
+
+    @contextmanager
+    def batch(self):
+        """ Groups several setting changes into a single file write
+        """
+
+        with self.__lock:
+            self.__batch_depth += 1
+            try:
+                yield self
+            finally:
+                self.__batch_depth -= 1
+                if not self.__batch_depth and self.__dirty:
+                    self.write()
+
+    def get(self, key):
+        """ Returns the value stored for the given key
+
+        Args:
+            key (str): name of the setting
+
+        Returns:
+            the setting value
+
+        Raises:
+            KeyError: if the setting is not in the preference file
+        """
+
+        with self.__lock:
+            self.__refresh()
+            return self.__data[key]
+
+    def invalidate(self):
+        """ Forces the next access to stat and read the preference file
+        """
+
+        with self.__lock:
+            self.__data = None
+            self.__mtime = None
+
+    def pop(self, key):
+        """ Removes the given key
+
+        The file gets written right away unless we are inside a batch
+
+        Args:
+            key (str): name of the setting
+        """
+
+        with self.__lock:
+            self.__refresh(force=True)
+            if self.__data.pop(key, None) is None:
+                return
+            self.__dirty = True
+
+            if not self.__batch_depth:
+                self.write()
+
+    def keys(self):
+        """ Returns the names of the stored settings
+
+        Returns:
+            list: setting names
+        """
+
+        with self.__lock:
+            self.__refresh()
+            return list(self.__data)
+
+    def set(self, key, value):
+        """ Sets the value for the given key
+
+        The file gets written right away unless we are inside a batch
+
+        Args:
+            key (str): name of the setting
+            value: json serializable value for the setting
+        """
+
+        self.update({key: value})
+
+    def update(self, settings):
+        """ Sets all the given settings with a single file write
+
+        Args:
+            settings (dict): setting names and values
+        """
+
+        with self.__lock:
+            self.__refresh(force=True)
+            self.__data.update(settings)
+            self.__dirty = True
+
+            if not self.__batch_depth:
+                self.write()
+
+    def write(self):
+        """ Writes the in memory preferences into the preference file
+
+        The data is dumped into a temporary file next to the preference file
+        which is then renamed over it, so readers never see a partial file.
+        """
+
+        with self.__lock:
+            folder = os.path.dirname(self.path)
+            handle, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+
+            try:
+                with os.fdopen(handle, "w") as file_w:
+                    json.dump(self.__data, file_w, indent=4)
+
+                # os.rename can't overwrite files on Windows
+                if hasattr(os, "replace"):
+                    os.replace(temp_path, self.path)
+                else:
+                    if os.name == "nt" and os.path.exists(self.path):
+                        os.remove(self.path)
+                    os.rename(temp_path, self.path)
+
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            self.__dirty = False
+            self.__mtime = os.stat(self.path).st_mtime
+            self.__checked = time.time()
+
+
+def get_preference_store(path):
+    """ Returns the process wide preference store for the given file
+
+    Args:
+        path (str): path and name to the preference file
+
+    Returns:
+        PreferenceStore: the preference store
+    """
+
+    if path not in _STORES:
+        _STORES[path] = PreferenceStore(path)
+
+    return _STORES[path]
@@ -2,19 +2,56 @@
 # imports
 from __future__ import absolute_import
 from datetime import datetime
+import fnmatch
 import os
-import json
 from maya import cmds
+from mgear.animbits.cache_manager.preferences import get_preference_store
 
 # ==============================================================================
 # CONSTANTS
 # ==============================================================================
 
 _MANAGER_CACHE_DESTINATION = os.getenv("MGEAR_CACHE_MANAGER_CACHE_DESTINATION")
+_MANAGER_LOCAL_CACHE = os.getenv("MGEAR_CACHE_MANAGER_LOCAL_CACHE")
+_MANAGER_LOCAL_CACHE_SIZE = os.getenv("MGEAR_CACHE_MANAGER_LOCAL_CACHE_SIZE")
 _MANAGER_MODEL_GROUP = os.getenv("MGEAR_CACHE_MANAGER_MODEL_GROUP")
 _MANAGER_PREFERENCE_FILE = "animbits_cache_manager.json"
 _MANAGER_PREFERENCE_PATH = "{}/mGear".format(os.getenv("MAYA_APP_DIR"))
 _MANAGER_RIG_ATTRIBUTE = os.getenv("MGEAR_CACHE_MANAGER_RIG_ATTRIBUTE")
+_MANAGER_DEFAULT_PROFILE = "default"
+# rig evaluation used while writing caches. scene keeps the scene settings,
+# parallel forces the parallel evaluation manager and cached_playback fills
+# the evaluation cache on all cores before writing
+_MANAGER_EVALUATION_MODES = ("scene", "parallel", "cached_playback")
+_MANAGER_WRITE_PROFILES = {
+    # the settings used by the cache manager before profiles existed
+    "default": {"optimize": True,
+                "optimization_threshold": 4000,
+                "write_materials": True,
+                "simulation_rate": 1.0,
+                "sample_multiplier": 1,
+                "save_multiple_files": True,
+                "evaluation": "scene",
+                "lod_levels": []},
+    # full density, every shape kept on its own and materials written
+    "hero": {"optimize": False,
+             "optimization_threshold": 4000,
+             "write_materials": True,
+             "simulation_rate": 1.0,
+             "sample_multiplier": 1,
+             "save_multiple_files": True,
+             "evaluation": "parallel",
+             "lod_levels": []},
+    # background characters with aggressive merging and no materials
+    "crowd": {"optimize": True,
+              "optimization_threshold": 40000,
+              "write_materials": False,
+              "simulation_rate": 1.0,
+              "sample_multiplier": 1,
+              "save_multiple_files": False,
+              "evaluation": "cached_playback",
+              # [reduction percentage, camera distance] LOD caches
+              "lod_levels": [[50.0, 25.0], [85.0, 75.0]]}}
 # ==============================================================================
 
 
@@ -59,6 +96,37 @@ def find_model_group_inside_rig(geo_node, rig_node):
         raise e
 
 
+def get_cache_sampling(rig_node):
+    """ Returns the sampling recorded on the cache node of the given rig
+
+    Caches generated with the cache manager record their frame range and
+    sampling settings so the same values can be used when the rig gets cached
+    again.
+
+    Args:
+        rig_node (str): rig node name
+
+    Returns:
+        dict or None: start, end, simulation_rate and sample_multiplier values
+                      or None if the rig has no cache or no sampling recorded
+    """
+
+    cache_node = "{}_cacheShape".format(rig_node)
+    keys = {"start": ("cache_start_frame", float),
+            "end": ("cache_end_frame", float),
+            "simulation_rate": ("cache_simulation_rate", float),
+            "sample_multiplier": ("cache_sample_multiplier", int)}
+
+    sampling = {}
+    for key, (attr, cast) in keys.items():
+        plug = "{}.{}".format(cache_node, attr)
+        if not cmds.objExists(plug):
+            return
+        sampling[key] = cast(float(cmds.getAttr(plug)))
+
+    return sampling
+
+
 def get_cache_destination_path():
     """ Returns the cache destination path
 
@@ -106,6 +174,46 @@ def get_time_stamp():
     return datetime.now().strftime('%y-%m-%d_%H-%M-%S')
 
 
+def get_local_cache_path():
+    """ Returns the local scratch folder used in front of the destination path
+
+    When set, caches are written to this local folder and published to the
+    cache destination path in the background, and gpu cache nodes read the
+    local copy. Caches only found on the destination get copied locally.
+
+    The **MGEAR_CACHE_MANAGER_LOCAL_CACHE** environment variable is used
+    first, then the **cache_manager_local_cache_path** preference.
+
+    Returns:
+        str or None: local cache folder or None if there is no local tier
+    """
+
+    if _MANAGER_LOCAL_CACHE:
+        return _MANAGER_LOCAL_CACHE
+
+    local_path = read_optional_preference_key(
+        "cache_manager_local_cache_path")
+
+    return local_path or None
+
+
+def get_local_cache_size():
+    """ Returns the size quota of the local scratch folder
+
+    The **MGEAR_CACHE_MANAGER_LOCAL_CACHE_SIZE** environment variable is used
+    first, then the **cache_manager_local_cache_size** preference. Both
+    values are in gigabytes and default to 50.
+
+    Returns:
+        int: size quota in bytes
+    """
+
+    size = _MANAGER_LOCAL_CACHE_SIZE or read_optional_preference_key(
+        "cache_manager_local_cache_size", 50)
+
+    return int(float(size) * 1024 ** 3)
+
+
 def get_model_group(ignore_selection=False):
     """ Returns the model group name to cache
 
@@ -179,6 +287,73 @@ def get_preference_file_model_group():
     return read_preference_key(search_key="cache_manager_model_group")
 
 
+def get_rig_asset_type(rig_node):
+    """ Returns the asset type of the given rig
+
+    The asset type is the base name of the file the rig is referenced from.
+    Rigs already cached get it from the reference node recorded on their gpu
+    cache node.
+
+    Args:
+        rig_node (str): rig node name
+
+    Returns:
+        str: the asset type or an empty string for non referenced rigs
+    """
+
+    try:
+        if cmds.objExists(rig_node):
+            path = cmds.referenceQuery(rig_node, filename=True,
+                                       withoutCopyNumber=True)
+        else:
+            ref_node = cmds.getAttr("{}_cacheShape.rig_reference_node"
+                                    .format(rig_node))
+            path = cmds.referenceQuery(ref_node, filename=True,
+                                       withoutCopyNumber=True)
+    except (RuntimeError, ValueError):
+        return ""
+
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def get_rig_write_profile_name(rig_node):
+    """ Returns the write profile name to use for the given rig
+
+    The profile rules stored on the preference file are evaluated in order
+    and the first matching rule wins. A rule is a dictionary with a
+    **profile** key and either a **rig** key, holding a rig node name or
+    wildcard pattern, or an **attribute** key with an optional **value** key
+    to match an attribute found on the rig node.
+
+    Args:
+        rig_node (str): rig node name
+
+    Returns:
+        str: write profile name
+    """
+
+    rules = read_optional_preference_key("cache_manager_profile_rules", [])
+
+    for rule in rules:
+        profile = rule.get("profile")
+        if not profile:
+            continue
+
+        # rig name match
+        if "rig" in rule and fnmatch.fnmatchcase(rig_node, rule["rig"]):
+            return profile
+
+        # rig attribute match
+        if "attribute" in rule:
+            plug = "{}.{}".format(rig_node, rule["attribute"])
+            if not cmds.objExists(plug):
+                continue
+            if "value" not in rule or cmds.getAttr(plug) == rule["value"]:
+                return profile
+
+    return _MANAGER_DEFAULT_PROFILE
+
+
 def get_scene_rigs():
     """ The rigs from current Maya session
 
@@ -235,6 +410,57 @@ def get_timeline_values():
     return _min, _max
 
 
+def get_write_profile(name):
+    """ Returns the settings of the given write profile
+
+    Unknown profile names fall back to the default profile. Settings missing
+    on user profiles are taken from the default profile.
+
+    Args:
+        name (str): write profile name
+
+    Returns:
+        dict: write profile settings
+    """
+
+    profiles = get_write_profiles()
+    profile = dict(profiles[_MANAGER_DEFAULT_PROFILE])
+
+    if name not in profiles:
+        print("Write profile -{}- not found, using the {} profile"
+              .format(name, _MANAGER_DEFAULT_PROFILE))
+        return profile
+
+    profile.update(profiles[name])
+
+    if profile["evaluation"] not in _MANAGER_EVALUATION_MODES:
+        print("Evaluation mode -{}- not valid, using the scene evaluation"
+              .format(profile["evaluation"]))
+        profile["evaluation"] = "scene"
+
+    return profile
+
+
+def get_write_profiles():
+    """ Returns the GPU cache write profiles
+
+    The built-in profiles are extended or overridden by the profiles stored
+    on the **cache_manager_write_profiles** preference key.
+
+    Returns:
+        dict: write profile settings by profile name
+    """
+
+    profiles = dict((k, dict(v)) for k, v in _MANAGER_WRITE_PROFILES.items())
+    user_profiles = read_optional_preference_key(
+        "cache_manager_write_profiles", {})
+
+    for name, settings in user_profiles.items():
+        profiles.setdefault(name, {}).update(settings)
+
+    return profiles
+
+
 def is_rig(rig_node):
     """ Returns whether the given rig node is in srig state or caching state
 
@@ -249,6 +475,26 @@ def is_rig(rig_node):
     return True
 
 
+def read_optional_preference_key(search_key, default=None):
+    """ Returns the preference stored on the pref file for the given key
+
+    Unlike read_preference_key missing files or keys are not reported, which
+    suits settings older preference files don't have.
+
+    Args:
+        search_key (str): name of the setting
+        default: value returned if the setting is not found
+
+    Returns:
+        the setting value or the default value
+    """
+
+    try:
+        return get_preference_store(get_preference_file()).get(search_key)
+    except (IOError, OSError, KeyError, ValueError):
+        return default
+
+
 def read_preference_key(search_key):
     """ Returns the preference stored on the pref file for the given key
 
@@ -260,19 +506,17 @@ def read_preference_key(search_key):
     pref_file = get_preference_file()
 
     try:
-        with open(pref_file, 'r') as file_r:
-            # reads json file and get the preference
-            json_dict = json.load(file_r)
-            value = json_dict[search_key]
+        # reads the preference from the in memory store
+        value = get_preference_store(pref_file).get(search_key)
 
-            if type(value) == int:
-                return value
+        if type(value) == int:
+            return value
 
-            if len(value) and type(value) != int:
-                return value
+        if len(value) and type(value) != int:
+            return value
 
-            print("Key -{}- saved on preference file is invalid for {}"
-                  .format(value, search_key))
+        print("Key -{}- saved on preference file is invalid for {}"
+              .format(value, search_key))
 
     except Exception as e:
         message = "Contact mGear's developers reporting this issue to get help"
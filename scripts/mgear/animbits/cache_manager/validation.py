@@ -0,0 +1,165 @@
+
+# imports
+from __future__ import absolute_import
+import os
+from multiprocessing.pool import ThreadPool
+from maya import cmds
+from mgear.animbits.cache_manager.mayautils import (
+    get_cache_file_path,
+    get_cache_publish_path,
+    kill_script_job)
+from mgear.animbits.cache_manager.local_cache import fetch_publish_file
+
+# ==============================================================================
+# CONSTANTS
+# ==============================================================================
+
+VALID = "valid"
+MISSING = "missing"
+STALE = "stale"
+# number of threads used to stat the cache files. Network filesystems answer
+# slowly but in parallel
+_STAT_THREADS = 16
+# ==============================================================================
+
+# cache file status by rig name from the last validation
+_CACHE_STATUS = {}
+
+
+def __get_rig_link(node):
+    """ Returns the rig linked to the given gpu cache node
+
+    LOD gpu cache nodes get the rig from the main cache node sharing their
+    transform.
+
+    Args:
+        node (str): gpu cache node
+
+    Returns:
+        str or None: rig node name
+    """
+
+    transform = cmds.listRelatives(node, parent=True, fullPath=True)
+    shapes = cmds.listRelatives(transform, shapes=True, fullPath=True) or []
+
+    for shape in [node] + shapes:
+        if cmds.objExists("{}.rig_link".format(shape)):
+            return cmds.getAttr("{}.rig_link".format(shape))
+
+
+def __stat_file(paths):
+    """ Returns the modification time and size of the given cache file
+
+    Local cache files missing are copied from their published file first.
+
+    Args:
+        paths (tuple): cache file path and published cache file path
+
+    Returns:
+        tuple or None: mtime and size or None if the file is missing
+    """
+
+    path, publish_path = paths
+
+    try:
+        if not os.path.exists(path) and publish_path != path:
+            fetch_publish_file(publish_path, os.path.dirname(path))
+
+        stat = os.stat(path)
+        return stat.st_mtime, stat.st_size
+    except (OSError, IOError, TypeError):
+        return None
+
+
+def get_cache_manager_nodes():
+    """ Returns the gpu cache nodes created by the cache manager
+
+    Returns:
+        list: gpu cache nodes long names
+    """
+
+    return [x for x in cmds.ls(type="gpuCache", long=True) or []
+            if cmds.objExists("{}.rig_link".format(x)) or
+            cmds.objExists("{}.lod_distance".format(x))]
+
+
+def get_cache_status(rig_node):
+    """ Returns the cache file status found by the last validation
+
+    Args:
+        rig_node (str): rig node name
+
+    Returns:
+        str or None: valid, missing or stale. None if not validated
+    """
+
+    return _CACHE_STATUS.get(rig_node)
+
+
+def install_validation_script_job(function):
+    """ Adds a script job running the given function on scene opened
+
+    Args:
+        function (function): function to run
+    """
+
+    kill_script_job(function.__name__)
+    cmds.scriptJob(event=["SceneOpened", function])
+
+
+def validate_scene_caches():
+    """ Checks the cache files of all the cache manager gpu cache nodes
+
+    The files are checked with a batch of stat calls running on a thread pool
+    as network filesystems are slow to answer. Local cache files missing are
+    copied from the shared destination. A file is missing if it can't be
+    found and stale if its modification time or size changed since the
+    cache was loaded.
+
+    Returns:
+        dict: cache file status by rig node name
+    """
+
+    nodes = get_cache_manager_nodes()
+    paths = [get_cache_file_path(x) for x in nodes]
+
+    # stats the files in parallel
+    stats = []
+    if paths:
+        pool = ThreadPool(min(_STAT_THREADS, len(paths)))
+        try:
+            stats = pool.map(__stat_file, zip(
+                paths, [get_cache_publish_path(x) for x in nodes]))
+        finally:
+            pool.close()
+            pool.join()
+
+    statuses = {}
+    valid_nodes = []
+    for node, path, stat in zip(nodes, paths, stats):
+        if stat is None:
+            status = MISSING
+        elif (cmds.objExists("{}.cache_file_mtime".format(node)) and
+              (cmds.getAttr("{}.cache_file_mtime".format(node)), cmds.getAttr(
+                  "{}.cache_file_size".format(node))) != stat):
+            status = STALE
+        else:
+            status = VALID
+            valid_nodes.append(node)
+
+        if status != VALID:
+            cmds.warning("Cache manager: {} cache file for {}: {}"
+                         .format(status, node, path))
+
+        # keeps the worst status per rig
+        rig_node = __get_rig_link(node)
+        if statuses.get(rig_node, VALID) == VALID:
+            statuses[rig_node] = status
+
+    _CACHE_STATUS.clear()
+    _CACHE_STATUS.update(statuses)
+
+    print("Cache manager: validated {} caches, {} broken"
+          .format(len(nodes), len(nodes) - len(valid_nodes)))
+
+    return statuses
@@ -0,0 +1,244 @@
+"""
+softTweakStack deformer plugin
+
+Evaluates the falloff and matrices of many soft tweaks in a single vectorized
+pass over the mesh points, instead of one softMod deformer per tweak.
+The tweak inputs are connected from the same nodes driving the original
+softMod deformers, so the soft tweak controls keep working.
+
+Only the vertices member of the deformer are evaluated, consolidation makes
+them the union of the softMod deformers membership. The softMod weights and
+membership are stored per tweak on the tweakWeights attribute.
+
+The deformer only lives inside the Maya session. The soft tweaks are
+unconsolidated before a scene is saved and consolidated again after, so the
+scene files never contain the node and never require the plugin.
+
+The plugin is loaded by name from the plug-ins folder of the module, see
+plug-ins/softTweakStackNode.py
+"""
+
+import numpy as np
+
+from maya.api import OpenMaya as om
+from maya.api import OpenMayaAnim as oma
+
+
+# Maya api 2.0 plugin
+def maya_useNewAPI():
+    pass
+
+
+NODE_NAME = "softTweakStack"
+# NOTE: id from the 0x00000 - 0x7ffff local range. The node is never written
+# into the scene files, so the id is only used inside the session and a
+# collision with another plugin fails the registration instead of binding
+# the saved scenes to it
+NODE_ID = om.MTypeId(0x0007F4A0)
+
+
+# Convert a MMatrix to a 4x4 numpy array
+def _toArray(matrix):
+    return np.array([matrix.getElement(r, c)
+                     for r in range(4) for c in range(4)]).reshape(4, 4)
+
+
+# Get the falloff weights of the points for a falloff center and radius
+# using the smooth falloff curve of the softMod default
+def getFalloffWeights(points, center, radius):
+    if radius <= 0:
+        return np.zeros(len(points))
+    dist = np.sqrt(((points - center) ** 2).sum(axis=1))
+    t = np.clip(dist / radius, 0.0, 1.0)
+    return 1.0 - t * t * (3.0 - 2.0 * t)
+
+
+class SoftTweakStack(oma.MPxDeformerNode):
+
+    tweak = None
+    falloffCenter = None
+    falloffRadius = None
+    preMatrix = None
+    weightedMatrix = None
+    postMatrix = None
+    tweakEnvelope = None
+    tweakWeights = None
+    useGeomMatrix = None
+
+    def __init__(self):
+        oma.MPxDeformerNode.__init__(self)
+        # member indexes and stack weights by geometry index
+        self._members = {}
+
+    @staticmethod
+    def creator():
+        return SoftTweakStack()
+
+    @staticmethod
+    def initialize():
+        nAttr = om.MFnNumericAttribute()
+        mAttr = om.MFnMatrixAttribute()
+        cAttr = om.MFnCompoundAttribute()
+        tAttr = om.MFnTypedAttribute()
+
+        SoftTweakStack.falloffCenter = nAttr.createPoint("falloffCenter",
+                                                         "fc")
+        SoftTweakStack.falloffRadius = nAttr.create(
+            "falloffRadius", "fr", om.MFnNumericData.kDouble, 1.0)
+        SoftTweakStack.tweakEnvelope = nAttr.create(
+            "tweakEnvelope", "te", om.MFnNumericData.kFloat, 1.0)
+        nAttr.setMin(0.0)
+        nAttr.setMax(1.0)
+        SoftTweakStack.tweakWeights = tAttr.create(
+            "tweakWeights", "twt", om.MFnData.kDoubleArray)
+        SoftTweakStack.preMatrix = mAttr.create("preMatrix", "prm")
+        SoftTweakStack.weightedMatrix = mAttr.create("weightedMatrix", "wm")
+        SoftTweakStack.postMatrix = mAttr.create("postMatrix", "pom")
+
+        SoftTweakStack.tweak = cAttr.create("tweak", "tw")
+        cAttr.array = True
+        cAttr.usesArrayDataBuilder = True
+        for attr in (SoftTweakStack.falloffCenter,
+                     SoftTweakStack.falloffRadius,
+                     SoftTweakStack.tweakEnvelope,
+                     SoftTweakStack.tweakWeights,
+                     SoftTweakStack.preMatrix,
+                     SoftTweakStack.weightedMatrix,
+                     SoftTweakStack.postMatrix):
+            cAttr.addChild(attr)
+
+        SoftTweakStack.useGeomMatrix = nAttr.create(
+            "useGeomMatrix", "ugm", om.MFnNumericData.kBoolean, True)
+
+        SoftTweakStack.addAttribute(SoftTweakStack.tweak)
+        SoftTweakStack.addAttribute(SoftTweakStack.useGeomMatrix)
+
+        outputGeom = oma.MPxDeformerNode.outputGeom
+        SoftTweakStack.attributeAffects(SoftTweakStack.tweak, outputGeom)
+        SoftTweakStack.attributeAffects(SoftTweakStack.useGeomMatrix,
+                                        outputGeom)
+
+    def setDependentsDirty(self, plug, plugArray):
+        if plug.attribute() in (oma.MPxDeformerNode.weightList,
+                                oma.MPxDeformerNode.weights):
+            self._members.clear()
+
+    # Get the member vertex indexes from the component of the deformer group
+    # on the input geometry, in the iteration order of the points
+    def _getMemberIndexes(self, dataBlock, geoIter, multiIndex):
+        inputs = dataBlock.outputArrayValue(oma.MPxDeformerNode.input)
+        inputs.jumpToLogicalElement(multiIndex)
+        element = inputs.outputValue()
+        groupId = element.child(oma.MPxDeformerNode.groupId).asLong()
+        fnGeometry = om.MFnGeometryData(
+            element.child(oma.MPxDeformerNode.inputGeom).data())
+        if fnGeometry.hasObjectGroup(groupId):
+            fnComponent = om.MFnSingleIndexedComponent(
+                fnGeometry.objectGroupComponent(groupId))
+            if not fnComponent.isComplete:
+                return np.array(fnComponent.getElements(), dtype=int)
+        return np.arange(geoIter.exactCount())
+
+    # Get the member vertex indexes and their stack weights. The weights are
+    # cached until they are painted or the member indexes change
+    def _getMembers(self, dataBlock, geoIter, multiIndex):
+        indexes = self._getMemberIndexes(dataBlock, geoIter, multiIndex)
+        members = self._members.get(multiIndex)
+        if members is not None and np.array_equal(members[0], indexes):
+            return members
+
+        weights = [self.weightValue(dataBlock, multiIndex, index)
+                   for index in indexes.tolist()]
+        members = (indexes, np.array(weights))
+        self._members[multiIndex] = members
+        return members
+
+    def deform(self, dataBlock, geoIter, matrix, multiIndex):
+        envelope = dataBlock.inputValue(
+            oma.MPxDeformerNode.envelope).asFloat()
+        if not envelope:
+            return
+
+        tweaks = dataBlock.inputArrayValue(SoftTweakStack.tweak)
+        if not len(tweaks):
+            return
+
+        indexes, memberWeights = self._getMembers(dataBlock, geoIter,
+                                                  multiIndex)
+        if not len(indexes):
+            return
+
+        # positions of the member vertices only
+        mPoints = geoIter.allPositions()
+        points = np.array(mPoints)
+
+        # work in world space like the softMod deformers
+        if dataBlock.inputValue(SoftTweakStack.useGeomMatrix).asBool():
+            geomMatrix = _toArray(matrix)
+        else:
+            geomMatrix = np.identity(4)
+        worldPoints = points.dot(geomMatrix)
+
+        delta = np.zeros_like(worldPoints)
+        for i in range(len(tweaks)):
+            tweaks.jumpToPhysicalElement(i)
+            handle = tweaks.inputValue()
+            weight = handle.child(
+                SoftTweakStack.tweakEnvelope).asFloat() * envelope
+            if not weight:
+                continue
+
+            center = np.array(handle.child(
+                SoftTweakStack.falloffCenter).asFloat3())
+            radius = handle.child(SoftTweakStack.falloffRadius).asDouble()
+            weights = getFalloffWeights(worldPoints[:, :3], center, radius)
+            weights *= memberWeights * weight
+
+            # softMod weights, zero outside of the softMod membership
+            tweakWeights = np.array(om.MFnDoubleArrayData(handle.child(
+                SoftTweakStack.tweakWeights).data()).array())
+            if len(tweakWeights):
+                valid = indexes < len(tweakWeights)
+                weights[valid] *= tweakWeights[indexes[valid]]
+
+            affected = np.nonzero(weights)[0]
+            if not len(affected):
+                continue
+
+            # base control space, tweak control transform, back to world
+            tweakMatrix = (
+                _toArray(handle.child(
+                    SoftTweakStack.postMatrix).asMatrix()).dot(
+                    _toArray(handle.child(
+                        SoftTweakStack.weightedMatrix).asMatrix())).dot(
+                    _toArray(handle.child(
+                        SoftTweakStack.preMatrix).asMatrix())))
+
+            affectedPoints = worldPoints[affected]
+            delta[affected] += ((affectedPoints.dot(tweakMatrix) -
+                                 affectedPoints) *
+                                weights[affected][:, None])
+
+        # only the moved points go back into the point array
+        changed = np.nonzero(delta.any(axis=1))[0]
+        if not len(changed):
+            return
+        newPoints = (worldPoints[changed] + delta[changed]).dot(
+            np.linalg.inv(geomMatrix))
+        for index, point in zip(changed.tolist(), newPoints.tolist()):
+            mPoints[index] = om.MPoint(point)
+        geoIter.setAllPositions(mPoints)
+
+
+def initializePlugin(mobject):
+    plugin = om.MFnPlugin(mobject, "mGear", "1.0", "Any")
+    plugin.registerNode(NODE_NAME,
+                        NODE_ID,
+                        SoftTweakStack.creator,
+                        SoftTweakStack.initialize,
+                        om.MPxNode.kDeformerNode)
+
+
+def uninitializePlugin(mobject):
+    plugin = om.MFnPlugin(mobject)
+    plugin.deregisterNode(NODE_ID)
@@ -12,15 +12,19 @@ http://bindpose.com/help-animators-fix-intersections-softmod-deformer/
 # or subgroup
 
 import json
+import time
 
 import mgear.animbits.softTweakWindowUI as stUI
 import pymel.core as pm
+from maya import cmds
+from maya.api import OpenMaya as om
 from maya.app.general.mayaMixin import MayaQWidgetDockableMixin
 from mgear.core import pyqt, attribute, icon, node, primitive, applyop, skin
 from mgear.vendor.Qt import QtCore, QtWidgets, QtGui
 from pymel.core import datatypes
 
 from mgear.core import string
+from mgear.animbits.cache_manager.mayautils import suspend_scene_updates
 
 
 #########################################
@@ -31,6 +35,64 @@ from mgear.core import string
 ASSET_TAG = "_isAssetSoftTweak"
 SHOT_TAG = "_isSoftTweak"
 
+# used softTweak indexes by base name. Cleared when a scene is opened or
+# created and on undo
+_TWEAK_INDEXES = {}
+# remove the callbacks registered by a previous load of the module
+try:
+    om.MMessage.removeCallbacks(_TWEAK_INDEXES_CALLBACKS)
+except NameError:
+    pass
+_TWEAK_INDEXES_CALLBACKS = []
+# meshes unconsolidated while the scene is saved
+_SAVED_STACK_MESHES = []
+try:
+    om.MMessage.removeCallbacks(_STACK_SAVE_CALLBACKS)
+except NameError:
+    pass
+_STACK_SAVE_CALLBACKS = []
+
+# margin added to the falloff radius, as a ratio of the radius, when the
+# softMod membership is restricted to the falloff area
+RESTRICT_MARGIN = 0.25
+# falloff center or radius change, as a ratio of the radius, that refreshes
+# the restricted membership
+RESTRICT_THRESHOLD = 0.1
+
+# deformer plugin evaluating many soft tweaks at once
+STACK_PLUGIN = "softTweakStackNode"
+STACK_NODE = "softTweakStack"
+# softMod attributes driven by the tweak controls
+STACK_INPUTS = ["falloffCenter", "falloffRadius", "preMatrix",
+                "weightedMatrix", "postMatrix"]
+
+# blendShape target weight alias of the baked soft tweaks
+BAKE_TARGET = "bakedSoftTweaks"
+# every baked frame is an in-between of the target, and the in-between
+# weights have a resolution of 0.001
+BAKE_MAX_FRAMES = 1000
+# vertices moving less than this distance are not stored in the bake
+BAKE_TOLERANCE = 1e-5
+
+# colour set displaying the falloff preview weights
+PREVIEW_COLOR_SET = "softTweakFalloffPreview"
+# vertices per chunk of the falloff preview weights. Denser meshes are
+# computed in parallel chunks
+PREVIEW_CHUNK_SIZE = 65536
+PREVIEW_THREADS = 4
+# falloff previews by softMod name
+_FALLOFF_PREVIEWS = {}
+_PREVIEW_POOL = []
+# remove the callbacks stopping the previews of a previous load of the module
+try:
+    om.MMessage.removeCallbacks(_PREVIEW_CALLBACKS)
+except NameError:
+    pass
+_PREVIEW_CALLBACKS = []
+
+# manager list item role storing the tweak controls and affected objects
+CONNECTIONS_ROLE = QtCore.Qt.UserRole + 1
+
 # CREATORS -------------------------------
 # Create the controls for the softTweak
 
@@ -116,7 +178,8 @@ def _createSoftModTweak(baseCtl,
                         name,
                         targets,
                         nameExt="softMod",
-                        is_asset=False):
+                        is_asset=False,
+                        restrict=False):
 
     sm = pm.softMod(targets, wn=[tweakCtl, tweakCtl])
     pm.rename(sm[0], "{}_{}".format(name, nameExt))
@@ -155,25 +218,39 @@ def _createSoftModTweak(baseCtl,
     # This connection allow the softTweak to work if we apply the  skin
     # precision fix.
     # TODO: By default only apply to a non asset tweaks.
-    if skin.getSkinCluster(targets[0]) and not is_asset:
+    if not is_asset:
+        _applySkinPrecisionFix(sm[0], targets)
+
+    if restrict:
+        restrictSoftModMembership(sm[0].name())
+
+    return sm[0]
+
+
+# Rewire the softMod when the targets skin uses the precision fix
+
+
+def _applySkinPrecisionFix(softMod, targets):
+    if skin.getSkinCluster(targets[0]):
 
         skin_cls = skin.getSkinCluster(targets[0])
         cnxs = skin_cls.matrix[0].listConnections()
         if (cnxs and cnxs[0].type() == "mgear_mulMatrix" and
-                not sm[0].hasAttr("_fixedSkinFix")):
+                not softMod.hasAttr("_fixedSkinFix")):
 
             # tag the softmod as fixed
-            attribute.addAttribute(sm[0], "_fixedSkinFix", "bool")
+            attribute.addAttribute(softMod, "_fixedSkinFix", "bool")
 
             # original connections
-            matrix_cnx = sm[0].matrix.listConnections(p=True)[0]
-            preMatrix_cnx = sm[0].preMatrix.listConnections(p=True)[0]
-            wgtMatrix_cnx = sm[0].weightedMatrix.listConnections(p=True)[0]
-            postMatrix_cnx = sm[0].postMatrix.listConnections(p=True)[0]
+            matrix_cnx = softMod.matrix.listConnections(p=True)[0]
+            preMatrix_cnx = softMod.preMatrix.listConnections(p=True)[0]
+            wgtMatrix_cnx = softMod.weightedMatrix.listConnections(p=True)[0]
+            postMatrix_cnx = softMod.postMatrix.listConnections(p=True)[0]
 
             # pre existing node operators
             mulMtx_node = wgtMatrix_cnx.node()
-            dcMtx_node = sm[0].falloffCenter.listConnections(p=True)[0].node()
+            dcMtx_node = softMod.falloffCenter.listConnections(
+                p=True)[0].node()
 
             # geo offset connnections
             geo_root = targets[0].getParent()
@@ -187,17 +264,15 @@ def _createSoftModTweak(baseCtl,
 
             # re-wire connections
             pm.connectAttr(mmm1.output, dcMtx_node.inputMatrix, f=True)
-            pm.connectAttr(mmm1.output, sm[0].preMatrix, f=True)
+            pm.connectAttr(mmm1.output, softMod.preMatrix, f=True)
 
-            pm.connectAttr(mmm2.output, sm[0].matrix, f=True)
+            pm.connectAttr(mmm2.output, softMod.matrix, f=True)
             pm.connectAttr(mmm2.output, mulMtx_node.matrixA, f=True)
 
             pm.connectAttr(mmm3.output, mulMtx_node.matrixB, f=True)
-            pm.connectAttr(mmm3.output, sm[0].postMatrix, f=True)
-
-            _neutra_geomMatrix(sm[0])
+            pm.connectAttr(mmm3.output, softMod.postMatrix, f=True)
 
-    return sm[0]
+            _neutra_geomMatrix(softMod)
 
 
 #  Create softTweak and controls convenience function.
@@ -208,7 +283,8 @@ def createSoftTweak(name,
                     grp=None,
                     size=0.5,
                     nameExt="softMod",
-                    is_asset=False):
+                    is_asset=False,
+                    restrict=False):
 
     with pm.UndoChunk():
         if isinstance(targets, basestring):
@@ -233,7 +309,8 @@ def createSoftTweak(name,
                                               name,
                                               targets,
                                               nameExt,
-                                              is_asset)
+                                              is_asset,
+                                              restrict)
 
             return softModNode, baseCtl, tweakCtl
         else:
@@ -243,7 +320,8 @@ def createSoftTweak(name,
 # Create Auto SoftTweak
 def createAutoSoftTweak(size=1.0,
                         nameExt="softMod",
-                        is_asset=False):
+                        is_asset=False,
+                        restrict=False):
 
     # get the object to apply
     if pm.selected() and len(pm.selected()) >= 2:
@@ -260,79 +338,341 @@ def createAutoSoftTweak(size=1.0,
         baseName = "_".join(ctl_parent.name().split("_")[:-1])
     else:
         baseName = ctl_parent.name()
+    idName = _getNextTweakIndex(baseName)
+
+    softModNode = createSoftTweak(baseName + "_" + str(idName),
+                                  targets=oSel,
+                                  parent=ctl_parent,
+                                  t=ctl_parent.getMatrix(worldSpace=True),
+                                  grp=grps,
+                                  size=size,
+                                  nameExt=nameExt,
+                                  is_asset=is_asset,
+                                  restrict=restrict)[0]
+    # the index is only taken once the tweak exists
+    if softModNode:
+        _TWEAK_INDEXES.setdefault(baseName, set()).add(idName)
+    pm.select(oSel, r=True)
+
+
+# Clear the softTweak indexes cache
+
+
+def _clearTweakIndexes(*args):
+    _TWEAK_INDEXES.clear()
+
+# Remove the callbacks clearing the softTweak indexes cache
+
+
+def _removeTweakIndexesCallbacks():
+    if _TWEAK_INDEXES_CALLBACKS:
+        om.MMessage.removeCallbacks(_TWEAK_INDEXES_CALLBACKS)
+        del _TWEAK_INDEXES_CALLBACKS[:]
+    _clearTweakIndexes()
+
+# Get the used softTweak indexes for a base name with a single pattern query
+
+
+def _listTweakIndexes(baseName):
+    suffix = "_softTweak_ctl"
+    prefix = "{}_".format(baseName.split("|")[-1])
+    indexes = set()
+    for n in cmds.ls("{}_*{}".format(baseName, suffix)) or []:
+        idx = n.split("|")[-1][len(prefix):-len(suffix)]
+        if idx.isdigit():
+            indexes.add(int(idx))
+    return indexes
+
+# Get the next free softTweak index for a base name
+# The used indexes are cached for the session so only the candidate name is
+# checked. The scene is queried again if the candidate is already taken
+
+
+def _getNextTweakIndex(baseName):
+    if not _TWEAK_INDEXES_CALLBACKS:
+        for msg in (om.MSceneMessage.kAfterOpen, om.MSceneMessage.kAfterNew):
+            _TWEAK_INDEXES_CALLBACKS.append(
+                om.MSceneMessage.addCallback(msg, _clearTweakIndexes))
+        # an undone tweak creation frees its index
+        _TWEAK_INDEXES_CALLBACKS.append(
+            om.MEventMessage.addEventCallback("Undo", _clearTweakIndexes))
+
+    if baseName not in _TWEAK_INDEXES:
+        _TWEAK_INDEXES[baseName] = _listTweakIndexes(baseName)
+    indexes = _TWEAK_INDEXES[baseName]
+
     idName = 0
-    while pm.ls("_".join([baseName, str(idName), "softTweak_ctl"])):
+    while idName in indexes:
         idName += 1
+    if cmds.objExists("_".join([baseName, str(idName), "softTweak_ctl"])):
+        indexes.update(_listTweakIndexes(baseName))
+        while idName in indexes:
+            idName += 1
 
-    createSoftTweak(baseName + "_" + str(idName),
-                    targets=oSel,
-                    parent=ctl_parent,
-                    t=ctl_parent.getMatrix(worldSpace=True),
-                    grp=grps,
-                    size=size,
-                    nameExt=nameExt,
-                    is_asset=is_asset)
-    pm.select(oSel, r=True)
+    return idName
 
 
 # EDIT -------------------------------
-# get softMod affected objects
-def _getAffectedObjects(softMods):
-    affectedList = []
-    if not isinstance(softMods, list):
-        softMods = [softMods]
-    for softMod in softMods:
-        if isinstance(softMod, basestring):
-            softMod = pm.PyNode(softMod)
-        objs = [pm.PyNode(x).getParent().name() for x in softMod.getGeometry()]
-        affectedList = affectedList + objs
+# get softMod affected object names without creating PyNodes
+def _getAffectedObjectNames(softMod):
+    geo = cmds.deformer(str(softMod), query=True, geometry=True) or []
+    return [cmds.listRelatives(g, parent=True)[0] for g in geo]
 
-    return affectedList
 
+# get the controls and affected objects of the softMods by softMod name
+# The controls of all the softMods are queried with a single listConnections
 
-# get plugget object
-def _getPluggetObj(softMods, plug):
-    ctlRoots = []
-    if not isinstance(softMods, list):
-        softMods = [softMods]
-    for softMod in softMods:
-        if isinstance(softMod, basestring):
-            softMod = pm.PyNode(softMod)
-        ctlRoots.append(softMod.attr(plug).listConnections(p=True)[0].node())
-    return ctlRoots
+
+def _getTweakConnections(softMods):
+    softMods = [str(sm) for sm in softMods]
+    connections = dict((sm, {"affected": _getAffectedObjectNames(sm)})
+                       for sm in softMods)
+    if not softMods:
+        return connections
+
+    plugs = ["{}.{}".format(sm, p) for sm in softMods
+             for p in ("ctlRoot", "ctlBase", "ctlTweak")]
+    cnxs = cmds.listConnections(plugs,
+                                source=True,
+                                destination=False,
+                                connections=True) or []
+    for plug, obj in zip(cnxs[::2], cnxs[1::2]):
+        sm, attr = plug.split(".", 1)
+        connections[sm][attr] = obj
+    return connections
 
 
 def _neutra_geomMatrix(softmod):
     # ensure the geomMatrix is neutral
     # this will fix the softTweak if it is apply in other position
     # that is not bindpose
-    at = softmod.geomMatrix
-    m = datatypes.Matrix()
-    targets = _getAffectedObjects(softmod)
-    for i in xrange(len(targets)):
-        at.attr("geomMatrix[{}]".format(str(i))).set(m)
+    # the matrices are set by the logical index of the input geometries
+    softmod = str(softmod)
+    m = list(datatypes.Matrix().get())
+    m = [v for row in m for v in row]
+    for i in cmds.getAttr("{}.input".format(softmod), multiIndices=True) or []:
+        cmds.setAttr("{}.geomMatrix[{}]".format(softmod, i), m, type="matrix")
 
 
 # add or remove obj from softmod
+# the membership of each deformer is edited with a single sets call and the
+# whole edit is a single undo chunk
 def _addRemoveSoftMode(softMods, targets=[], add=True):
-    if isinstance(softMods, basestring):
-        softMods = pm.PyNode(softMods)
+    startTime = time.time()
     if not isinstance(softMods, list):
         softMods = [softMods]
+    softMods = [str(sm) for sm in softMods]
+    if not isinstance(targets, list):
+        targets = [targets]
+    targets = [str(t) for t in targets]
+    if not softMods:
+        return
+
+    with pm.UndoChunk():
+        cnxs = cmds.listConnections(softMods,
+                                    type="objectSet",
+                                    connections=True) or []
+        softSets = {}
+        for plug, softSet in zip(cnxs[::2], cnxs[1::2]):
+            softSets.setdefault(plug.split(".")[0], softSet)
+
+        for softMod in softMods:
+            softSet = softSets.get(softMod)
+            if softSet and targets:
+                if add:
+                    cmds.sets(targets, add=softSet)
+                else:
+                    cmds.sets(targets, remove=softSet)
+
+            _neutra_geomMatrix(softMod)
+
+            # the added meshes are restricted to the falloff area too
+            if add and _isRestricted(softMod):
+                restrictSoftModMembership(
+                    softMod,
+                    cmds.getAttr("{}.restrictMargin".format(softMod)))
+
+    print("{} {} objects {} {} soft tweaks in {:.3f}s".format(
+        "Added" if add else "Removed", len(targets),
+        "to" if add else "from", len(softMods), time.time() - startTime))
+
+
+# FALLOFF RESTRICTION -------------------------------
+# get the falloff center in world space and radius of a softMod, at the
+# current frame or evaluated at the given frame
+
+
+def _getFalloffSphere(softMod, frame=None):
+    baseCtl = cmds.listConnections("{}.ctlBase".format(softMod),
+                                   source=True, destination=False)[0]
+    matrixPlug = "{}.worldMatrix[0]".format(baseCtl)
+    radiusPlug = "{}.falloffRadius".format(softMod)
+    if frame is None:
+        matrix = cmds.getAttr(matrixPlug)
+        radius = cmds.getAttr(radiusPlug)
+    else:
+        matrix = cmds.getAttr(matrixPlug, time=frame)
+        radius = cmds.getAttr(radiusPlug, time=frame)
+    return list(matrix[12:15]), radius
+
+# get the vertex indexes of a mesh inside a sphere, tested in a single
+# vectorized pass over the world space points
+
+
+def _getVerticesInSphere(mesh, center, radius):
+    import numpy as np
+    selList = om.MSelectionList()
+    selList.add(mesh)
+    points = np.array(om.MFnMesh(selList.getDagPath(0)).getPoints(
+        om.MSpace.kWorld))[:, :3]
+    inside = ((points - center) ** 2).sum(axis=1) <= radius * radius
+    return np.flatnonzero(inside).tolist()
+
+# compress indexes into component ranges like mesh.vtx[0:10]
+
+
+def _indexesToComponents(shape, indexes, component="vtx"):
+    components = []
+    start = None
+    for i, idx in enumerate(indexes):
+        if start is None:
+            start = idx
+        if i + 1 == len(indexes) or indexes[i + 1] != idx + 1:
+            components.append("{}.{}[{}:{}]".format(shape, component,
+                                                    start, idx))
+            start = None
+    return components
+
+# restrict the softMod membership to the vertices inside its falloff
+# The deformer only evaluates its member components, so the cost of the
+# tweak scales with the falloff area instead of the whole meshes.
+# The falloff is sampled on every frame where the tweak controls are keyed,
+# so animated tweaks keep all the vertices they reach. The membership is only
+# edited by this explicit call, it has to be refreshed after moving the
+# tweak. The falloff spheres of every sampled frame are stored on the softMod
+# to detect the changes. Only meshes are restricted, other geometry types
+# are kept whole
+
+
+def restrictSoftModMembership(softMods, margin=RESTRICT_MARGIN):
+    if not isinstance(softMods, list):
+        softMods = [softMods]
+    softMods = [str(sm) for sm in softMods
+                if cmds.listConnections(str(sm), type="objectSet")]
+    if not softMods:
+        return
+
+    # vertices inside the falloff on every sampled frame
+    currentFrame = cmds.currentTime(query=True)
+    smFrames = dict((sm, set(_getTweakKeyedFrames([sm]) + [currentFrame]))
+                    for sm in softMods)
+    smShapes = dict((sm, cmds.ls(cmds.deformer(sm, query=True,
+                                               geometry=True) or [],
+                                 type="mesh"))
+                    for sm in softMods)
+    inside = dict((sm, dict((shape, set()) for shape in smShapes[sm]))
+                  for sm in softMods)
+    spheres = dict((sm, []) for sm in softMods)
+    try:
+        for frame in sorted(set.union(*smFrames.values())):
+            if frame != cmds.currentTime(query=True):
+                cmds.currentTime(frame, update=True)
+            for sm in softMods:
+                if frame not in smFrames[sm]:
+                    continue
+                center, radius = _getFalloffSphere(sm)
+                spheres[sm].append([frame] + list(center) + [radius])
+                for shape in smShapes[sm]:
+                    inside[sm][shape].update(_getVerticesInSphere(
+                        shape, center, radius * (1.0 + margin)))
+    finally:
+        cmds.currentTime(currentFrame, update=True)
+
     for softMod in softMods:
-        softSet = pm.listConnections(softMod, type='objectSet')
-        if softSet:
-            if isinstance(targets, basestring):
-                targets = pm.PyNode(targets)
-            if not isinstance(targets, list):
-                targets = [targets]
-
-            if add:
-                pm.sets(softSet[0], add=targets)
-            else:
-                pm.sets(softSet[0], rm=targets)
+        softSet = cmds.listConnections(softMod, type="objectSet")
+        add = []
+        remove = []
+        for shape, indexes in inside[softMod].items():
+            # keep the mesh on the deformer if nothing is inside
+            if not indexes:
+                continue
+            count = cmds.polyEvaluate(shape, vertex=True)
+            add.extend(_indexesToComponents(shape, sorted(indexes)))
+            remove.extend(_indexesToComponents(
+                shape, [i for i in range(count) if i not in indexes]))
+
+        if add:
+            cmds.sets(add, add=softSet[0])
+        if remove:
+            cmds.sets(remove, remove=softSet[0])
+
+        # store the sampled frames and spheres to know when it needs a
+        # refresh
+        if not _isRestricted(softMod):
+            cmds.addAttr(softMod, longName="restrictSpheres",
+                         dataType="string")
+            cmds.addAttr(softMod, longName="restrictMargin",
+                         attributeType="double")
+        cmds.setAttr("{}.restrictSpheres".format(softMod),
+                     json.dumps(spheres[softMod]), type="string")
+        cmds.setAttr("{}.restrictMargin".format(softMod), margin)
+
+# check if the softMod membership is restricted to the falloff
+
+
+def _isRestricted(softMod):
+    return cmds.attributeQuery("restrictSpheres", node=str(softMod),
+                               exists=True)
+
+# refresh the restricted membership of the softMods which falloff center or
+# radius changed beyond the threshold on any of the frames the restriction
+# sampled, or which controls got keyed on other frames. The spheres are
+# evaluated at each stored frame without changing the current time.
+# Run from the manager refresh button
+
+
+def refreshRestrictedMembership(softMods=None, threshold=RESTRICT_THRESHOLD):
+    if softMods is None:
+        softMods = (_listSoftModTweakNames(False) +
+                    _listSoftModTweakNames(True))
+    elif not isinstance(softMods, list):
+        softMods = [softMods]
 
-        _neutra_geomMatrix(softMod)
+    refreshed = []
+    for softMod in [str(sm) for sm in softMods if _isRestricted(sm)]:
+        spheres = json.loads(cmds.getAttr(
+            "{}.restrictSpheres".format(softMod)) or "[]")
+        frames = set(x[0] for x in spheres)
+        changed = not spheres or not frames.issuperset(
+            _getTweakKeyedFrames([softMod], fallback=False))
+        for sphere in spheres:
+            if changed:
+                break
+            frame, oldCenter, oldRadius = sphere[0], sphere[1:4], sphere[4]
+            center, radius = _getFalloffSphere(softMod, frame)
+            limit = max(oldRadius, 1e-6) * threshold
+            moved = sum((a - b) ** 2
+                        for a, b in zip(center, oldCenter)) ** .5
+            changed = moved > limit or abs(radius - oldRadius) > limit
+        if changed:
+            restrictSoftModMembership(
+                softMod, cmds.getAttr("{}.restrictMargin".format(softMod)))
+            refreshed.append(softMod)
+    return refreshed
+
+# remove the falloff restriction adding back the whole meshes
+
+
+def unrestrictSoftModMembership(softMods):
+    if not isinstance(softMods, list):
+        softMods = [softMods]
+    for softMod in [str(sm) for sm in softMods if _isRestricted(sm)]:
+        softSet = cmds.listConnections(softMod, type="objectSet")
+        geo = cmds.deformer(softMod, query=True, geometry=True) or []
+        if softSet and geo:
+            cmds.sets(geo, add=softSet[0])
+        for attr in ("restrictSpheres", "restrictMargin"):
+            cmds.deleteAttr(softMod, attribute=attr)
 
 
 # add to softmod
@@ -345,83 +685,763 @@ def addToSoftMod(softMods, targets=[]):
 def removeSoftMod(softMods, targets=[]):
     _addRemoveSoftMode(softMods, targets, False)
 
-# list soft modeTweaks in the scene
+# list soft modeTweaks names in the scene
+# The tag attribute is queried with a single ls so no PyNode is created
 
 
-def _listSoftModTweaks(is_asset=False):
+def _listSoftModTweakNames(is_asset=False):
     if is_asset:
         tag_name = ASSET_TAG
     else:
         tag_name = SHOT_TAG
-    return [sm for sm in pm.ls(type="softMod") if sm.hasAttr(tag_name)]
+    attrs = cmds.ls("*.{}".format(tag_name), recursive=True) or []
+    names = []
+    seen = set()
+    for a in attrs:
+        n = a.rsplit(".", 1)[0]
+        if n not in seen:
+            seen.add(n)
+            names.append(n)
+    return names
 
 
 def _buildConfigDict(softMods=[]):
     """build the config dictionary softMod list
 
+    All the connections are gathered with a single listConnections call and
+    the values are queried with cmds, so no PyNode is created.
+
     Returns:
         dic: SoftMod tweaks configuration
     """
     configDict = {}
 
     # Softmods list
-    configDict["softMods"] = [sm.name() for sm in softMods]
+    softMods = [str(sm) for sm in softMods or []]
+    configDict["softMods"] = softMods
+    if not softMods:
+        return configDict
+
+    # controls connected to every softMod in one query
+    connections = _getTweakConnections(softMods)
+
+    assetTweaks = set(_listSoftModTweakNames(True))
 
     for sm in softMods:
         softModConfig = {}
-        root = sm.ctlRoot.listConnections(p=True)[0].node()
-        baseCtl = sm.ctlBase.listConnections(p=True)[0].node()
-        ctl = sm.ctlTweak.listConnections(p=True)[0].node()
+        root = connections[sm]["ctlRoot"]
+        baseCtl = connections[sm]["ctlBase"]
+        ctl = connections[sm]["ctlTweak"]
 
         # base name without the extension_softMod
-        # softModConfig["name"] = sm.name().replace("_softMod", "")
-        softModConfig["name"] = "_".join(sm.name().split("_")[:-1])
+        softModConfig["name"] = "_".join(sm.split("_")[:-1])
         # name extension
-        softModConfig["nameExt"] = sm.name().split("_")[-1]
+        softModConfig["nameExt"] = sm.split("_")[-1]
         # is asset
-        softModConfig["isAsset"] = sm.hasAttr(ASSET_TAG)
+        softModConfig["isAsset"] = sm in assetTweaks
         # fallof value
-        softModConfig["falloff"] = ctl.falloff.get()
+        softModConfig["falloff"] = cmds.getAttr("{}.falloff".format(ctl))
         # affected objects
-        # print _getAffectedObjects(sm)
-        softModConfig["affected"] = _getAffectedObjects(sm)
+        softModConfig["affected"] = connections[sm]["affected"]
         # root parent
-        if root.getParent():
-            parentName = root.getParent().name()
-        else:
-            parentName = None
-        softModConfig["rootParent"] = parentName
+        parent = cmds.listRelatives(root, parent=True)
+        softModConfig["rootParent"] = parent[0] if parent else None
         # icons size
-        softModConfig["iconSize"] = root.iconSize.get()
-        # root matrix
-        m = root.getMatrix(objectSpace=True)
-        softModConfig["rootMatrix"] = m.get()
-        # ctl base matrix
-        m = baseCtl.getMatrix(objectSpace=True)
-        softModConfig["baseCtlMatrix"] = m.get()
-        # ctl matrix
-        m = ctl.getMatrix(objectSpace=True)
-        softModConfig["ctlMatrix"] = m.get()
+        softModConfig["iconSize"] = cmds.getAttr("{}.iconSize".format(root))
+        # root, ctl base and ctl matrix in object space
+        for key, obj in (("rootMatrix", root),
+                         ("baseCtlMatrix", baseCtl),
+                         ("ctlMatrix", ctl)):
+            m = cmds.getAttr("{}.matrix".format(obj))
+            softModConfig[key] = [m[i:i + 4] for i in range(0, 16, 4)]
         # grp name
-        # oSet = root.grp.listConnections(p=True)
-        oSet = ctl.instObjGroups.listConnections()
-        if oSet:
-            # grp = oSet[0].node().name()
-            grp = [g.name() for g in oSet]
-        else:
-            grp = None
-        softModConfig["grpName"] = grp
+        oSet = cmds.listConnections("{}.instObjGroups".format(ctl))
+        softModConfig["grpName"] = oSet or None
+        # falloff restriction margin
+        if _isRestricted(sm):
+            softModConfig["restrictMargin"] = cmds.getAttr(
+                "{}.restrictMargin".format(sm))
 
-        configDict[sm.name()] = softModConfig
+        configDict[sm] = softModConfig
 
     return configDict
 
+# CONSOLIDATION -------------------------------
+# load the softTweakStack deformer plugin by name from the plug-ins folder
+# of the module
+
+
+def _loadStackPlugin():
+    if not cmds.pluginInfo(STACK_PLUGIN, query=True, loaded=True):
+        cmds.loadPlugin(STACK_PLUGIN, quiet=True)
+
+# unconsolidate the soft tweaks before the scene is saved, so the scene files
+# never contain the softTweakStack deformer. Not recorded in the undo queue
+
+
+def _unconsolidateBeforeSave(*args):
+    del _SAVED_STACK_MESHES[:]
+    if not cmds.pluginInfo(STACK_PLUGIN, query=True, loaded=True):
+        return
+    meshes = []
+    for stack in cmds.ls(type=STACK_NODE) or []:
+        meshes.extend(cmds.deformer(stack, query=True, geometry=True) or [])
+    if not meshes:
+        return
+
+    undoState = cmds.undoInfo(query=True, stateWithoutFlush=True)
+    cmds.undoInfo(stateWithoutFlush=False)
+    try:
+        unconsolidateSoftTweaks(meshes)
+        _SAVED_STACK_MESHES.extend(meshes)
+    finally:
+        cmds.undoInfo(stateWithoutFlush=undoState)
+
+# consolidate again the soft tweaks unconsolidated for the save
+
+
+def _consolidateAfterSave(*args):
+    meshes = [m for m in _SAVED_STACK_MESHES if cmds.objExists(m)]
+    del _SAVED_STACK_MESHES[:]
+    if not meshes:
+        return
+
+    undoState = cmds.undoInfo(query=True, stateWithoutFlush=True)
+    cmds.undoInfo(stateWithoutFlush=False)
+    try:
+        consolidateSoftTweaks(meshes)
+    finally:
+        cmds.undoInfo(stateWithoutFlush=undoState)
+
+# register the callbacks keeping the softTweakStack deformer out of the
+# saved and exported scenes
+
+
+def _addStackSaveCallbacks():
+    if _STACK_SAVE_CALLBACKS:
+        return
+    for msg in (om.MSceneMessage.kBeforeSave, om.MSceneMessage.kBeforeExport):
+        _STACK_SAVE_CALLBACKS.append(om.MSceneMessage.addCallback(
+            msg, _unconsolidateBeforeSave))
+    for msg in (om.MSceneMessage.kAfterSave, om.MSceneMessage.kAfterExport):
+        _STACK_SAVE_CALLBACKS.append(om.MSceneMessage.addCallback(
+            msg, _consolidateAfterSave))
+
+# get the mesh shapes from transforms or shapes
+
+
+def _getMeshShapes(objs):
+    shapes = cmds.ls(objs, type="mesh", noIntermediate=True) or []
+    shapes += cmds.listRelatives(cmds.ls(objs, type="transform") or [],
+                                 shapes=True,
+                                 noIntermediate=True,
+                                 type="mesh",
+                                 fullPath=True) or []
+    return cmds.ls(shapes, long=True)
+
+# get the live soft tweaks deforming a mesh shape
+# The tweaks using the surface falloff mode are kept as softMods
+
+
+def _listMeshSoftModTweaks(shape, tweaks):
+    return [sm for sm in _listMeshLiveTweaks(shape, tweaks)
+            if not cmds.getAttr("{}.falloffMode".format(sm))]
+
+# get the soft tweaks deforming a mesh shape which softMod is not disabled
+
+
+def _listMeshLiveTweaks(shape, tweaks):
+    history = cmds.listHistory(shape, pruneDagObjects=True) or []
+    return [sm for sm in cmds.ls(history, type="softMod")
+            if sm in tweaks and not cmds.getAttr("{}.nodeState".format(sm))]
+
+# get the tweaks of the mesh shapes, adding the meshes sharing tweaks with
+# them. The tweaks of each shape are listed with the given function
+
+
+def _getTweakedShapes(meshes, tweaks, listTweaks):
+    pending = _getMeshShapes(meshes)
+    shapeTweaks = {}
+    while pending:
+        shape = pending.pop()
+        if shape in shapeTweaks:
+            continue
+        shapeTweaks[shape] = listTweaks(shape, tweaks)
+        for sm in shapeTweaks[shape]:
+            geo = cmds.deformer(sm, query=True, geometry=True) or []
+            pending.extend(_getMeshShapes(geo))
+    return shapeTweaks
+
+# get the per vertex weights of a softMod on a mesh shape, zero for the
+# vertices outside of the softMod membership
+
+
+def _getSoftModWeights(softMod, shape):
+    import numpy as np
+    count = cmds.polyEvaluate(shape, vertex=True)
+    longShape = cmds.ls(shape, long=True)[0]
+    geometry = [cmds.ls(g, long=True)[0] for g in
+                cmds.deformer(softMod, query=True, geometry=True) or []]
+    if longShape not in geometry:
+        return np.zeros(count)
+    geoIndex = cmds.deformer(softMod, query=True,
+                             geometryIndices=True)[geometry.index(longShape)]
+
+    # painted weights, the vertices without stored weight use the default
+    weights = np.ones(count)
+    weightPlug = "{}.weightList[{}].weights".format(softMod, geoIndex)
+    plug = _getPlug(weightPlug)
+    for i in range(plug.numElements()):
+        element = plug.elementByPhysicalIndex(i)
+        if element.logicalIndex() < count:
+            weights[element.logicalIndex()] = element.asDouble()
+
+    softSet = cmds.listConnections(softMod, type="objectSet")
+    if not softSet:
+        return weights
+
+    members = np.zeros(count, dtype=bool)
+    selList = om.MSelectionList()
+    for member in cmds.sets(softSet[0], query=True) or []:
+        selList.add(member)
+    for i in range(selList.length()):
+        path, component = selList.getComponent(i)
+        if path.apiType() != om.MFn.kMesh:
+            path.extendToShape()
+        if path.fullPathName() != longShape:
+            continue
+        if component.isNull():
+            members[:] = True
+        else:
+            members[list(om.MFnSingleIndexedComponent(
+                component).getElements())] = True
+    return weights * members
+
+# get the softTweakStack deformers of a mesh shape
+
+
+def _listMeshStacks(shape):
+    history = cmds.listHistory(shape, pruneDagObjects=True) or []
+    return cmds.ls(history, type=STACK_NODE) or []
+
+# get the deformers linked to the given ones through the softMods connected
+# to their message attribute, and all those softMods
+
+
+def _getLinkedDeformers(deformers, attr, nodeType):
+    pending = list(deformers)
+    linked = set()
+    softMods = set()
+    while pending:
+        deformer = pending.pop()
+        if deformer in linked:
+            continue
+        linked.add(deformer)
+        for sm in cmds.listConnections("{}.{}".format(deformer, attr),
+                                       source=True,
+                                       destination=False) or []:
+            softMods.add(sm)
+            pending.extend(cmds.listConnections("{}.message".format(sm),
+                                                type=nodeType) or [])
+    return list(linked), list(softMods)
+
+# collapse the soft tweaks of the meshes into a single softTweakStack
+# deformer per mesh. The softMods are kept, with the HasNoEffect node state,
+# so the controls, the export and the unconsolidation keep working.
+# The meshes deformed by the same tweaks are consolidated together.
+# The stack deformer membership is the union of the softMods membership, and
+# the softMod weights are stored on it, so it has to be consolidated again
+# after painting the softMod weights or restricting their membership.
+# The consolidation is session only, saving the scene stores the live
+# softMods and consolidates them again once saved
+
+
+def consolidateSoftTweaks(meshes=None):
+    if meshes is None:
+        meshes = cmds.ls(selection=True)
+    _loadStackPlugin()
+    tweaks = set(_listSoftModTweakNames(False) +
+                 _listSoftModTweakNames(True))
+
+    shapeTweaks = _getTweakedShapes(meshes, tweaks, _listMeshSoftModTweaks)
+
+    stacks = []
+    softMods = set()
+    with pm.UndoChunk():
+        for shape, smList in shapeTweaks.items():
+            smWeights = [_getSoftModWeights(sm, shape) for sm in smList]
+            members = sum(abs(w) for w in smWeights).nonzero()[0].tolist()
+            if not members:
+                continue
+            transform = cmds.listRelatives(shape, parent=True)[0]
+            stack = cmds.deformer(_indexesToComponents(shape, members),
+                                  type=STACK_NODE,
+                                  name="{}_{}".format(
+                                      transform.split(":")[-1],
+                                      STACK_NODE))[0]
+            cmds.addAttr(stack, longName="tweakSoftMod",
+                         attributeType="message", multi=True)
+
+            # the skin precision fix works in the geometry root space
+            if [sm for sm in smList if cmds.attributeQuery(
+                    "_fixedSkinFix", node=sm, exists=True)]:
+                cmds.setAttr("{}.useGeomMatrix".format(stack), False)
+
+            for i, sm in enumerate(smList):
+                tweakPlug = "{}.tweak[{}]".format(stack, i)
+                for attr in STACK_INPUTS:
+                    src = cmds.listConnections("{}.{}".format(sm, attr),
+                                               source=True,
+                                               destination=False,
+                                               plugs=True)
+                    if src:
+                        cmds.connectAttr(src[0], "{}.{}".format(tweakPlug,
+                                                                attr))
+                    elif attr == "falloffRadius":
+                        cmds.setAttr("{}.{}".format(tweakPlug, attr),
+                                     cmds.getAttr("{}.{}".format(sm, attr)))
+
+                src = cmds.listConnections("{}.envelope".format(sm),
+                                           source=True,
+                                           destination=False,
+                                           plugs=True)
+                if src:
+                    cmds.connectAttr(src[0],
+                                     "{}.tweakEnvelope".format(tweakPlug))
+                else:
+                    cmds.setAttr("{}.tweakEnvelope".format(tweakPlug),
+                                 cmds.getAttr("{}.envelope".format(sm)))
+                cmds.setAttr("{}.tweakWeights".format(tweakPlug),
+                             smWeights[i].tolist(), type="doubleArray")
+                cmds.connectAttr("{}.message".format(sm),
+                                 "{}.tweakSoftMod[{}]".format(stack, i))
+                softMods.add(sm)
+            stacks.append(stack)
+
+        for sm in softMods:
+            cmds.setAttr("{}.nodeState".format(sm), 1)
+
+    if stacks:
+        _addStackSaveCallbacks()
+
+    return stacks
+
+# restore the live softMods of the meshes deleting their softTweakStack
+# deformers. Stacks sharing tweaks with them are removed too
+
+
+def unconsolidateSoftTweaks(meshes=None):
+    if meshes is None:
+        meshes = cmds.ls(selection=True)
+    pending = []
+    for shape in _getMeshShapes(meshes):
+        pending.extend(_listMeshStacks(shape))
+    stacks, softMods = _getLinkedDeformers(pending, "tweakSoftMod",
+                                           STACK_NODE)
+
+    with pm.UndoChunk():
+        if stacks:
+            cmds.delete(stacks)
+        for sm in softMods:
+            cmds.setAttr("{}.nodeState".format(sm), 0)
+
+    return softMods
+
+# compare the deformation time per frame of the live soft tweaks and the
+# consolidated softTweakStack deformer on a mesh
+
+
+def benchmarkSoftTweakStack(mesh, frames=None):
+    if frames is None:
+        start = int(cmds.playbackOptions(query=True, minTime=True))
+        end = int(cmds.playbackOptions(query=True, maxTime=True))
+        frames = range(start, end + 1)
+    frames = list(frames)
+    currentFrame = cmds.currentTime(query=True)
+    shape = _getMeshShapes([mesh])[0]
+
+    def timePerFrame():
+        startTime = time.time()
+        for f in frames:
+            cmds.currentTime(f, update=True)
+            # pulls the deformed mesh
+            cmds.exactWorldBoundingBox(shape)
+        return (time.time() - startTime) / max(len(frames), 1)
+
+    wasConsolidated = bool(_listMeshStacks(shape))
+    results = {}
+    try:
+        if wasConsolidated:
+            results["consolidated"] = timePerFrame()
+            unconsolidateSoftTweaks([shape])
+            results["live"] = timePerFrame()
+        else:
+            results["live"] = timePerFrame()
+            consolidateSoftTweaks([shape])
+            results["consolidated"] = timePerFrame()
+    finally:
+        if wasConsolidated and not _listMeshStacks(shape):
+            consolidateSoftTweaks([shape])
+        elif not wasConsolidated and _listMeshStacks(shape):
+            unconsolidateSoftTweaks([shape])
+        cmds.currentTime(currentFrame, update=True)
+
+    if len(results) == 2:
+        print("{}: live softMods {:.2f}ms per frame, softTweakStack "
+              "{:.2f}ms per frame ({:.2f}x)".format(
+                  mesh, results["live"] * 1000.0,
+                  results["consolidated"] * 1000.0,
+                  results["live"] / max(results["consolidated"], 1e-9)))
+    return results
+
+
+# BAKE -------------------------------
+# get the object space points of a mesh shape as a numpy array
+
+
+def _getMeshPoints(shape):
+    import numpy as np
+    selList = om.MSelectionList()
+    selList.add(shape)
+    return np.array(om.MFnMesh(selList.getDagPath(0)).getPoints(
+        om.MSpace.kObject))[:, :3]
+
+# get the frames where the soft tweak controls are keyed inside the playback
+# range. The current frame is used if the controls are not animated, unless
+# fallback is False
+
+
+def _getTweakKeyedFrames(softMods, fallback=True):
+    plugs = ["{}.{}".format(sm, p) for sm in softMods
+             for p in ("ctlRoot", "ctlBase", "ctlTweak")]
+    ctls = cmds.listConnections(plugs, source=True, destination=False) or []
+    start = cmds.playbackOptions(query=True, minTime=True)
+    end = cmds.playbackOptions(query=True, maxTime=True)
+    frames = set(f for f in cmds.keyframe(ctls,
+                                          query=True,
+                                          timeChange=True) or []
+                 if start <= f <= end)
+    if not frames and fallback:
+        return [cmds.currentTime(query=True)]
+    return sorted(frames)
+
+# write the soft tweaks deltas of each frame as an in-between of a single
+# blendShape target, placed at the end of the deformation chain. The target
+# weight is keyed so every baked frame reaches its own in-between and the
+# frames in between are interpolated linearly
+
+
+def _createBakeBlendShape(shape, softMods, frames, basePoints, tweakPoints):
+    transform = cmds.listRelatives(shape, parent=True)[0]
+    bs = cmds.blendShape(shape,
+                         after=True,
+                         name="{}_{}".format(transform.split(":")[-1],
+                                             BAKE_TARGET))[0]
+    cmds.setAttr("{}.weight[0]".format(bs), 0)
+    cmds.aliasAttr(BAKE_TARGET, "{}.weight[0]".format(bs))
+
+    itemPlug = "{}.inputTarget[0].inputTargetGroup[0].inputTargetItem[{}]"
+    for i, frame in enumerate(frames):
+        offsets = tweakPoints[i] - basePoints[i]
+        indexes = ((offsets ** 2).sum(axis=1) >
+                   BAKE_TOLERANCE ** 2).nonzero()[0].tolist()
+        deltas = [(d[0], d[1], d[2], 1.0) for d in offsets[indexes].tolist()]
+        components = [c.rsplit(".", 1)[1]
+                      for c in _indexesToComponents(shape, indexes)]
+
+        # the in-between item index is 5000 + weight * 1000
+        itemIndex = 5000 + int(round(1000.0 * (i + 1) / len(frames)))
+        item = itemPlug.format(bs, itemIndex)
+        cmds.setAttr("{}.inputPointsTarget".format(item),
+                     len(deltas), *deltas, type="pointArray")
+        cmds.setAttr("{}.inputComponentsTarget".format(item),
+                     len(components), *components, type="componentList")
+        cmds.setKeyframe(bs,
+                         attribute=BAKE_TARGET,
+                         time=frame,
+                         value=(itemIndex - 5000) / 1000.0,
+                         inTangentType="linear",
+                         outTangentType="linear")
+
+    cmds.addAttr(bs, longName="bakedSoftMod",
+                 attributeType="message", multi=True)
+    for i, sm in enumerate(softMods):
+        cmds.connectAttr("{}.message".format(sm),
+                         "{}.bakedSoftMod[{}]".format(bs, i))
+    return bs
+
+# bake the soft tweaks of the meshes into a corrective blendShape per mesh and
+# disable their softMods, so the playback cost is a blendShape evaluation.
+# By default the frames where the tweak controls are keyed are sampled.
+# The meshes deformed by the same tweaks are baked together, and the
+# consolidated tweaks are unconsolidated first
+
+
+def bakeSoftTweaks(meshes=None, frames=None):
+    startTime = time.time()
+    if meshes is None:
+        meshes = cmds.ls(selection=True)
+    unconsolidateSoftTweaks(meshes)
+    tweaks = set(_listSoftModTweakNames(False) +
+                 _listSoftModTweakNames(True))
+    shapeTweaks = dict((shape, smList) for shape, smList in
+                       _getTweakedShapes(meshes, tweaks,
+                                         _listMeshLiveTweaks).items()
+                       if smList)
+    softMods = sorted(set(sm for smList in shapeTweaks.values()
+                          for sm in smList))
+    if not softMods:
+        pm.displayWarning("No live soft tweaks to bake.")
+        return []
+
+    if frames is None:
+        frames = _getTweakKeyedFrames(softMods)
+    frames = sorted(set(frames))
+    if len(frames) > BAKE_MAX_FRAMES:
+        pm.displayWarning("Can't bake more than {} frames.".format(
+            BAKE_MAX_FRAMES))
+        return []
+
+    # samples the meshes with and without the tweaks
+    currentFrame = cmds.currentTime(query=True)
+    nodeStates = dict((sm, cmds.getAttr("{}.nodeState".format(sm)))
+                      for sm in softMods)
+    tweakPoints = dict((shape, []) for shape in shapeTweaks)
+    basePoints = dict((shape, []) for shape in shapeTweaks)
+    blendShapes = []
+    with pm.UndoChunk():
+        try:
+            for points, nodeState in ((tweakPoints, 0), (basePoints, 1)):
+                for sm in softMods:
+                    cmds.setAttr("{}.nodeState".format(sm), nodeState)
+                for f in frames:
+                    cmds.currentTime(f, update=True)
+                    for shape in shapeTweaks:
+                        points[shape].append(_getMeshPoints(shape))
+        finally:
+            for sm, nodeState in nodeStates.items():
+                cmds.setAttr("{}.nodeState".format(sm), nodeState)
+            cmds.currentTime(currentFrame, update=True)
+
+        for shape, smList in shapeTweaks.items():
+            blendShapes.append(_createBakeBlendShape(shape,
+                                                     smList,
+                                                     frames,
+                                                     basePoints[shape],
+                                                     tweakPoints[shape]))
+
+        # the blendShapes replace the softMods
+        for sm in softMods:
+            cmds.setAttr("{}.nodeState".format(sm), 1)
+
+    print("Baked {} soft tweaks on {} meshes over {} frames in {:.3f}s"
+          .format(len(softMods), len(blendShapes), len(frames),
+                  time.time() - startTime))
+    return blendShapes
+
+# restore the live softMods of the meshes deleting their baked blendShapes.
+# The bakes sharing tweaks with them are removed too
+
+
+def unbakeSoftTweaks(meshes=None):
+    if meshes is None:
+        meshes = cmds.ls(selection=True)
+    pending = []
+    for shape in _getMeshShapes(meshes):
+        history = cmds.listHistory(shape, pruneDagObjects=True) or []
+        pending.extend([bs for bs in cmds.ls(history, type="blendShape")
+                        if cmds.attributeQuery("bakedSoftMod",
+                                               node=bs,
+                                               exists=True)])
+    blendShapes, softMods = _getLinkedDeformers(pending, "bakedSoftMod",
+                                                "blendShape")
+
+    with pm.UndoChunk():
+        if blendShapes:
+            curves = cmds.listConnections(blendShapes,
+                                          type="animCurve",
+                                          source=True,
+                                          destination=False) or []
+            cmds.delete(blendShapes + curves)
+        for sm in softMods:
+            cmds.setAttr("{}.nodeState".format(sm), 0)
+
+    return softMods
+
+
+# FALLOFF PREVIEW -------------------------------
+# get the thread pool computing the falloff preview weights
+
+
+def _getPreviewPool():
+    from multiprocessing.pool import ThreadPool
+    if not _PREVIEW_POOL:
+        _PREVIEW_POOL.append(ThreadPool(PREVIEW_THREADS))
+    return _PREVIEW_POOL[0]
+
+# compute the falloff weights of the points. Dense meshes are split in chunks
+# computed in parallel, NumPy releasing the GIL on the array operations
+
+
+def _computeFalloffWeights(points, center, radius):
+    import numpy as np
+    from mgear.animbits.softTweakStackNode import getFalloffWeights
+    if len(points) <= PREVIEW_CHUNK_SIZE:
+        return getFalloffWeights(points, center, radius)
+    chunks = [points[i:i + PREVIEW_CHUNK_SIZE]
+              for i in range(0, len(points), PREVIEW_CHUNK_SIZE)]
+    return np.concatenate(_getPreviewPool().map(
+        lambda chunk: getFalloffWeights(chunk, center, radius), chunks))
+
+# create a static world space copy of a mesh shape with the preview colour
+# set, so the weights are displayed without adding history to the mesh
+
+
+def _createPreviewMesh(shape, softMod):
+    import numpy as np
+    transform = cmds.createNode("transform",
+                                name="{}_falloffPreview".format(softMod))
+    previewShape = cmds.createNode("mesh",
+                                   parent=transform,
+                                   name="{}Shape".format(transform))
+    cmds.connectAttr("{}.worldMesh[0]".format(shape),
+                     "{}.inMesh".format(previewShape))
+    cmds.getAttr("{}.outMesh".format(previewShape), silent=True)
+    cmds.disconnectAttr("{}.worldMesh[0]".format(shape),
+                        "{}.inMesh".format(previewShape))
+    cmds.sets(previewShape, edit=True, forceElement="initialShadingGroup")
+    cmds.setAttr("{}.displayColors".format(previewShape), True)
+
+    selList = om.MSelectionList()
+    selList.add(previewShape)
+    fnMesh = om.MFnMesh(selList.getDagPath(0))
+    fnMesh.createColorSet(PREVIEW_COLOR_SET, False)
+    fnMesh.setCurrentColorSetName(PREVIEW_COLOR_SET)
+    points = np.array(fnMesh.getPoints(om.MSpace.kObject))[:, :3]
+    return transform, previewShape, points
+
+# update the preview colours of a softMod with its current falloff
+# The points are fetched once when the preview starts
+
+
+def _updateFalloffPreview(softMod):
+    import numpy as np
+    preview = _FALLOFF_PREVIEWS.get(softMod)
+    if not preview or not cmds.objExists(softMod):
+        return
+    center, radius = _getFalloffSphere(softMod)
+    for previewShape, points, vertexIds in preview["meshes"]:
+        if not cmds.objExists(previewShape):
+            continue
+        weights = _computeFalloffWeights(points, center, radius)
+        # blue outside the falloff to red at the center
+        colors = np.ones((len(weights), 4))
+        colors[:, 0] = weights
+        colors[:, 1] = 0.0
+        colors[:, 2] = 1.0 - weights
+        selList = om.MSelectionList()
+        selList.add(previewShape)
+        om.MFnMesh(selList.getDagPath(0)).setVertexColors(
+            om.MColorArray(colors.tolist()), vertexIds)
+
+# stop all the falloff previews, so the scene is never saved or left with
+# the preview meshes and the hidden meshes. Not recorded in the undo queue
+
+
+def _stopFalloffPreviewsCallback(*args):
+    if not _FALLOFF_PREVIEWS:
+        return
+    undoState = cmds.undoInfo(query=True, stateWithoutFlush=True)
+    cmds.undoInfo(stateWithoutFlush=False)
+    try:
+        stopFalloffPreview()
+    finally:
+        cmds.undoInfo(stateWithoutFlush=undoState)
+
+# display the falloff weights of the softMods on their meshes, updated while
+# the tweak base control or the falloff value change. The meshes are hidden
+# and replaced by coloured copies until the preview is stopped, the scene is
+# saved or exported, or another scene is opened or created
+
+
+def previewSoftTweakFalloff(softMods):
+    if not isinstance(softMods, list):
+        softMods = [softMods]
+    if not _PREVIEW_CALLBACKS:
+        for msg in (om.MSceneMessage.kBeforeSave,
+                    om.MSceneMessage.kBeforeExport,
+                    om.MSceneMessage.kBeforeOpen,
+                    om.MSceneMessage.kBeforeNew):
+            _PREVIEW_CALLBACKS.append(om.MSceneMessage.addCallback(
+                msg, _stopFalloffPreviewsCallback))
+    for softMod in [str(sm) for sm in softMods]:
+        stopFalloffPreview(softMod)
+        preview = {"transforms": [], "hidden": [], "meshes": [], "jobs": []}
+        _FALLOFF_PREVIEWS[softMod] = preview
+
+        geo = cmds.deformer(softMod, query=True, geometry=True) or []
+        for shape in _getMeshShapes(geo):
+            transform, previewShape, points = _createPreviewMesh(shape,
+                                                                 softMod)
+            preview["transforms"].append(transform)
+            preview["meshes"].append((previewShape,
+                                      points,
+                                      om.MIntArray(range(len(points)))))
+            preview["hidden"].append(
+                (shape, cmds.getAttr("{}.lodVisibility".format(shape))))
+            cmds.setAttr("{}.lodVisibility".format(shape), False)
+
+        cnxs = cmds.listConnections(["{}.ctlBase".format(softMod),
+                                     "{}.ctlTweak".format(softMod)],
+                                    source=True, destination=False)
+        baseCtl, tweakCtl = cnxs[0], cnxs[1]
+
+        def refresh(softMod=softMod):
+            _updateFalloffPreview(softMod)
+
+        for attr in ("{}.translate".format(baseCtl),
+                     "{}.scale".format(baseCtl),
+                     "{}.falloff".format(tweakCtl)):
+            preview["jobs"].append(cmds.scriptJob(
+                attributeChange=[attr, refresh], killWithScene=True))
+
+        _updateFalloffPreview(softMod)
+
+# stop the falloff preview of the softMods, or of all the previews if None
+
+
+def stopFalloffPreview(softMods=None):
+    if softMods is None:
+        softMods = list(_FALLOFF_PREVIEWS)
+    if not isinstance(softMods, list):
+        softMods = [softMods]
+    for softMod in [str(sm) for sm in softMods]:
+        preview = _FALLOFF_PREVIEWS.pop(softMod, None)
+        if not preview:
+            continue
+        for job in preview["jobs"]:
+            if cmds.scriptJob(exists=job):
+                cmds.scriptJob(kill=job, force=True)
+        transforms = [t for t in preview["transforms"] if cmds.objExists(t)]
+        if transforms:
+            cmds.delete(transforms)
+        for shape, visibility in preview["hidden"]:
+            if cmds.objExists(shape):
+                cmds.setAttr("{}.lodVisibility".format(shape), visibility)
+
+
 # EXPORTERS -------------------------------
 # export configuration from a softMod tweaks list
 
 
 def exportConfiguration(softMods, filePath=None):
+    startTime = time.time()
     configDict = _buildConfigDict(softMods)
+    elapsed = time.time() - startTime
+    count = len(configDict["softMods"])
+    print("Soft tweaks configuration built: {} tweaks in {:.3f}s "
+          "({:.1f} tweaks per second)".format(
+              count, elapsed, count / max(elapsed, 1e-6)))
     startDir = pm.workspace(q=True, rootDirectory=True)
     data_string = json.dumps(configDict, indent=4, sort_keys=True)
     if not filePath:
@@ -441,7 +1461,10 @@ def exportConfiguration(softMods, filePath=None):
 # import softTweaker configuration
 
 
-def _importConfiguration(configDict):
+def _importConfiguration(configDict, bulk=False):
+    if bulk:
+        return _importConfigurationBulk(configDict)
+
     with pm.UndoChunk():
         for sm in configDict["softMods"]:
             smConfig = configDict[sm]
@@ -477,11 +1500,222 @@ def _importConfiguration(configDict):
                 # we have to set the matrix again on the root because is stored
                 # in local space
                 baseCtl.getParent().setMatrix(rootMatrix, objectSpace=True)
+                if "restrictMargin" in smConfig:
+                    restrictSoftModMembership(softModNode.name(),
+                                              smConfig["restrictMargin"])
+
+# Get the MPlug from a "node.attribute" string
+
+
+def _getPlug(plugName):
+    selList = om.MSelectionList()
+    selList.add(plugName)
+    return selList.getPlug(0)
+
+# Get the MPlug from a node created by a modifier
+
+
+def _getNodePlug(mObj, attrName):
+    return om.MFnDependencyNode(mObj).findPlug(attrName, False)
+
+# Import softTweaker configuration in bulk
+# The DG modifiers work can't be added to the undo queue, so the bulk import
+# is opt-in and flushes the undo queue: it can't be undone, but the queue is
+# never left out of sync with the scene, even if the import fails
+
+
+def _importConfigurationBulk(configDict):
+    undoState = cmds.undoInfo(query=True, state=True)
+    cmds.undoInfo(state=False)
+    try:
+        return _buildSoftTweaksBulk(configDict)
+    finally:
+        cmds.undoInfo(state=undoState)
+
+# Build the softTweaks of a configuration in bulk
+# The controls are created with the usual icons, then all the softMods are
+# created and finally all the utility nodes, attributes and connections of
+# the softMod networks are created by two DG modifiers. The matrices are set
+# at the end. Refresh and evaluation are suspended during the build.
+
+
+def _buildSoftTweaksBulk(configDict):
+    timings = []
+    entries = [configDict[sm] for sm in configDict["softMods"]]
+
+    # resolve all the scene names once
+    startTime = time.time()
+    names = set()
+    for smConfig in entries:
+        names.update(smConfig["affected"])
+        if smConfig["rootParent"]:
+            names.add(smConfig["rootParent"])
+    existing = set(cmds.ls(list(names)) or [])
+    timings.append(("resolve", time.time() - startTime))
+
+    # controls
+    startTime = time.time()
+    tweaks = []
+    for smConfig in entries:
+        targets = [t for t in smConfig["affected"] if t in existing]
+        for t in smConfig["affected"]:
+            if t not in existing:
+                pm.displayWarning("{}: has not been found in the scene "
+                                  "and will be skipped".format(t))
+        if not targets:
+            pm.displayWarning("Can't find the targets to apply to "
+                              "softModTweak {}".format(smConfig["name"]))
+            continue
+
+        name = smConfig["name"]
+        parent = smConfig["rootParent"]
+        if parent not in existing:
+            parent = None
+        # namespace basic handling
+        # NOTE: Doesn't support more than one namespace stacked
+        if parent and len(name.split(":")) < 2:
+            namespace = parent.split("|")[-1].rpartition(":")[0]
+            if namespace:
+                name = "{}:{}".format(namespace, name)
+
+        rootMatrix = datatypes.Matrix(smConfig["rootMatrix"])
+        baseCtl, tweakCtl = _createSoftTweakControls(name,
+                                                     parent,
+                                                     rootMatrix,
+                                                     smConfig["grpName"],
+                                                     smConfig["iconSize"])
+        if baseCtl:
+            tweaks.append((smConfig, name, targets, baseCtl.name(),
+                           tweakCtl.name(), baseCtl.getParent().name()))
+    timings.append(("controls", time.time() - startTime))
+
+    # softMod deformers
+    startTime = time.time()
+    softMods = []
+    for smConfig, name, targets, baseCtl, tweakCtl, root in tweaks:
+        sm = cmds.softMod(targets, wn=[tweakCtl, tweakCtl])[0]
+        sm = cmds.rename(sm, "{}_{}".format(name, smConfig["nameExt"]))
+        softMods.append(sm)
+    timings.append(("deformers", time.time() - startTime))
+
+    with suspend_scene_updates():
+        # utility nodes and attributes
+        startTime = time.time()
+        mod = om.MDGModifier()
+        networks = []
+        for (smConfig, name, targets, baseCtl, tweakCtl,
+             root), sm in zip(tweaks, softMods):
+            smObj = _getPlug("{}.message".format(sm)).node()
+
+            # remove the default connection
+            smXforms = _getPlug("{}.softModXforms".format(sm))
+            for p in smXforms.connectedTo(True, False):
+                mod.disconnect(p, smXforms)
+                mod.deleteNode(p.node())
+
+            dmObj = mod.createNode("decomposeMatrix")
+            mulObj = mod.createNode("multiplyDivide")
+            mmObj = mod.createNode("mgear_mulMatrix")
+
+            if smConfig["isAsset"]:
+                tag_name = ASSET_TAG
+            else:
+                tag_name = SHOT_TAG
+            numAttr = om.MFnNumericAttribute()
+            tagAttr = numAttr.create(tag_name, tag_name,
+                                     om.MFnNumericData.kBoolean, False)
+            numAttr.keyable = False
+            mod.addAttribute(smObj, tagAttr)
+            msgAttr = om.MFnMessageAttribute()
+            for attrName in ("ctlRoot", "ctlBase", "ctlTweak"):
+                mod.addAttribute(smObj, msgAttr.create(attrName, attrName))
+
+            networks.append((sm, baseCtl, tweakCtl, root, dmObj, mulObj,
+                             mmObj))
+        mod.doIt()
+        timings.append(("nodes", time.time() - startTime))
+
+        # connections
+        startTime = time.time()
+        mod = om.MDGModifier()
+        for sm, baseCtl, tweakCtl, root, dmObj, mulObj, mmObj in networks:
+            smPlug = "{}.{{}}".format(sm)
+            basePlug = "{}.{{}}".format(baseCtl)
+            tweakPlug = "{}.{{}}".format(tweakCtl)
+            for src, dst in (
+                    (_getPlug(basePlug.format("worldMatrix[0]")),
+                     _getNodePlug(dmObj, "inputMatrix")),
+                    (_getNodePlug(dmObj, "outputTranslate"),
+                     _getPlug(smPlug.format("falloffCenter"))),
+                    (_getNodePlug(dmObj, "outputScaleX"),
+                     _getNodePlug(mulObj, "input1X")),
+                    (_getPlug(tweakPlug.format("falloff")),
+                     _getNodePlug(mulObj, "input2X")),
+                    (_getNodePlug(mulObj, "outputX"),
+                     _getPlug(smPlug.format("falloffRadius"))),
+                    (_getPlug(tweakPlug.format("surfaceMode")),
+                     _getPlug(smPlug.format("falloffMode"))),
+                    (_getPlug(tweakPlug.format("worldMatrix[0]")),
+                     _getNodePlug(mmObj, "matrixA")),
+                    (_getPlug(tweakPlug.format("parentInverseMatrix[0]")),
+                     _getNodePlug(mmObj, "matrixB")),
+                    (_getNodePlug(mmObj, "output"),
+                     _getPlug(smPlug.format("weightedMatrix"))),
+                    (_getPlug(basePlug.format("worldInverseMatrix[0]")),
+                     _getPlug(smPlug.format("postMatrix"))),
+                    (_getPlug(basePlug.format("worldMatrix[0]")),
+                     _getPlug(smPlug.format("preMatrix"))),
+                    (_getPlug("{}.message".format(root)),
+                     _getPlug(smPlug.format("ctlRoot"))),
+                    (_getPlug(basePlug.format("message")),
+                     _getPlug(smPlug.format("ctlBase"))),
+                    (_getPlug(tweakPlug.format("message")),
+                     _getPlug(smPlug.format("ctlTweak")))):
+                mod.connect(src, dst)
+        mod.doIt()
+        timings.append(("connections", time.time() - startTime))
+
+        # skin precision fix
+        startTime = time.time()
+        for (smConfig, name, targets, baseCtl, tweakCtl,
+             root), sm in zip(tweaks, softMods):
+            if not smConfig["isAsset"]:
+                _applySkinPrecisionFix(pm.PyNode(sm),
+                                       [pm.PyNode(t) for t in targets])
+        timings.append(("skin fix", time.time() - startTime))
+
+        # matrices and falloff
+        startTime = time.time()
+        for smConfig, name, targets, baseCtl, tweakCtl, root in tweaks:
+            for obj, key in ((baseCtl, "baseCtlMatrix"),
+                             (tweakCtl, "ctlMatrix"),
+                             (root, "rootMatrix")):
+                m = [v for row in smConfig[key] for v in row]
+                cmds.xform(obj, matrix=m, objectSpace=True)
+            cmds.setAttr("{}.falloff".format(tweakCtl), smConfig["falloff"])
+        timings.append(("matrices", time.time() - startTime))
+
+        # falloff restriction
+        startTime = time.time()
+        margins = {}
+        for (smConfig, name, targets, baseCtl, tweakCtl,
+             root), sm in zip(tweaks, softMods):
+            if "restrictMargin" in smConfig:
+                margins.setdefault(smConfig["restrictMargin"], []).append(sm)
+        for margin, smList in margins.items():
+            restrictSoftModMembership(smList, margin)
+        timings.append(("restriction", time.time() - startTime))
+
+    print("Soft tweaks imported: {} tweaks in {:.3f}s ({})".format(
+        len(softMods), sum(t for _, t in timings),
+        ", ".join("{} {:.3f}s".format(n, t) for n, t in timings)))
+
+    return softMods
 
 # import softTweaker configuration from file
 
 
-def importConfigurationFromFile(filePath=None):
+def importConfigurationFromFile(filePath=None, bulk=False):
     if not filePath:
         startDir = pm.workspace(q=True, rootDirectory=True)
         filePath = pm.fileDialog2(
@@ -494,7 +1728,7 @@ def importConfigurationFromFile(filePath=None):
     if not isinstance(filePath, basestring):
         filePath = filePath[0]
     configDict = json.load(open(filePath))
-    _importConfiguration(configDict)
+    _importConfiguration(configDict, bulk)
 
 
 ####################################
@@ -525,6 +1759,9 @@ class softTweakManager(MayaQWidgetDockableMixin, QtWidgets.QDialog):
 
         self.__proxyModel = QtCore.QSortFilterProxyModel(self)
         self.stUIInst.softTweak_listView.setModel(self.__proxyModel)
+        self.__model = QtGui.QStandardItemModel(self)
+        self.__isAsset = None
+        self.setSourceModel(self.__model)
 
         self.setup_softTweakManagerrWindow()
         self.create_layout()
@@ -538,6 +1775,18 @@ class softTweakManager(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         if not event.key() == QtCore.Qt.Key_Escape:
             super(softTweakManager, self).keyPressEvent(event)
 
+    def closeEvent(self, event):
+        self.cleanup()
+        super(softTweakManager, self).closeEvent(event)
+
+    def dockCloseEventTriggered(self):
+        self.cleanup()
+
+    # remove the scene callbacks of the manager
+    def cleanup(self):
+        _removeTweakIndexesCallbacks()
+        stopFalloffPreview()
+
     def setup_softTweakManagerrWindow(self):
 
         self.setObjectName(self.toolName)
@@ -550,6 +1799,33 @@ class softTweakManager(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         self.stm_layout = QtWidgets.QVBoxLayout()
         self.stm_layout.addWidget(self.stUIInst)
 
+        self.restrict_checkBox = QtWidgets.QCheckBox(
+            "Restrict to falloff area")
+        self.restrict_checkBox.setToolTip(
+            "Only the vertices inside the falloff, plus a margin, are "
+            "deformed. Use Refresh to update the area after moving the "
+            "tweak or changing the falloff")
+        self.stUIInst.verticalLayout_5.addWidget(self.restrict_checkBox)
+
+        # performance menu
+        self.performance_menu = self.stUIInst.menubar.addMenu("Performance")
+        self.performance_menu.setTearOffEnabled(True)
+        self.consolidate_action = self.performance_menu.addAction(
+            "Consolidate Selected Meshes")
+        self.unconsolidate_action = self.performance_menu.addAction(
+            "Unconsolidate Selected Meshes")
+        self.benchmark_action = self.performance_menu.addAction(
+            "Benchmark Selected Mesh")
+        self.performance_menu.addSeparator()
+        self.preview_action = self.performance_menu.addAction(
+            "Preview Selected Tweaks Falloff")
+        self.preview_action.setCheckable(True)
+        self.performance_menu.addSeparator()
+        self.bake_action = self.performance_menu.addAction(
+            "Bake Selected Meshes")
+        self.unbake_action = self.performance_menu.addAction(
+            "Unbake Selected Meshes")
+
         self.setLayout(self.stm_layout)
 
     def setSourceModel(self, model):
@@ -571,24 +1847,77 @@ class softTweakManager(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         exportConfiguration(softMods)
         return
 
+    # The list is refreshed incrementally, only the new tweaks are added.
+    # The controls and affected objects cached on the list items are queried
+    # for all the tweaks at once and only updated when they changed
     def _refreshList(self):
-        model = QtGui.QStandardItemModel(self)
         is_asset = self.stUIInst.isAsset_checkBox.isChecked()
-        for t_node in _listSoftModTweaks(is_asset):
-            model.appendRow(QtGui.QStandardItem(t_node.name()))
-        self.setSourceModel(model)
-
+        if is_asset != self.__isAsset:
+            self.__model.clear()
+            self.__isAsset = is_asset
+        names = _listSoftModTweakNames(is_asset)
+
+        connections = _getTweakConnections(names)
+
+        # removes the deleted tweaks and updates the changed connections
+        listed = set()
+        for row in reversed(range(self.__model.rowCount())):
+            item = self.__model.item(row)
+            t_name = item.text()
+            if t_name not in connections:
+                self.__model.removeRow(row)
+                continue
+            listed.add(t_name)
+            if item.data(CONNECTIONS_ROLE) != connections[t_name]:
+                item.setData(connections[t_name], CONNECTIONS_ROLE)
+
+        # adds the new tweaks
+        newNames = [n for n in names if n not in listed]
+        for t_name in newNames:
+            item = QtGui.QStandardItem(t_name)
+            item.setData(connections[t_name], CONNECTIONS_ROLE)
+            self.__model.appendRow(item)
+
+    # update the cached controls and affected objects of the listed tweaks
+    def _refreshListConnections(self, softMods):
+        softMods = [str(sm) for sm in softMods]
+        connections = _getTweakConnections(softMods)
+        for row in range(self.__model.rowCount()):
+            item = self.__model.item(row)
+            if item.text() in connections:
+                item.setData(connections[item.text()], CONNECTIONS_ROLE)
+
+    # get the selected tweak names. No PyNode is created, the existence of
+    # the tweaks is checked with a single ls
     def _getSelectedListIndexes(self):
-        softMods = []
-        for x in self.stUIInst.softTweak_listView.selectedIndexes():
-            try:
-                softMods.append(pm.PyNode(x.data()))
-
-            except pm.MayaNodeError:
-                pm.displayWarning("{}  can't be find.".format(x.data()))
+        softMods = [x.data() for x in
+                    self.stUIInst.softTweak_listView.selectedIndexes()]
+        existing = set(cmds.ls(softMods) or [])
+        for sm in softMods:
+            if sm not in existing:
+                pm.displayWarning("{}  can't be find.".format(sm))
                 return False
         return softMods
 
+    # get the cached controls or affected objects of the selected tweaks
+    def _getSelectedConnections(self, key):
+        objs = []
+        for x in self.stUIInst.softTweak_listView.selectedIndexes():
+            value = (x.data(CONNECTIONS_ROLE) or {}).get(key)
+            if isinstance(value, list):
+                objs.extend(value)
+            elif value:
+                objs.append(value)
+        return cmds.ls(objs) or []
+
+    # replace the selection with a single select call
+    @staticmethod
+    def _selectObjects(objs):
+        if objs:
+            cmds.select(objs, replace=True)
+        else:
+            cmds.select(clear=True)
+
     ###########################
     # create connections SIGNALS
     ###########################
@@ -616,6 +1945,13 @@ class softTweakManager(MayaQWidgetDockableMixin, QtWidgets.QDialog):
             self.exportSelection)
         self.stUIInst.exportAll_action.triggered.connect(self.exportAll)
         self.stUIInst.import_action.triggered.connect(self.importConfiguration)
+        self.consolidate_action.triggered.connect(self.consolidate)
+        self.unconsolidate_action.triggered.connect(self.unconsolidate)
+        self.benchmark_action.triggered.connect(self.benchmark)
+        self.bake_action.triggered.connect(self.bake)
+        self.unbake_action.triggered.connect(self.unbake)
+        self.preview_action.toggled.connect(self.previewFalloff)
+        self.performance_menu.aboutToShow.connect(self._syncPreviewAction)
 
         # Misc
         self.stUIInst.name_lineEdit.textChanged.connect(
@@ -656,7 +1992,7 @@ class softTweakManager(MayaQWidgetDockableMixin, QtWidgets.QDialog):
 
     def exportAll(self):
         is_asset = self.stUIInst.isAsset_checkBox.isChecked()
-        softMods = _listSoftModTweaks(is_asset)
+        softMods = _listSoftModTweakNames(is_asset)
         exportConfiguration(softMods)
 
     # import configuration
@@ -666,14 +2002,55 @@ class softTweakManager(MayaQWidgetDockableMixin, QtWidgets.QDialog):
         # refresh UI list
         self.refreshList()
 
+    # PERFORMANCE MENU COMMANDS
+    def consolidate(self):
+        consolidateSoftTweaks()
+
+    def unconsolidate(self):
+        unconsolidateSoftTweaks()
+
+    def benchmark(self):
+        oSel = cmds.ls(selection=True)
+        if not oSel:
+            pm.displayWarning("Please select the mesh to benchmark.")
+            return
+        benchmarkSoftTweakStack(oSel[0])
+
+    def bake(self):
+        bakeSoftTweaks()
+
+    def unbake(self):
+        unbakeSoftTweaks()
+
+    # uncheck the preview action when the previews were stopped by a scene
+    # save or change
+    def _syncPreviewAction(self):
+        if not _FALLOFF_PREVIEWS:
+            self.preview_action.setChecked(False)
+
+    def previewFalloff(self, checked):
+        if checked:
+            softMods = self._getSelectedListIndexes()
+            if not softMods:
+                pm.displayWarning("Please select the tweaks to preview.")
+                self.preview_action.setChecked(False)
+                return
+            previewSoftTweakFalloff(softMods)
+        else:
+            stopFalloffPreview()
+
     # UI BUTTONS
-    # refresh the softTweakers list
+    # refresh the softTweakers list and the restricted tweaks area
     def refreshList(self):
+        refreshRestrictedMembership()
         self._refreshList()
 
     def _addRemoveObj(self, add=True):
         softMods = self._getSelectedListIndexes()
-        _addRemoveSoftMode(softMods, pm.selected(), add)
+        if not softMods:
+            return
+        _addRemoveSoftMode(softMods, cmds.ls(selection=True), add)
+        self._refreshListConnections(softMods)
 
     def addObj(self):
         self._addRemoveObj()
@@ -713,7 +2090,8 @@ class softTweakManager(MayaQWidgetDockableMixin, QtWidgets.QDialog):
 
     def autoTweak(self):
         is_asset, nameExt, size = self._getIsAssetNameExtSize()
-        createAutoSoftTweak(size, nameExt, is_asset)
+        createAutoSoftTweak(size, nameExt, is_asset,
+                            self.restrict_checkBox.isChecked())
         self._refreshList()
 
     def newTweak(self):
@@ -752,7 +2130,8 @@ class softTweakManager(MayaQWidgetDockableMixin, QtWidgets.QDialog):
                         grp=grp,
                         size=size,
                         nameExt=nameExt,
-                        is_asset=is_asset)
+                        is_asset=is_asset,
+                        restrict=self.restrict_checkBox.isChecked())
         self._refreshList()
         pm.select(oSel, r=True)
 
@@ -768,25 +2147,19 @@ class softTweakManager(MayaQWidgetDockableMixin, QtWidgets.QDialog):
                                   dismissString='Cancel')
         if option == "Delete":
             softMods = self._getSelectedListIndexes()
-            objs = _getPluggetObj(softMods, "ctlRoot")
-            pm.delete(softMods)
-            pm.delete(objs)
+            if softMods:
+                objs = self._getSelectedConnections("ctlRoot")
+                cmds.delete(softMods + objs)
             self._refreshList()
 
     def selectectAffected(self):
-        softMods = self._getSelectedListIndexes()
-        aObj = _getAffectedObjects(softMods)
-        pm.select(aObj, r=True)
+        self._selectObjects(self._getSelectedConnections("affected"))
 
     def selectBaseCtl(self):
-        softMods = self._getSelectedListIndexes()
-        objs = _getPluggetObj(softMods, "ctlBase")
-        pm.select(objs, r=True)
+        self._selectObjects(self._getSelectedConnections("ctlBase"))
 
     def selectCtl(self):
-        softMods = self._getSelectedListIndexes()
-        objs = _getPluggetObj(softMods, "ctlTweak")
-        pm.select(objs, r=True)
+        self._selectObjects(self._getSelectedConnections("ctlTweak"))
 
 
 def openSoftTweakManager(*args):